@@ -1,7 +1,16 @@
+from .cache import MemoryCache, RedisCache, ResponseCache
 from .client import Musixmatch
 from .exceptions import MXMException
+from .ratelimit import RateLimiter, RetryBudget
+from .singleflight import SingleFlight
 
 __all__ = [
+    "MemoryCache",
     "Musixmatch",
     "MXMException",
+    "RateLimiter",
+    "RedisCache",
+    "ResponseCache",
+    "RetryBudget",
+    "SingleFlight",
 ]
@@ -0,0 +1,141 @@
+"""Entity-level response cache for the Musixmatch API."""
+
+import asyncio
+import json
+import logging
+import math
+import time
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+from Asyncmxm.exceptions import MXMException
+
+# Seconds each endpoint's answers stay fresh. Endpoints not listed aren't cached.
+DEFAULT_TTLS = {
+    "album.get": 24 * 3600,
+    "album.tracks.get": 6 * 3600,
+    "track.get": 3600,
+    "matcher.track.get": 3600,
+    "crowd.track.history.get": 300,
+}
+
+# "Not found" answers are cached briefly: the track may be imported any minute.
+NEGATIVE_TTL = 60
+
+
+class MemoryCache:
+    """In-process LRU backend with per-entry expiry."""
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+
+    async def get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires <= time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    async def set(self, key, value, ttl):
+        self._data[key] = (value, time.monotonic() + ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    async def delete(self, key):
+        self._data.pop(key, None)
+
+
+class RedisCache:
+    """Redis backend, shared by every worker. Takes a (sync) redis client."""
+
+    def __init__(self, client, prefix="mxm:api:"):
+        self.client = client
+        self.prefix = prefix
+
+    async def get(self, key):
+        value = await asyncio.to_thread(self.client.get, self.prefix + key)
+        return value.decode() if value is not None else None
+
+    async def set(self, key, value, ttl):
+        await asyncio.to_thread(
+            self.client.set, self.prefix + key, value, ex=max(1, math.ceil(ttl))
+        )
+
+    async def delete(self, key):
+        await asyncio.to_thread(self.client.delete, self.prefix + key)
+
+
+class ResponseCache:
+    """
+    Cache parsed API answers by endpoint and normalized params.
+
+    ``usertoken`` is never part of the key, so answers are shared across API
+    keys. Values are stored as JSON, so every hit hands out a fresh copy.
+
+    :param backend: A MemoryCache, RedisCache or anything with async
+        ``get(key)``, ``set(key, value, ttl)`` and ``delete(key)`` on strings.
+    :param ttls: Seconds to keep each endpoint's answers (default DEFAULT_TTLS).
+    :param negative_ttl: Seconds to remember a 404 answer.
+    """
+
+    def __init__(self, backend, ttls=None, negative_ttl=NEGATIVE_TTL):
+        self.backend = backend
+        self.ttls = DEFAULT_TTLS if ttls is None else ttls
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+
+    def cacheable(self, api_method):
+        return self.ttls.get(api_method, 0) > 0
+
+    @staticmethod
+    def key(api_method, params):
+        items = sorted(
+            (k, str(v)) for k, v in params.items() if k != "usertoken" and v is not None
+        )
+        return f"{api_method}?{urlencode(items)}"
+
+    async def get(self, api_method, params):
+        """
+        Return the cached answer, or None on a miss.
+
+        :raises MXMException: When a 404 answer is cached.
+        """
+        try:
+            raw = await self.backend.get(self.key(api_method, params))
+        except Exception as e:
+            logging.warning(f"MXM cache read failed: {e}")
+            raw = None
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        entry = json.loads(raw)
+        if "error" in entry:
+            raise MXMException(entry["error"], entry.get("hint"))
+        return entry["response"]
+
+    async def _store(self, api_method, params, entry, ttl):
+        try:
+            await self.backend.set(self.key(api_method, params), json.dumps(entry), ttl)
+        except Exception as e:
+            logging.warning(f"MXM cache write failed: {e}")
+
+    async def set(self, api_method, params, response):
+        await self._store(
+            api_method, params, {"response": response}, self.ttls[api_method]
+        )
+
+    async def set_not_found(self, api_method, params, hint=None):
+        await self._store(
+            api_method, params, {"error": 404, "hint": hint}, self.negative_ttl
+        )
+
+    async def delete(self, api_method, params):
+        await self.backend.delete(self.key(api_method, params))
@@ -1,5 +1,4 @@
-""" A simple Async Python library for the Musixmatch Web API """
-
+"""A simple Async Python library for the Musixmatch Web API"""
 
 import asyncio
 import json
@@ -7,6 +6,8 @@ import json
 import aiohttp
 
 from Asyncmxm.exceptions import MXMException
+from Asyncmxm.ratelimit import backoff, default_retry_budget, retry_after
+from Asyncmxm.singleflight import default_group
 
 
 class Musixmatch:
@@ -23,14 +24,34 @@ class Musixmatch:
         retries=max_retries,
         requests_timeout=5,
         backoff_factor=0.3,
+        singleflight=default_group,
+        rate_limiter=None,
+        retry_budget=default_retry_budget,
+        key_pool=None,
+        cache=None,
+        refresh_cache=False,
     ):
         """
         Create a Musixmatch Client.
         :param api_key: The API key, Get one at https://developer.musixmatch.com/signup
-        :param requests_session: A Requests session object or a truthy value to create one.
+        :param requests_session: An aiohttp session, or a callable returning one
+            (e.g. a shared connection pool) that is looked up on every call.
         :param retries: Total number of retries to allow
         :param requests_timeout: Stop waiting for a response after a given number of seconds
-        :param backoff: Factor to apply between attempts after the second try
+        :param backoff: Base delay of the jittered exponential backoff between attempts
+        :param singleflight: A SingleFlight group that coalesces concurrent identical
+            GET calls (shared process-wide by default), or None to disable
+        :param rate_limiter: A RateLimiter pacing requests per API key; throttled
+            calls wait for their turn. Retry-After answers pause the key.
+        :param retry_budget: A RetryBudget shared across requests that caps retries
+            to a fraction of traffic, or None for no cap
+        :param key_pool: Pick the key per request from a pool instead of API_key.
+            The pool provides ``acquire()``, ``release(key)`` and
+            ``report(key, status_code, retry_after=None, in_body=False)``, the
+            latter returning True when the key left rotation so the call fails
+            over to another key. ``in_body`` marks codes from the body's header.
+        :param cache: A ResponseCache for GET answers, shared across keys
+        :param refresh_cache: Skip cache reads but still store fresh answers
         """
 
         self._url = "https://apic-appmobile.musixmatch.com/ws/1.1/"
@@ -39,9 +60,19 @@ class Musixmatch:
         self.backoff_factor = backoff_factor
         self.retries = retries
         self.limit = limit
-
+        self._singleflight = singleflight
+        self._rate_limiter = rate_limiter
+        self._retry_budget = retry_budget
+        self._key_pool = key_pool
+        self._cache = cache
+        self._refresh_cache = refresh_cache
+
+        self._session_provider = None
         if isinstance(requests_session, aiohttp.ClientSession):
             self._session = requests_session
+        elif callable(requests_session):
+            self._session = None
+            self._session_provider = requests_session
         else:
             self._build_session()
 
@@ -51,6 +82,12 @@ class Musixmatch:
             connector=connector, loop=asyncio.get_event_loop()
         )
 
+    @property
+    def session(self):
+        if self._session_provider is not None:
+            return self._session_provider()
+        return self._session
+
     '''
     async def __aexit__(self, exc_type, exc_value, exc_tb):
         """Make sure the connection gets closed"""
@@ -58,14 +95,45 @@ class Musixmatch:
     '''
 
     async def _api_call(self, method, api_method, params=None):
-        url = self._url + api_method
-        if params:
-            params["usertoken"] = self._key
-        else:
-            params = {"usertoken": self._key}
-
+        params = dict(params) if params else {}
         params["app_id"] = "mac-ios-v2.0"
 
+        if method.lower() != "get":
+            return await self._request(method, api_method, params)
+
+        cache = self._cache
+        if cache is not None and not cache.cacheable(api_method):
+            cache = None
+        if cache is not None and not self._refresh_cache:
+            cached = await cache.get(api_method, params)
+            if cached is not None:
+                return cached
+
+        async def fetch():
+            try:
+                res = await self._request(method, api_method, params)
+            except MXMException as e:
+                if cache is not None and e.status_code == 404:
+                    await cache.set_not_found(api_method, params, e.message)
+                raise
+            if cache is not None:
+                await cache.set(api_method, params, res)
+            return res
+
+        if self._singleflight is None:
+            return await fetch()
+
+        # usertoken is only added per attempt, so callers on different keys
+        # share the answer
+        flight_key = (
+            api_method,
+            tuple(sorted((k, str(v)) for k, v in params.items())),
+        )
+        return await self._singleflight.do(flight_key, fetch)
+
+    async def _request(self, method, api_method, params):
+        url = self._url + api_method
+
         headers = {
             "Host": "apic-appmobile.musixmatch.com",
             "Accept": "application/json",
@@ -75,30 +143,71 @@ class Musixmatch:
             "Connection": "keep-alive",
         }
 
-        retries = 0
-
-        while retries < self.max_retries:
+        attempt = 0
+        failovers = 0
+        while True:
+            pool = self._key_pool
+            key = self._key if pool is None else pool.acquire()
+            if self._rate_limiter is not None:
+                await self._rate_limiter.acquire(key)
+            if self._retry_budget is not None:
+                self._retry_budget.record_request()
+
+            delay = None
+            # Whether an MXMException carries Musixmatch's own status_code
+            in_body = False
             try:
-                # print(params)
-                async with self._session.request(
-                    method=method, url=str(url), params=params, headers=headers
+                async with self.session.request(
+                    method=method,
+                    url=str(url),
+                    params={**params, "usertoken": key},
+                    headers=headers,
+                    timeout=aiohttp.ClientTimeout(total=self.requests_timeout),
                 ) as response:
-                    response.raise_for_status()
-                    res = await response.text()
-                    print(res)
-                    res = json.loads(res)
-                    status_code = res["message"]["header"]["status_code"]
-                    if status_code == 200:
-                        return res
+                    if response.status in self.default_retry_codes:
+                        delay = retry_after(response.headers)
+                        if pool is not None:
+                            pool.report(key, response.status, delay)
+                        if delay is not None and self._rate_limiter is not None:
+                            # Hold back every caller on this key, not just us
+                            self._rate_limiter.pause(key, delay)
+                    elif 400 <= response.status < 500:
+                        # Another attempt would be just as wrong
+                        raise MXMException(response.status, None)
                     else:
-                        retries = self.max_retries
+                        response.raise_for_status()
+                        res = json.loads(await response.text())
+                        status_code = res["message"]["header"]["status_code"]
+                        if status_code == 200:
+                            return res
                         hint = res["message"]["header"].get("hint") or None
+                        in_body = True
                         raise MXMException(status_code, hint)
-            except (aiohttp.ClientError, asyncio.TimeoutError):
-                retries += 1
-                await asyncio.sleep(self.backoff_factor * retries)
+            except MXMException as e:
+                # Out of quota: fail over to another key of the pool
+                if (
+                    pool is None
+                    or not pool.report(key, e.status_code, in_body=in_body)
+                    or failovers >= len(pool) - 1
+                ):
+                    raise
+                failovers += 1
                 continue
-        raise Exception("API request failed after retries")
+            except (TimeoutError, aiohttp.ClientError):
+                pass
+            finally:
+                if pool is not None:
+                    pool.release(key)
+
+            attempt += 1
+            if attempt >= self.retries or (
+                self._retry_budget is not None and not self._retry_budget.can_retry()
+            ):
+                raise Exception("API request failed after retries")
+            if delay is None:
+                await asyncio.sleep(backoff(attempt, self.backoff_factor))
+            elif self._rate_limiter is None:
+                await asyncio.sleep(delay)
 
     async def track_get(
         self,
@@ -0,0 +1,125 @@
+"""Client-side rate limiting and retry pacing for the Musixmatch API."""
+
+import asyncio
+import random
+import time
+from email.utils import parsedate_to_datetime
+
+
+class TokenBucket:
+    """
+    A token bucket that hands out reservations instead of rejections.
+
+    Every call to ``reserve`` takes a token, letting the balance go negative,
+    and returns how long the caller has to wait for its token. Callers are
+    served in the order they reserved, so throttled calls queue up.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def reserve(self):
+        self._refill()
+        self._tokens -= 1
+        return 0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def pause(self, seconds):
+        """Hold back every new reservation for at least ``seconds``."""
+        self._refill()
+        self._tokens = min(self._tokens, 0) - seconds * self.rate
+
+
+class RateLimiter:
+    """
+    Per API key request budget.
+
+    :param rate: Requests per second allowed for each key.
+    :param burst: Requests that may go out at once after an idle period.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(1, int(rate))
+        self._buckets = {}
+
+    def _bucket(self, key):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+        return bucket
+
+    async def acquire(self, key):
+        """Wait for this key's turn to send a request."""
+        delay = self._bucket(key).reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+    def pause(self, key, seconds):
+        """Stop sending with ``key`` for ``seconds`` (e.g. after a Retry-After)."""
+        self._bucket(key).pause(seconds)
+
+
+class RetryBudget:
+    """
+    Cap retries to a fraction of recent traffic.
+
+    Every request deposits ``ratio`` tokens and every retry withdraws one, so
+    during an upstream brownout retries stop instead of multiplying the load.
+    ``min_per_second`` keeps a trickle of retries available when idle.
+    """
+
+    def __init__(self, ratio=0.2, min_per_second=1.0, max_tokens=10):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._updated = time.monotonic()
+
+    def _deposit(self, amount):
+        self._tokens = min(self.max_tokens, self._tokens + amount)
+
+    def record_request(self):
+        self._deposit(self.ratio)
+
+    def can_retry(self):
+        now = time.monotonic()
+        self._deposit((now - self._updated) * self.min_per_second)
+        self._updated = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+
+def backoff(attempt, base=0.3, cap=10.0):
+    """Exponential backoff with full jitter for the given retry attempt."""
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+def retry_after(headers):
+    """Seconds requested by a ``Retry-After`` header, or None."""
+    value = headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+# Shared by every client in the process so one request can't spend it alone.
+default_retry_budget = RetryBudget()
@@ -0,0 +1,73 @@
+"""Coalesce concurrent identical API calls into a single upstream request."""
+
+import asyncio
+import copy
+
+
+class _Call:
+    __slots__ = ("future", "waiters")
+
+    def __init__(self, future):
+        self.future = future
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Run at most one call per key at a time.
+
+    Callers that arrive while a call for the same key is in flight wait for
+    it and receive a deep copy of its result (or its exception), so they can
+    mutate the response freely. ``saved`` counts the upstream calls avoided.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.saved = 0
+
+    async def do(self, key, fn):
+        """
+        Return ``await fn()``, sharing the result with concurrent callers of ``key``.
+
+        :param key: A hashable identifying the call.
+        :param fn: A coroutine function taking no arguments.
+        """
+        # Futures are bound to their loop, so calls never coalesce across loops.
+        call_key = (asyncio.get_running_loop(), key)
+
+        while (call := self._calls.get(call_key)) is not None:
+            call.waiters += 1
+            self.saved += 1
+            try:
+                result = await asyncio.shield(call.future)
+            except asyncio.CancelledError:
+                if call.future.cancelled() and not asyncio.current_task().cancelling():
+                    # The leader was cancelled, not us: try to lead instead.
+                    self.saved -= 1
+                    continue
+                raise
+            return copy.deepcopy(result)
+
+        call = _Call(asyncio.get_running_loop().create_future())
+        self._calls[call_key] = call
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            call.future.cancel()
+            raise
+        except BaseException as e:
+            call.future.set_exception(e)
+            if not call.waiters:
+                # Mark as retrieved so asyncio doesn't log it.
+                call.future.exception()
+            raise
+        else:
+            call.future.set_result(result)
+            # Keep the shared copy pristine if anyone else is reading it.
+            return copy.deepcopy(result) if call.waiters else result
+        finally:
+            self._calls.pop(call_key, None)
+
+
+# Shared by every client in the process so concurrent requests coalesce.
+default_group = SingleFlight()
@@ -1,23 +1,25 @@
 import asyncio
 import base64
 import datetime
+import functools
 import hashlib
 import hmac
 import json
 import os
 import re
 import time
-from urllib.parse import unquote
+import weakref
+from contextlib import aclosing
+from urllib.parse import unquote, urlencode
 
 from dotenv import load_dotenv
 from markupsafe import escape as html_escape
 
 load_dotenv()
 
-import aiohttp
-from asgiref.wsgi import WsgiToAsgi
 from flask import (
     Flask,
+    Response,
     make_response,
     redirect,
     render_template,
@@ -25,13 +27,22 @@ from flask import (
     send_from_directory,
     url_for,
 )
+from flask.globals import request_ctx
 from flask_babel import Babel
 from flask_babel import gettext as _
 from flask_caching import Cache
 
-from apple import AppleMusic
+import http_pool
+from apple import AppleMusic, parse_pool
+from asgi import FlaskASGI
+from idgraph import id_graph
+from import_watcher import import_watcher
+from keypool import key_provider
+from links import canonical_key, canonical_link, is_short_link
 from mxm import MXM
-from spotify import Spotify
+from notes import localize
+from spotify import AsyncSpotify
+from spotify_credentials import credential_rotation
 
 secret_key_value = os.environ.get("secret_key")
 
@@ -201,12 +212,23 @@ def get_locale():
     return request.accept_languages.best_match(SUPPORTED_LANGUAGES)
 
 
+# Query arguments holding a link, cached under its canonical key. Views
+# read them through canonical_link, so every variant gets the same answer.
+LINK_ARGS = ("link", "link2")
+
+
 def make_cache_key():
     """Custom cache key that includes the current locale and request path."""
-    return f"{request.full_path}:{get_locale()}"
+    args = [
+        (name, canonical_key(value) or value if name in LINK_ARGS else value)
+        for name, value in request.args.items(multi=True)
+    ]
+    return f"{request.path}?{urlencode(args)}:{get_locale()}"
 
 
 babel = Babel(app, locale_selector=get_locale)
+# Cached results hold note codes; they're translated for the reader's locale
+app.add_template_filter(localize, "localize")
 
 
 @app.context_processor
@@ -214,7 +236,7 @@ def inject_get_locale():
     return dict(get_locale=get_locale, using_redis=app.config.get("USING_REDIS"))
 
 
-sp = Spotify()
+sp = AsyncSpotify(graph=id_graph)
 apple_music = AppleMusic()
 
 
@@ -226,6 +248,171 @@ def set_language(language=None):
     return response
 
 
+async def resolve_import(sp_track):
+    """The track's link once Musixmatch has imported it, else None."""
+    with app.app_context():
+        # Pooled keys only, the user who asked may be long gone
+        link = (await MXM(refresh=True).Tracks_Data([sp_track]))[0]
+    return None if isinstance(link, str) else link
+
+
+# Seconds search results are cached
+SEARCH_CACHE_TIMEOUT = 3600
+# One lock per cached result being patched, dropped once nobody holds it
+_patch_locks = weakref.WeakValueDictionary()
+
+
+def _remaining_timeout(cached):
+    """Seconds left before the cached results expire, or None if unknown."""
+    try:
+        stored = datetime.datetime.fromisoformat(cached["timestamp"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    age = (datetime.datetime.now() - stored).total_seconds()
+    return SEARCH_CACHE_TIMEOUT - age
+
+
+async def update_cached_link(cache_key, index, link):
+    # Patches of one album land close together; without the lock the last
+    # read-modify-write would drop the others.
+    lock = _patch_locks.get(cache_key)
+    if lock is None:
+        lock = _patch_locks[cache_key] = asyncio.Lock()
+    async with lock:
+        with app.app_context():
+            cached = await asyncio.to_thread(cache.get, cache_key)
+            if not (
+                isinstance(cached, dict)
+                and isinstance(cached.get("data"), list)
+                and index < len(cached["data"])
+            ):
+                return
+            # Keep the entry's original expiry
+            timeout = _remaining_timeout(cached)
+            if timeout is not None and timeout < 1:
+                return
+            cached["data"][index] = link
+            await asyncio.to_thread(
+                cache.set,
+                cache_key,
+                cached,
+                timeout=SEARCH_CACHE_TIMEOUT if timeout is None else int(timeout),
+            )
+
+
+def watch_imports(mxm, cache_key, sp_data):
+    """Keep polling the tracks that weren't imported yet and patch the cache."""
+    for i in mxm.not_imported:
+        isrc = sp_data[i].get("isrc")
+        if isrc:
+            import_watcher.watch(
+                isrc,
+                cache_key,
+                i,
+                functools.partial(resolve_import, sp_data[i]),
+                update_cached_link,
+            )
+
+
+async def search_cache_key(link):
+    """
+    The search results' cache key, shared by every link to the same entity.
+
+    Results are stored without translated text (see ``notes``), so one entry
+    serves every locale.
+
+    Short links are followed first (the answer is kept in the ID graph, so
+    the lookup itself doesn't follow them again).
+    """
+    if is_short_link(link):
+        try:
+            link = await sp.resolve_short_link(link)
+        except Exception as e:
+            app.logger.warning(f"Could not resolve {link}: {e}")
+    return f"search_data:{canonical_key(link) or link}"
+
+
+def can_stream(platform, link):
+    """Whether the track cards can be pushed to the page as they resolve."""
+    return (
+        app.config["STREAM_RESULTS"]
+        # Only the native ASGI server can send async bodies
+        and request.environ.get("flask_asgi.async_body", False)
+        and request.args.get("stream") != "0"
+        and platform in ("spotify", "apple")
+    )
+
+
+def link_platform(link):
+    """The platform a searched link (or ISRC) is looked up on."""
+    if "music.apple.com" in link:
+        return "apple"
+    if "musixmatch.com" in link:
+        return "mxm"
+    return "spotify"
+
+
+def source_error(platform, link):
+    """Why the tracks behind ``link`` can't be looked up, or None."""
+    if platform == "spotify" and len(link) < 12:
+        return _("Wrong Spotify Link Or Wrong ISRC")
+    return None
+
+
+def cached_search(cache_key, refresh):
+    """
+    ``(results, timestamp)`` cached for a search, or None on a miss.
+
+    Results still waiting on an import are patched as soon as it lands, so
+    they're served even when refreshing: fetching again would only spend
+    quota.
+    """
+    if refresh and not import_watcher.watching(cache_key):
+        return None
+    cached_data = cache.get(cache_key)
+    if not cached_data:
+        return None
+    if not (isinstance(cached_data, dict) and "data" in cached_data):
+        return cached_data, None
+    cached_timestamp = cached_data.get("timestamp")
+    # Parse timestamp if it's a string
+    if isinstance(cached_timestamp, str):
+        try:
+            cached_timestamp = datetime.datetime.fromisoformat(cached_timestamp)
+        except ValueError:
+            pass
+    return cached_data["data"], cached_timestamp
+
+
+async def load_source(platform, link):
+    """
+    Fetch the tracks behind a Spotify/Apple link or an ISRC.
+
+    :return: ``(sp_data, None)``, or ``(None, error)`` with a list of messages.
+    """
+    if platform == "apple":
+        tracks_data = await apple_music.fetch_apple_music_data(link)
+        if (
+            isinstance(tracks_data, list)
+            and tracks_data
+            and isinstance(tracks_data[0], str)
+        ):
+            return None, tracks_data
+        return tracks_data, None
+
+    sp_data = (
+        await sp.get_isrc(link) if len(link) > 12 else [{"isrc": link, "image": None}]
+    )
+    # Handle string error from get_isrc
+    if isinstance(sp_data, str):
+        return None, [sp_data]
+    return sp_data, None
+
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
 @app.route("/", methods=["GET"])
 async def index():
     if request.cookies.get("api_key"):
@@ -250,7 +437,7 @@ async def index():
         )
         return resp
 
-    link = request.args.get("link")
+    link = canonical_link(request.args.get("link"))
     refresh = request.args.get("refresh")
     key = None
     token = request.cookies.get("api_token")
@@ -260,118 +447,80 @@ async def index():
             if payload:
                 key = payload.get("mxm-key")
 
-        platform = "spotify"
-        if "music.apple.com" in link:
-            platform = "apple"
-        elif "musixmatch.com" in link:
-            platform = "mxm"
+        platform = link_platform(link)
 
         # Manual Cache Check
-        cache_key = f"search_data:{link}:{get_locale()}"
-        cached_data = None
-        if not refresh:
-            cached_data = cache.get(cache_key)
+        cache_key = await search_cache_key(link)
+        cached = cached_search(cache_key, refresh)
 
         mxmLinks = None
         is_cached = False
         cached_timestamp = None
 
-        if cached_data:
-            if isinstance(cached_data, dict) and "data" in cached_data:
-                mxmLinks = cached_data["data"]
-                cached_timestamp = cached_data.get("timestamp")
-                # Parse timestamp if it's a string
-                if isinstance(cached_timestamp, str):
-                    try:
-                        cached_timestamp = datetime.datetime.fromisoformat(
-                            cached_timestamp
-                        )
-                    except ValueError:
-                        pass
-            else:
-                mxmLinks = cached_data
+        if cached:
+            mxmLinks, cached_timestamp = cached
             is_cached = True
             print(f"CACHE HIT: {cache_key}")
 
         else:
             print(f"CACHE MISS: {cache_key}")
-            async with aiohttp.ClientSession() as session:
-                try:
-                    mxm = MXM(key, session=session)
+            try:
+                mxm = MXM(key, refresh=bool(refresh))
+
+                if platform == "mxm":
+                    mxmLinks = await mxm.album_sp_id(link)
 
-                    if platform == "apple":
-                        tracks_data = await asyncio.to_thread(
-                            apple_music.get_apple_music_data, link
+                else:
+                    error = source_error(platform, link)
+                    if error:
+                        return render_template(
+                            "index.html", tracks_data=[error], platform=platform
+                        )
+                    elif platform == "spotify" and re.search(r"artist/(\w+)", link):
+                        artist_albums = await sp.artist_albums(link)
+                        return render_template(
+                            "index.html", artist=artist_albums, platform=platform
+                        )
+                    elif can_stream(platform, link):
+                        # Send the page now, the cards follow over /stream
+                        return render_template(
+                            "index.html",
+                            platform=platform,
+                            stream_url=url_for("stream", link=link, refresh=refresh),
                         )
-                        if (
-                            isinstance(tracks_data, list)
-                            and tracks_data
-                            and isinstance(tracks_data[0], str)
-                        ):
-                            return render_template(
-                                "index.html", tracks_data=tracks_data, platform=platform
-                            )
-                        mxmLinks = await mxm.Tracks_Data(tracks_data)
-
-                    elif platform == "mxm":
-                        mxmLinks = await mxm.album_sp_id(link)
 
-                    else:
-                        if len(link) < 12:
-                            return render_template(
-                                "index.html",
-                                tracks_data=[_("Wrong Spotify Link Or Wrong ISRC")],
-                                platform=platform,
-                            )
-                        elif re.search(r"artist/(\w+)", link):
-                            artist_albums = await asyncio.to_thread(
-                                sp.artist_albums, link, []
-                            )
-                            return render_template(
-                                "index.html", artist=artist_albums, platform=platform
-                            )
-                        else:
-                            sp_data = (
-                                await asyncio.to_thread(sp.get_isrc, link)
-                                if len(link) > 12
-                                else [{"isrc": link, "image": None}]
-                            )
-
-                        # Handle string error from get_isrc
-                        if isinstance(sp_data, str):
-                            return render_template(
-                                "index.html",
-                                tracks_data=[sp_data],
-                                platform=platform,
-                            )
-
-                        mxmLinks = await mxm.Tracks_Data(sp_data)
-
-                    # Cache the result if valid
-                    if platform == "mxm":
-                        if isinstance(mxmLinks, dict) and not mxmLinks.get("error"):
-                            cache_value = {
-                                "data": mxmLinks,
-                                "timestamp": datetime.datetime.now().isoformat(),
-                            }
-                            cache.set(cache_key, cache_value, timeout=3600)
-                    else:
-                        if isinstance(mxmLinks, list):
-                            cache_value = {
-                                "data": mxmLinks,
-                                "timestamp": datetime.datetime.now().isoformat(),
-                            }
-                            cache.set(cache_key, cache_value, timeout=3600)
+                    sp_data, error = await load_source(platform, link)
+                    if error:
+                        return render_template(
+                            "index.html", tracks_data=error, platform=platform
+                        )
 
-                except Exception as e:
-                    app.logger.exception(e)
-                    return render_template(
-                        "index.html",
-                        tracks_data=[
-                            _("An unexpected error occurred, please try again")
-                        ],
-                        platform=platform,
-                    )
+                    mxmLinks = await mxm.Tracks_Data(sp_data)
+
+                # Cache the result if valid
+                if platform == "mxm":
+                    if isinstance(mxmLinks, dict) and not mxmLinks.get("error"):
+                        cache_value = {
+                            "data": mxmLinks,
+                            "timestamp": datetime.datetime.now().isoformat(),
+                        }
+                        cache.set(cache_key, cache_value, timeout=SEARCH_CACHE_TIMEOUT)
+                else:
+                    if isinstance(mxmLinks, list):
+                        cache_value = {
+                            "data": mxmLinks,
+                            "timestamp": datetime.datetime.now().isoformat(),
+                        }
+                        cache.set(cache_key, cache_value, timeout=SEARCH_CACHE_TIMEOUT)
+                        watch_imports(mxm, cache_key, sp_data)
+
+            except Exception as e:
+                app.logger.exception(e)
+                return render_template(
+                    "index.html",
+                    tracks_data=[_("An unexpected error occurred, please try again")],
+                    platform=platform,
+                )
 
         if platform == "mxm":
             if mxmLinks and isinstance(mxmLinks, dict):
@@ -418,11 +567,97 @@ async def index():
     return render_template("index.html")
 
 
+@app.route("/stream", methods=["GET"])
+async def stream():
+    """Server-Sent Events: each track card as soon as its links are resolved."""
+    link = canonical_link(request.args.get("link"))
+    if not link:
+        return "", 400
+    platform = link_platform(link)
+    # Musixmatch and artist pages aren't track lists; the full page renders them
+    if platform == "mxm" or (platform == "spotify" and re.search(r"artist/\w+", link)):
+        return "", 400
+    refresh = request.args.get("refresh")
+    key = None
+    token = request.cookies.get("api_token")
+    if token:
+        payload = verify_token(token)
+        if payload:
+            key = payload.get("mxm-key")
+    error = source_error(platform, link)
+    cached = cache_key = None
+    if not error:
+        cache_key = await search_cache_key(link)
+        cached = await asyncio.to_thread(cached_search, cache_key, refresh)
+    # Cards are rendered after the view returns, under a copy of its context
+    ctx = request_ctx.copy()
+
+    def cards(tracks, **context):
+        yield sse("start", {"total": len(tracks)})
+        for i, track in enumerate(tracks):
+            yield sse("track", {"index": i, "html": render_card(track, **context)})
+
+    async def events():
+        with ctx:
+            try:
+                if error:
+                    for event in cards([error]):
+                        yield event
+                elif cached and isinstance(cached[0], list):
+                    links, cached_timestamp = cached
+                    for event in cards(
+                        links, is_cached=True, cached_timestamp=cached_timestamp
+                    ):
+                        yield event
+                else:
+                    sp_data, failure = await load_source(platform, link)
+                    if failure:
+                        for event in cards(failure[:1]):
+                            yield event
+                    else:
+                        yield sse("start", {"total": len(sp_data)})
+                        mxm = MXM(key, refresh=bool(refresh))
+                        links = [None] * len(sp_data)
+                        async with aclosing(mxm.iter_tracks_data(sp_data)) as results:
+                            async for i, track in results:
+                                links[i] = track
+                                html = render_card(track)
+                                yield sse("track", {"index": i, "html": html})
+
+                        cache_value = {
+                            "data": links,
+                            "timestamp": datetime.datetime.now().isoformat(),
+                        }
+                        await asyncio.to_thread(
+                            cache.set,
+                            cache_key,
+                            cache_value,
+                            timeout=SEARCH_CACHE_TIMEOUT,
+                        )
+                        watch_imports(mxm, cache_key, sp_data)
+            except Exception as e:
+                app.logger.exception(e)
+                message = _("An unexpected error occurred, please try again")
+                yield sse("failed", {"html": render_card(message)})
+            yield sse("done", {})
+
+    return Response(
+        events(),
+        mimetype="text/event-stream",
+        # Keep proxies from buffering the events
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def render_card(track, **context):
+    return render_template("layout/track_card.html", track=track, **context)
+
+
 @app.route("/split", methods=["GET"])
 @cache.cached(timeout=3600, key_prefix=make_cache_key)
 async def split():
-    link = request.args.get("link")
-    link2 = request.args.get("link2")
+    link = canonical_link(request.args.get("link"))
+    link2 = canonical_link(request.args.get("link2"))
     key = None
     if link and link2:
         token = request.cookies.get("api_token")
@@ -431,83 +666,81 @@ async def split():
             if payload:
                 key = payload.get("mxm-key")
 
-        async with aiohttp.ClientSession() as session:
-            mxm = MXM(key, session=session)
-            match = re.search(r"open.spotify.com", link) and re.search(r"track", link)
-            match = (
-                match
-                and re.search(r"open.spotify.com", link2)
-                and re.search(r"track", link2)
+        mxm = MXM(key)
+        match = re.search(r"open.spotify.com", link) and re.search(r"track", link)
+        match = (
+            match
+            and re.search(r"open.spotify.com", link2)
+            and re.search(r"track", link2)
+        )
+        if match:
+            sp_data1, sp_data2 = await asyncio.gather(
+                sp.get_isrc(link), sp.get_isrc(link2)
             )
-            if match:
-                sp_data1 = await asyncio.to_thread(sp.get_isrc, link)
-                sp_data2 = await asyncio.to_thread(sp.get_isrc, link2)
-                track1 = await mxm.Tracks_Data(sp_data1, True)
-                track1 = track1[0]
-                if isinstance(track1, str):
-                    return render_template("split.html", error="track1: " + track1)
-                track2 = await mxm.Tracks_Data(sp_data2, True)
-                track2 = track2[0]
-                if isinstance(track2, str):
-                    return render_template("split.html", error="track2: " + track2)
-
-                track1["track"] = sp_data1[0]["track"]
-                track2["track"] = sp_data2[0]["track"]
-                try:
-                    if (
-                        track1["isrc"] != track2["isrc"]
-                        and track1["commontrack_id"] == track2["commontrack_id"]
-                    ):
-                        # Escape user-controlled values to prevent XSS
-                        safe_link = html_escape(link)
-                        safe_link2 = html_escape(link2)
-                        safe_track1_url = html_escape(track1["track_share_url"])
-                        safe_track1_name = html_escape(track1["track"]["name"])
-                        safe_track1_isrc = html_escape(track1["isrc"])
-                        safe_track2_name = html_escape(track2["track"]["name"])
-                        safe_track2_isrc = html_escape(track2["isrc"])
-                        message = f"""{_("Can be split")}</br>
-                            {_("You can copy and paste this:")}</br>
-                            <div id="copy-target" class="copy-target">
-                            :mxm: <a href="{safe_track1_url}" target="_blank">MXM Page</a> </br>
-                            :spotify: <a href="{safe_link}" target="_blank">{safe_track1_name}</a>,
-                            :isrc: {safe_track1_isrc} </br>
-                            :spotify: <a href="{safe_link2}" target="_blank">{safe_track2_name}</a>,
-                            :isrc: {safe_track2_isrc}
-                            </div>
-                            <br>
-                            <button onclick="copyToClipboard()" class="btn-copy">{_("Copy Template")}</button>
-                            <script>
-                            function copyToClipboard() {{
-                                const range = document.createRange();
-                                range.selectNode(document.getElementById("copy-target"));
-                                window.getSelection().removeAllRanges();
-                                window.getSelection().addRange(range);
-                                document.execCommand("copy");
-                                window.getSelection().removeAllRanges();
-                                alert({json.dumps(_('Copied to clipboard!'))});
-                            }}
-                            </script>
-                            """
-                    elif (
-                        track1["isrc"] == track2["isrc"]
-                        and track1["commontrack_id"] == track2["commontrack_id"]
-                    ):
-                        message = _("Can not be splitted as they have the Same ISRC")
-                    else:
-                        message = _("They have different Pages")
-                except:
-                    return render_template(
-                        "split.html", error=_("Something went wrong")
-                    )
+            track1 = await mxm.Tracks_Data(sp_data1, True)
+            track1 = track1[0]
+            if isinstance(track1, str):
+                return render_template("split.html", error="track1: " + track1)
+            track2 = await mxm.Tracks_Data(sp_data2, True)
+            track2 = track2[0]
+            if isinstance(track2, str):
+                return render_template("split.html", error="track2: " + track2)
+
+            track1["track"] = sp_data1[0]["track"]
+            track2["track"] = sp_data2[0]["track"]
+            try:
+                if (
+                    track1["isrc"] != track2["isrc"]
+                    and track1["commontrack_id"] == track2["commontrack_id"]
+                ):
+                    # Escape user-controlled values to prevent XSS
+                    safe_link = html_escape(link)
+                    safe_link2 = html_escape(link2)
+                    safe_track1_url = html_escape(track1["track_share_url"])
+                    safe_track1_name = html_escape(track1["track"]["name"])
+                    safe_track1_isrc = html_escape(track1["isrc"])
+                    safe_track2_name = html_escape(track2["track"]["name"])
+                    safe_track2_isrc = html_escape(track2["isrc"])
+                    message = f"""{_("Can be split")}</br>
+                        {_("You can copy and paste this:")}</br>
+                        <div id="copy-target" class="copy-target">
+                        :mxm: <a href="{safe_track1_url}" target="_blank">MXM Page</a> </br>
+                        :spotify: <a href="{safe_link}" target="_blank">{safe_track1_name}</a>,
+                        :isrc: {safe_track1_isrc} </br>
+                        :spotify: <a href="{safe_link2}" target="_blank">{safe_track2_name}</a>,
+                        :isrc: {safe_track2_isrc}
+                        </div>
+                        <br>
+                        <button onclick="copyToClipboard()" class="btn-copy">{_("Copy Template")}</button>
+                        <script>
+                        function copyToClipboard() {{
+                            const range = document.createRange();
+                            range.selectNode(document.getElementById("copy-target"));
+                            window.getSelection().removeAllRanges();
+                            window.getSelection().addRange(range);
+                            document.execCommand("copy");
+                            window.getSelection().removeAllRanges();
+                            alert({json.dumps(_("Copied to clipboard!"))});
+                        }}
+                        </script>
+                        """
+                elif (
+                    track1["isrc"] == track2["isrc"]
+                    and track1["commontrack_id"] == track2["commontrack_id"]
+                ):
+                    message = _("Can not be splitted as they have the Same ISRC")
+                else:
+                    message = _("They have different Pages")
+            except:
+                return render_template("split.html", error=_("Something went wrong"))
 
-                return render_template(
-                    "split.html",
-                    split_result={"track1": track1, "track2": track2},
-                    message=message,
-                )
-            else:
-                return render_template("split.html", error=_("Wrong Spotify Link"))
+            return render_template(
+                "split.html",
+                split_result={"track1": track1, "track2": track2},
+                message=message,
+            )
+        else:
+            return render_template("split.html", error=_("Wrong Spotify Link"))
 
     else:
         return render_template("split.html")
@@ -515,18 +748,20 @@ async def split():
 
 @app.route("/spotify", methods=["GET"])
 @cache.cached(timeout=3600, key_prefix=make_cache_key)
-def isrc():
-    link = request.args.get("link")
+async def isrc():
+    link = canonical_link(request.args.get("link"))
     if link:
         match = re.search(r"open.spotify.com", link) and re.search(r"track|album", link)
         if match:
-            return render_template("isrc.html", tracks_data=sp.get_isrc(link))
+            return render_template("isrc.html", tracks_data=await sp.get_isrc(link))
 
         else:
             # the link is an isrc code
             if len(link) == 12:
                 # search by isrc
-                return render_template("isrc.html", tracks_data=sp.search_by_isrc(link))
+                return render_template(
+                    "isrc.html", tracks_data=await sp.search_by_isrc(link)
+                )
             return render_template("isrc.html", tracks_data=[_("Wrong Spotify Link")])
     else:
         return render_template("isrc.html")
@@ -560,13 +795,12 @@ async def setAPI():
 
     if key:
         # check the key
-        async with aiohttp.ClientSession() as session:
-            mxm = MXM(key, session=session)
-            sp_data = [{"isrc": "DGA072332812", "image": None}]
+        mxm = MXM(key)
+        sp_data = [{"isrc": "DGA072332812", "image": None}]
 
-            # Call the Tracks_Data method with the appropriate parameters
-            mxmLinks = await mxm.Tracks_Data(sp_data)
-            # print(mxmLinks)
+        # Call the Tracks_Data method with the appropriate parameters
+        mxmLinks = await mxm.Tracks_Data(sp_data)
+        # print(mxmLinks)
 
         if isinstance(mxmLinks[0], str):
             return render_template("api.html", error=_("Please Enter A Valid Key"))
@@ -623,9 +857,8 @@ async def abstrack() -> str:
         if not re.match("^[0-9]+$", id):
             return render_template("abstrack.html", error=_("Invalid input!"))
 
-        async with aiohttp.ClientSession() as session:
-            mxm = MXM(key, session=session)
-            track, album = await mxm.abstrack(id)
+        mxm = MXM(key)
+        track, album = await mxm.abstrack(id)
 
         return render_template(
             "abstrack.html", track=track, album=album, error=track.get("error")
@@ -654,14 +887,13 @@ async def history():
             match = re.search(r"lyrics/([^?]+/[^?]+)", unquote(track_id))
             if match:
                 try:
-                    async with aiohttp.ClientSession() as session:
-                        mxm = MXM(key, session=session)
-                        track = await mxm.musixmatch.track_get(
-                            commontrack_vanity_id=match.group(1)
-                        )
-                        commontrack_id = str(
-                            track["message"]["body"]["track"]["commontrack_id"]
-                        )
+                    mxm = MXM(key)
+                    track = await mxm.musixmatch.track_get(
+                        commontrack_vanity_id=match.group(1)
+                    )
+                    commontrack_id = str(
+                        track["message"]["body"]["track"]["commontrack_id"]
+                    )
                 except Exception as e:
                     return render_template(
                         "history.html",
@@ -679,9 +911,8 @@ async def history():
         else:
             return render_template("history.html", error=_("Invalid input!"))
 
-        async with aiohttp.ClientSession() as session:
-            mxm = MXM(key, session=session)
-            history_data = await mxm.track_history(commontrack_id)
+        mxm = MXM(key)
+        history_data = await mxm.track_history(commontrack_id)
 
         if isinstance(history_data, dict) and history_data.get("error"):
             return render_template("history.html", error=history_data["error"])
@@ -724,9 +955,8 @@ async def api_history(commontrack_id):
         if payload:
             key = payload.get("mxm-key")
 
-    async with aiohttp.ClientSession() as session:
-        mxm = MXM(key, session=session)
-        history_data = await mxm.track_history(commontrack_id)
+    mxm = MXM(key)
+    history_data = await mxm.track_history(commontrack_id)
 
     if isinstance(history_data, dict) and history_data.get("error"):
         return {"error": history_data["error"]}, 400
@@ -819,7 +1049,17 @@ def sitemap():
     return response
 
 
-asgi_app = WsgiToAsgi(app)
+# Push track cards over /stream instead of waiting for the whole album
+app.config["STREAM_RESULTS"] = os.environ.get("STREAM_RESULTS", "1") == "1"
+
+# ASGI_MODE=wsgi falls back to the asgiref WSGI bridge
+asgi_app = FlaskASGI(
+    app,
+    on_startup=[http_pool.warm_up, key_provider.start, credential_rotation.start],
+    on_shutdown=[import_watcher.close, http_pool.close]
+    + ([parse_pool.close] if parse_pool is not None else []),
+    bridge=os.environ.get("ASGI_MODE", "native") == "wsgi",
+)
 if __name__ == "__main__":
     import asyncio
 
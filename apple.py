@@ -1,181 +1,378 @@
+import asyncio
+import html
 import json
+import os
 import re
-from urllib.parse import urlparse
+from urllib.parse import parse_qsl, urlencode, urlparse
 
-import requests
+import aiohttp
 from bs4 import BeautifulSoup
 
+import http_pool
+from Asyncmxm.cache import MemoryCache
+from Asyncmxm.singleflight import SingleFlight
+from concurrency import ProcessOffload
+from links import APPLE_PATH
+
+MUSIC_TYPES = ["MusicRecording", "MusicAlbum", "MusicPlaylist", "MusicComposition"]
+
+# Page parts we read, found without building a DOM of the whole page
+_LD_JSON = re.compile(
+    r"<script\b[^>]*?\btype\s*=\s*[\"']?application/ld\+json[\"']?[^>]*>(.*?)</script\s*>",
+    re.IGNORECASE | re.DOTALL,
+)
+_META = re.compile(r"<meta\b[^>]*>", re.IGNORECASE)
+_ATTR = re.compile(r"""([\w:-]+)\s*=\s*(?:"([^"]*)"|'([^']*)')""")
+_OG_PROPERTIES = ("og:title", "og:image")
+
+# Apple puts the JSON-LD and og: tags in the head, ahead of the large
+# serialized page data, so the rest of the page is usually never read.
+_HEAD_END = b"</head>"
+CHUNK_SIZE = 64 * 1024
+# Pages are read to the end only when the head lacks the data; cap that.
+MAX_PAGE_BYTES = 8 * 1024 * 1024
+FETCH_TIMEOUT = aiohttp.ClientTimeout(total=10, connect=3, sock_read=5)
+
+# Seconds the music data of a fetched page is reused
+PAGE_TTL = float(os.environ.get("APPLE_PAGE_TTL", 3600))
+PAGE_CACHE_SIZE = int(os.environ.get("APPLE_PAGE_CACHE_SIZE", 512))
+
+# Pages at least this large (big playlists) are parsed in worker processes
+# when APPLE_PARSE_PROCESSES is set.
+PARSE_PROCESSES = int(os.environ.get("APPLE_PARSE_PROCESSES", 0))
+PARSE_PROCESS_MIN_BYTES = int(os.environ.get("APPLE_PARSE_PROCESS_MIN_KB", 256)) * 1024
+PARSE_QUEUE = int(os.environ.get("APPLE_PARSE_QUEUE", 0)) or None
+
+
+def scan_page(page):
+    """
+    The JSON-LD scripts and og: tags of a page, found with regular expressions.
+
+    :return: ``(scripts, og)``, the JSON-LD texts and a property -> content dict.
+    """
+    scripts = _LD_JSON.findall(page)
+    og = {}
+    for tag in _META.findall(page):
+        if "og:" not in tag:
+            continue
+        attrs = {
+            name.lower(): html.unescape(double or single)
+            for name, double, single in _ATTR.findall(tag)
+        }
+        prop = attrs.get("property")
+        if prop in _OG_PROPERTIES and prop not in og and "content" in attrs:
+            og[prop] = attrs["content"]
+    return scripts, og
+
+
+def soup_page(page):
+    """``scan_page`` through a full BeautifulSoup parse, for unusual markup."""
+    soup = BeautifulSoup(page, "html.parser")
+    scripts = [
+        script.get_text() or script.string or ""
+        for script in soup.find_all("script", type="application/ld+json")
+    ]
+    og = {}
+    for prop in _OG_PROPERTIES:
+        tag = soup.find("meta", attrs={"property": prop})
+        if tag and tag.get("content") is not None:
+            og[prop] = tag["content"]
+    return scripts, og
+
+
+def _music_item(scripts):
+    """The first music entity of the JSON-LD scripts, or None."""
+    data = None
+    for script in scripts:
+        try:
+            loaded_data = json.loads(script)
+            # Check if it contains music data
+            if isinstance(loaded_data, dict) and "@graph" in loaded_data:
+                # Browse the graph
+                for item in loaded_data["@graph"]:
+                    if item.get("@type") in MUSIC_TYPES:
+                        data = item
+                        break
+            elif (
+                isinstance(loaded_data, dict)
+                and loaded_data.get("@type") in MUSIC_TYPES
+            ):
+                data = loaded_data
+                break
+            elif isinstance(loaded_data, list):
+                for item in loaded_data:
+                    if item.get("@type") in MUSIC_TYPES:
+                        data = item
+                        break
+            if data:
+                break
+        except:
+            continue
+    return data
+
+
+def page_key(link):
+    """
+    ``(kind, storefront, id, language)`` of the page an Apple Music link loads.
+
+    Song links into an album (``?i=``) load the album's page, so they share
+    its key. None for links of another shape.
+    """
+    parsed = urlparse(link)
+    match = APPLE_PATH.match(parsed.path)
+    if not match:
+        return None
+    language = dict(parse_qsl(parsed.query)).get("l", "")
+    return match["kind"], match["cc"] or "", match["id"], language
+
+
+def _page_url(link):
+    """The link without ``?i=``, i.e. the page it loads."""
+    parsed = urlparse(link)
+    query = [(k, v) for k, v in parse_qsl(parsed.query) if k != "i"]
+    return parsed._replace(query=urlencode(query), fragment="").geturl()
+
+
+def _soup_data(page):
+    scripts, og = soup_page(page)
+    return _music_item(scripts), og
+
+
+def page_data(page):
+    """
+    ``(data, og)`` of a page: the music entity (or None) and its og: tags.
+
+    The JSON-LD and og: tags are found with ``scan_page``; only when it
+    finds no music data is the page parsed again with BeautifulSoup.
+    """
+    scripts, og = scan_page(page)
+    data = _music_item(scripts)
+    if data is None:
+        # Markup the scanner doesn't know, or really no JSON-LD
+        return _soup_data(page)
+    return data, og
+
+
+# A music entity declared in a JSON-LD script
+_MUSIC_LD = re.compile(
+    rb"application/ld\+json.*?\"@type\"\s*:\s*\"Music", re.IGNORECASE | re.DOTALL
+)
+
+
+async def _read_page(response):
+    """
+    Read a page up to its head if the music data is declared there, else whole.
+
+    :return: ``(page, size)``, the decoded page and the bytes read.
+    """
+    body = bytearray()
+    head_seen = False
+    charset = response.charset or "utf-8"
+    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+        start = max(0, len(body) - len(_HEAD_END))
+        body.extend(chunk)
+        if not head_seen and _HEAD_END in bytes(body[start:]).lower():
+            head_seen = True
+            if _MUSIC_LD.search(body):
+                break
+        if len(body) > MAX_PAGE_BYTES:
+            break
+    return body.decode(charset, errors="replace"), len(body)
+
+
+# Shared by every AppleMusic instance in the process
+parse_pool = ProcessOffload(PARSE_PROCESSES, PARSE_QUEUE) if PARSE_PROCESSES else None
+
 
 class AppleMusic:
-    def __init__(self):
-        self.session = requests.Session()
+    def __init__(self, pages=None, page_ttl=PAGE_TTL, parse_pool=parse_pool):
+        """
+        :param pages: Cache of the music data per page (``page_key``), a
+            MemoryCache by default.
+        :param page_ttl: Seconds a page's music data is reused.
+        :param parse_pool: ProcessOffload parsing pages of at least
+            PARSE_PROCESS_MIN_BYTES, or None to parse every page in process.
+        """
+        self.parse_pool = parse_pool
+        self.pages = pages if pages is not None else MemoryCache(PAGE_CACHE_SIZE)
+        self.page_ttl = page_ttl
+        self._flights = SingleFlight()
         self.headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
             "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
             "Accept-Language": "en-US,en;q=0.5",
         }
 
-    def get_apple_music_data(self, link):
+    @staticmethod
+    def _invalid_link(link):
+        parsed_url = urlparse(link)
+        if parsed_url.scheme not in ["http", "https"]:
+            return "Error: Invalid URL scheme"
+
+        if not parsed_url.hostname or not (
+            parsed_url.hostname == "music.apple.com"
+            or parsed_url.hostname.endswith(".music.apple.com")
+        ):
+            return "Error: Invalid hostname"
+        return None
+
+    async def fetch_apple_music_data(self, link, session=None):
+        """
+        Tracks of an Apple Music link, or a one-item list with an error.
+
+        The page is streamed through the pooled aiohttp session and reading
+        stops at ``</head>`` once the music data has been declared. That data is
+        cached per ``page_key``, so every ``?i=`` song link into an album is
+        answered from the album's first fetch.
+        """
         try:
-            parsed_url = urlparse(link)
-            if parsed_url.scheme not in ["http", "https"]:
-                return ["Error: Invalid URL scheme"]
+            error = self._invalid_link(link)
+            if error:
+                return [error]
 
-            if not parsed_url.hostname or not (
-                parsed_url.hostname == "music.apple.com"
-                or parsed_url.hostname.endswith(".music.apple.com")
-            ):
-                return ["Error: Invalid hostname"]
+            session = session or http_pool.get_session()
+            key = page_key(link)
+            if key is None:
+                found = await self._load_page(link, session)
+            else:
+                found = await self.pages.get(key)
+                if found is None:
+                    found = await self._flights.do(
+                        key, lambda: self._load_cached(key, link, session)
+                    )
+            if isinstance(found, list):
+                return found
+            return self._results_or_error(*found, link)
+
+        except Exception as e:
+            print(f"Error parsing Apple Music: {e}")
+            return [f"Error: {str(e)}"]
+
+    async def _load_cached(self, key, link, session):
+        found = await self._load_page(_page_url(link), session)
+        if not isinstance(found, list):
+            await self.pages.set(key, found, self.page_ttl)
+        return found
 
-            response = self.session.get(link, headers=self.headers, timeout=10)
-            if response.status_code != 200:
+    async def _load_page(self, url, session):
+        """``(data, og)`` of the page at ``url``, or an error list."""
+        async with session.get(
+            url, headers=self.headers, timeout=FETCH_TIMEOUT
+        ) as response:
+            if response.status != 200:
                 return [
-                    f"Error: Could not fetch Apple Music page. Status code: {response.status_code}"
+                    f"Error: Could not fetch Apple Music page. Status code: {response.status}"
                 ]
+            page, size = await _read_page(response)
+        return await self._parse(page, size)
 
-            soup = BeautifulSoup(response.text, "html.parser")
-
-            # Try to find JSON-LD
-            scripts = soup.find_all("script", type="application/ld+json")
-            data = None
-
-            for script in scripts:
-                try:
-                    loaded_data = json.loads(script.get_text() or script.string or "")
-                    # Check if it contains music data
-                    if isinstance(loaded_data, dict) and "@graph" in loaded_data:
-                        # Browse the graph
-                        for item in loaded_data["@graph"]:
-                            if item.get("@type") in [
-                                "MusicRecording",
-                                "MusicAlbum",
-                                "MusicPlaylist",
-                                "MusicComposition",
-                            ]:
-                                data = item
-                                break
-                    elif isinstance(loaded_data, dict) and loaded_data.get("@type") in [
-                        "MusicRecording",
-                        "MusicAlbum",
-                        "MusicPlaylist",
-                        "MusicComposition",
-                    ]:
-                        data = loaded_data
-                        break
-                    elif isinstance(loaded_data, list):
-                        for item in loaded_data:
-                            if item.get("@type") in [
-                                "MusicRecording",
-                                "MusicAlbum",
-                                "MusicPlaylist",
-                                "MusicComposition",
-                            ]:
-                                data = item
-                                break
-                    if data:
-                        break
-                except:
-                    continue
+    async def _parse(self, page, size):
+        if self.parse_pool is not None and size >= PARSE_PROCESS_MIN_BYTES:
+            # Big playlists: parse outside this process's GIL
+            return await self.parse_pool.run(page_data, page)
+        # Even the scan loads JSON-LD that can run to megabytes: keep it off
+        # the loop
+        return await asyncio.to_thread(page_data, page)
 
-            results = []
+    def _results_or_error(self, data, og, link):
+        results = self._page_results(data, og, link)
+        return (
+            results if results else ["Error: No track data found on Apple Music page."]
+        )
 
-            if data:
-                print(f"DEBUG: Found data type: {data.get('@type')}")  # Debug print
-
-                # Handle MusicComposition: the actual MusicRecording is nested in 'audio' field
-                if data.get("@type") == "MusicComposition":
-                    audio_data = data.get("audio")
-                    if (
-                        audio_data
-                        and isinstance(audio_data, dict)
-                        and audio_data.get("@type") == "MusicRecording"
-                    ):
-                        # Use the nested MusicRecording data
-                        data = audio_data
-                        print("DEBUG: Extracted MusicRecording from MusicComposition")
-
-                if data.get("@type") == "MusicRecording":
-                    results.append(self._parse_track(data))
-                elif data.get("@type") in ["MusicAlbum", "MusicPlaylist"]:
-                    # Try to find image in album data first
-                    album_image = data.get("image")
-
-                    # If it's an album, check if the link is for a specific song (song ID in URL)
-                    # Apple Music links: .../album/album-name/id?i=song-id
-                    match_song_id = re.search(r"\?i=(\d+)", link)
-                    target_song_id = match_song_id.group(1) if match_song_id else None
-
-                    tracks = data.get("tracks", [])
-                    if not tracks and "track" in data:
-                        tracks = data["track"]
-
-                    if isinstance(tracks, list):
-                        found_target = False
-                        for t in tracks:
-                            # If we are looking for a specific song
-                            # Note: JSON-LD might not expose the 'i' param ID directly in a simple way matchable to URL
-                            # But usually the URL in 'url' field matches the song link
-
-                            is_target = False
-                            if target_song_id:
-                                if t.get("url") and target_song_id in t.get("url"):
-                                    is_target = True
-                            else:
-                                is_target = True  # Get all if no song ID specified? Or maybe limit?
-
-                            if is_target:
-                                # Pass album image as fallback if track doesn't have one
-                                results.append(
-                                    self._parse_track(
-                                        t, album_data=data, album_image=album_image
-                                    )
+    def _page_results(self, data, og, link):
+        results = []
+
+        if data:
+            print(f"DEBUG: Found data type: {data.get('@type')}")  # Debug print
+
+            # Handle MusicComposition: the actual MusicRecording is nested in 'audio' field
+            if data.get("@type") == "MusicComposition":
+                audio_data = data.get("audio")
+                if (
+                    audio_data
+                    and isinstance(audio_data, dict)
+                    and audio_data.get("@type") == "MusicRecording"
+                ):
+                    # Use the nested MusicRecording data
+                    data = audio_data
+                    print("DEBUG: Extracted MusicRecording from MusicComposition")
+
+            if data.get("@type") == "MusicRecording":
+                results.append(self._parse_track(data))
+            elif data.get("@type") in ["MusicAlbum", "MusicPlaylist"]:
+                # Try to find image in album data first
+                album_image = data.get("image")
+
+                # If it's an album, check if the link is for a specific song (song ID in URL)
+                # Apple Music links: .../album/album-name/id?i=song-id
+                match_song_id = re.search(r"\?i=(\d+)", link)
+                target_song_id = match_song_id.group(1) if match_song_id else None
+
+                tracks = data.get("tracks", [])
+                if not tracks and "track" in data:
+                    tracks = data["track"]
+
+                if isinstance(tracks, list):
+                    found_target = False
+                    for t in tracks:
+                        # If we are looking for a specific song
+                        # Note: JSON-LD might not expose the 'i' param ID directly in a simple way matchable to URL
+                        # But usually the URL in 'url' field matches the song link
+
+                        is_target = False
+                        if target_song_id:
+                            if t.get("url") and target_song_id in t.get("url"):
+                                is_target = True
+                        else:
+                            # Get all if no song ID specified? Or maybe limit?
+                            is_target = True
+
+                        if is_target:
+                            # Pass album image as fallback if track doesn't have one
+                            results.append(
+                                self._parse_track(
+                                    t, album_data=data, album_image=album_image
                                 )
-                                found_target = True
-
-                        if target_song_id and not found_target:
-                            # Maybe the JSON-LD structure is different or doesn't have the ID in URL
-                            pass
-
-            if not results:
-                # Fallback: OpenGraph
-                og_title = soup.find("meta", attrs={"property": "og:title"})
-                og_image = soup.find("meta", attrs={"property": "og:image"})
-
-                if og_title:
-                    content = og_title["content"]
-                    # Format usually "Song Name by Artist" or "Album by Artist"
-                    if " by " in content:
-                        parts = content.split(" by ")
-                        name = parts[0]
-                        artist = parts[1]
-                    else:
-                        name = content
-                        artist = "Unknown"
-
-                    results.append(
-                        {
-                            "isrc": None,  # Cannot get ISRC reliably from OG
-                            "image": og_image["content"] if og_image else None,
-                            "track": {
-                                "name": name,
-                                "album": {
-                                    "name": name
-                                },  # Guessing album name is same as title if not found
-                                "artists": [{"name": artist}],
-                                "id": None,
-                            },
-                        }
-                    )
+                            )
+                            found_target = True
 
-            return (
-                results
-                if results
-                else ["Error: No track data found on Apple Music page."]
-            )
+                    if target_song_id and not found_target:
+                        # Maybe the JSON-LD structure is different or doesn't have the ID in URL
+                        pass
 
-        except Exception as e:
-            print(f"Error parsing Apple Music: {e}")
-            return [f"Error: {str(e)}"]
+        if not results:
+            # Fallback: OpenGraph
+            og_title = og.get("og:title")
+            og_image = og.get("og:image")
+
+            if og_title:
+                content = og_title
+                # Format usually "Song Name by Artist" or "Album by Artist"
+                if " by " in content:
+                    parts = content.split(" by ")
+                    name = parts[0]
+                    artist = parts[1]
+                else:
+                    name = content
+                    artist = "Unknown"
+
+                results.append(
+                    {
+                        "isrc": None,  # Cannot get ISRC reliably from OG
+                        "image": og_image,
+                        "track": {
+                            "name": name,
+                            "album": {
+                                "name": name
+                            },  # Guessing album name is same as title if not found
+                            "artists": [{"name": artist}],
+                            "id": None,
+                        },
+                    }
+                )
+
+        return results
 
     def _parse_track(self, track_data, album_data=None, album_image=None):
         isrc = track_data.get("isrc")
@@ -0,0 +1,283 @@
+"""Native ASGI adapter that serves the Flask app on one long-lived event loop."""
+
+import asyncio
+import inspect
+import logging
+import sys
+from io import BytesIO
+
+from asgiref.wsgi import WsgiToAsgi
+from flask import Flask, request_started
+from flask.globals import request_ctx
+
+
+class FlaskASGI:
+    """
+    Serve a Flask app over ASGI without the WSGI bridge.
+
+    ``async def`` views are awaited directly on the server loop, so sessions,
+    locks and background tasks created by one request can be reused by the
+    next. Sync views run on a worker thread, and any coroutine they start via
+    ``ensure_sync`` (e.g. views wrapped by ``cache.cached``) is scheduled back
+    onto the same loop instead of a throwaway one.
+
+    :param app: The Flask application.
+    :param on_startup: Coroutine functions awaited at lifespan startup.
+    :param on_shutdown: Coroutine functions awaited at lifespan shutdown.
+    :param bridge: Serve HTTP through ``asgiref.wsgi.WsgiToAsgi`` instead.
+    """
+
+    def __init__(self, app: Flask, on_startup=(), on_shutdown=(), bridge=False):
+        self.app = app
+        self.on_startup = list(on_startup)
+        self.on_shutdown = list(on_shutdown)
+        self.loop = None
+        self._bridge = WsgiToAsgi(app) if bridge else None
+        self._flask_async_to_sync = app.async_to_sync
+        if not bridge:
+            app.async_to_sync = self._async_to_sync
+
+    async def __call__(self, scope, receive, send):
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] != "http":
+            raise ValueError(f"Unsupported ASGI scope type: {scope['type']}")
+        elif self._bridge is not None:
+            await self._bridge(scope, receive, send)
+        else:
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    for hook in self.on_startup:
+                        await hook()
+                except Exception as e:
+                    logging.exception("ASGI startup failed")
+                    await send({"type": "lifespan.startup.failed", "message": str(e)})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                for hook in self.on_shutdown:
+                    try:
+                        await hook()
+                    except Exception:
+                        logging.exception("ASGI shutdown hook failed")
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def _async_to_sync(self, func):
+        """Run coroutines started from worker threads on the serving loop."""
+        loop = self.loop
+
+        def wrapper(*args, **kwargs):
+            try:
+                on_loop = asyncio.get_running_loop() is loop
+            except RuntimeError:
+                on_loop = False
+            if loop is None or not loop.is_running() or on_loop:
+                return self._flask_async_to_sync(func)(*args, **kwargs)
+            # The handle copies this thread's context, so the request context
+            # pushed for the worker is visible to the coroutine.
+            return asyncio.run_coroutine_threadsafe(
+                func(*args, **kwargs), loop
+            ).result()
+
+        return wrapper
+
+    async def _http(self, scope, receive, send):
+        body = BytesIO()
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body.write(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        body.seek(0)
+
+        environ = build_environ(scope, body)
+        handler = await _until_disconnect(self._dispatch(environ), receive)
+        if handler is None:
+            logging.info(f"Client disconnected, cancelled {scope['path']}")
+            return
+        response = handler.result()
+
+        if hasattr(response.response, "__aiter__"):
+            # Async bodies (e.g. Server-Sent Events) are produced on the loop
+            # and stop as soon as the client goes away.
+            headers = response.get_wsgi_headers(environ)
+            await send(_response_start(response.status, headers.to_wsgi_list()))
+            pump = await _until_disconnect(
+                _send_async_body(response.response, send), receive
+            )
+            if pump is not None:
+                pump.result()
+                await send({"type": "http.response.body", "body": b""})
+            return
+
+        app_iter, status, headers = response.get_wsgi_response(environ)
+        await send(_response_start(status, headers))
+        try:
+            if isinstance(app_iter, list | tuple):
+                for chunk in app_iter:
+                    await send(
+                        {"type": "http.response.body", "body": chunk, "more_body": True}
+                    )
+            else:
+                # Streamed responses may block between chunks.
+                iterator = iter(app_iter)
+                done = object()
+                while (
+                    chunk := await asyncio.to_thread(next, iterator, done)
+                ) is not done:
+                    await send(
+                        {"type": "http.response.body", "body": chunk, "more_body": True}
+                    )
+        finally:
+            if hasattr(app_iter, "close"):
+                app_iter.close()
+        await send({"type": "http.response.body", "body": b""})
+
+    async def _dispatch(self, environ):
+        """Async counterpart of ``Flask.wsgi_app`` + ``full_dispatch_request``."""
+        app = self.app
+        ctx = app.request_context(environ)
+        error = None
+        try:
+            try:
+                ctx.push()
+                app._got_first_request = True
+                try:
+                    request_started.send(app, _async_wrapper=app.ensure_sync)
+                    rv = app.preprocess_request()
+                    if rv is None:
+                        rv = await self._dispatch_request()
+                except Exception as e:
+                    rv = app.handle_user_exception(e)
+                return app.finalize_request(rv)
+            except Exception as e:
+                error = e
+                return app.handle_exception(e)
+            except BaseException:
+                error = sys.exc_info()[1]
+                raise
+        finally:
+            if error is not None and app.should_ignore_error(error):
+                error = None
+            ctx.pop(error)
+
+    async def _dispatch_request(self):
+        app = self.app
+        req = request_ctx.request
+        if req.routing_exception is not None:
+            app.raise_routing_exception(req)
+        rule = req.url_rule
+        if (
+            getattr(rule, "provide_automatic_options", False)
+            and req.method == "OPTIONS"
+        ):
+            return app.make_default_options_response()
+
+        view = app.view_functions[rule.endpoint]
+        if inspect.iscoroutinefunction(view):
+            return await view(**req.view_args)
+        return await asyncio.to_thread(view, **req.view_args)
+
+
+async def _wait_for_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def _until_disconnect(coro, receive):
+    """Run ``coro`` as a task; cancel it and return None if the client leaves first."""
+    task = asyncio.ensure_future(coro)
+    watcher = asyncio.ensure_future(_wait_for_disconnect(receive))
+    try:
+        await asyncio.wait((task, watcher), return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+    finally:
+        watcher.cancel()
+    if not task.done():
+        # The client went away: stop the upstream work it started.
+        task.cancel()
+        await asyncio.wait((task,))
+        return None
+    return task
+
+
+async def _send_async_body(body, send):
+    try:
+        async for chunk in body:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+    finally:
+        if hasattr(body, "aclose"):
+            await body.aclose()
+
+
+def _response_start(status, headers):
+    return {
+        "type": "http.response.start",
+        "status": int(str(status).split(" ", 1)[0]),
+        "headers": [
+            (name.lower().encode("latin1"), value.encode("latin1"))
+            for name, value in headers
+        ],
+    }
+
+
+def build_environ(scope, body):
+    """Build a WSGI environ from an ASGI HTTP scope."""
+    script_name = scope.get("root_path", "").encode("utf8").decode("latin1")
+    path_info = scope["path"].encode("utf8").decode("latin1")
+    if path_info.startswith(script_name):
+        path_info = path_info[len(script_name) :]
+
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": script_name,
+        "PATH_INFO": path_info,
+        "QUERY_STRING": scope["query_string"].decode("ascii"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope['http_version']}",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+        "asgi.scope": scope,
+        # Lets views know they may return async iterables (see FlaskASGI)
+        "flask_asgi.async_body": True,
+    }
+    if scope.get("client"):
+        environ["REMOTE_ADDR"] = scope["client"][0]
+
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin1")
+        if name == "content-length":
+            key = "CONTENT_LENGTH"
+        elif name == "content-type":
+            key = "CONTENT_TYPE"
+        else:
+            key = f"HTTP_{name.upper().replace('-', '_')}"
+        value = value.decode("latin1")
+        if key in environ:
+            # HTTP/2 clients may split cookies across several headers
+            separator = "; " if key == "HTTP_COOKIE" else ","
+            value = f"{environ[key]}{separator}{value}"
+        environ[key] = value
+    return environ
@@ -0,0 +1,182 @@
+"""Bounded fan-out, micro-batching and process offloading for request work."""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import aclosing
+
+# Upstream calls one request may have in flight at once
+FANOUT_LIMIT = int(os.environ.get("MXM_FANOUT_LIMIT", 8))
+
+
+class FanoutResults(list):
+    """Results in input order; ``failed`` lists the indices whose call raised."""
+
+    def __init__(self, results, failed):
+        super().__init__(results)
+        self.failed = failed
+
+
+async def bounded_as_completed(fn, items, limit=FANOUT_LIMIT, on_error=None):
+    """
+    Await ``fn(item)`` for every item with at most ``limit`` calls in flight.
+
+    Yields ``(index, result, error)`` as each call finishes. A failing call
+    doesn't stop the others: ``error`` is its exception and ``result`` is
+    ``on_error(item, exc)`` (or the exception when no ``on_error`` is given).
+    Closing the generator, or cancelling its consumer, cancels every
+    outstanding call, so iterate it under ``contextlib.aclosing``.
+    """
+    items = list(items)
+    finished = asyncio.Queue()
+    pending = iter(range(len(items)))
+
+    async def worker():
+        for i in pending:
+            try:
+                finished.put_nowait((i, await fn(items[i]), None))
+            except Exception as e:
+                result = e if on_error is None else on_error(items[i], e)
+                finished.put_nowait((i, result, e))
+
+    workers = [
+        asyncio.create_task(worker()) for _ in range(min(max(1, limit), len(items)))
+    ]
+    failed = 0
+    try:
+        for _ in range(len(items)):
+            i, result, error = await finished.get()
+            if error is not None:
+                failed += 1
+            yield i, result, error
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        if failed:
+            logging.warning(
+                f"{getattr(fn, '__name__', fn)}: {failed} of {len(items)} calls failed"
+            )
+
+
+async def bounded_map(fn, items, limit=FANOUT_LIMIT, on_error=None):
+    """
+    Like ``bounded_as_completed``, but wait for every call.
+
+    :return: A FanoutResults in the order of ``items``.
+    """
+    items = list(items)
+    results = [None] * len(items)
+    failed = []
+    async with aclosing(bounded_as_completed(fn, items, limit, on_error)) as calls:
+        async for i, result, error in calls:
+            results[i] = result
+            if error is not None:
+                failed.append(i)
+    return FanoutResults(results, sorted(failed))
+
+
+class MicroBatcher:
+    """
+    Collect single-item lookups from concurrent callers into batch calls.
+
+    The first ``get`` opens a batch that is sent ``window`` seconds later, or
+    as soon as it holds ``max_size`` distinct keys. ``fetch_many(keys)`` must
+    return one result per key, in order. Callers asking for the same key
+    share its result; if the batch call raises, each of them gets the error.
+    A cancelled caller doesn't cancel the batch the others are waiting on.
+    """
+
+    def __init__(self, fetch_many, window=0.005, max_size=50):
+        self.fetch_many = fetch_many
+        self.window = window
+        self.max_size = max_size
+        self.batches = 0
+        # Futures belong to a loop, so every loop collects its own batch
+        self._open = weakref.WeakKeyDictionary()
+        self._tasks = set()
+
+    async def get(self, key):
+        loop = asyncio.get_running_loop()
+        batch = self._open.get(loop)
+        if batch is None:
+            timer = loop.call_later(self.window, self._send, loop)
+            batch = self._open[loop] = ({}, timer)
+        futures = batch[0]
+        future = futures.get(key)
+        if future is None:
+            future = futures[key] = loop.create_future()
+            # Nobody may be left to retrieve a failed batch's error
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+            if len(futures) >= self.max_size:
+                self._send(loop)
+        return await asyncio.shield(future)
+
+    def _send(self, loop):
+        futures, timer = self._open.pop(loop, ({}, None))
+        if timer is not None:
+            timer.cancel()
+        if futures:
+            task = loop.create_task(self._fetch(futures))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _fetch(self, futures):
+        self.batches += 1
+        keys = list(futures)
+        try:
+            # One result per key, in order
+            found = list(zip(keys, await self.fetch_many(keys), strict=True))
+        except Exception as e:
+            for future in futures.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for key, result in found:
+            if not futures[key].done():
+                futures[key].set_result(result)
+
+
+class ProcessOffload:
+    """
+    Run CPU-bound functions in worker processes, off the serving process's GIL.
+
+    At most ``max_pending`` calls are handed to the pool at once; further
+    callers wait their turn, so a burst of large jobs can't build an
+    unbounded backlog. Workers are spawned on first use, not forked from
+    the threaded server. ``fn`` and its arguments must be picklable.
+
+    :param processes: Worker processes.
+    :param max_pending: Calls running or queued in the pool, twice the
+        workers by default.
+    """
+
+    def __init__(self, processes, max_pending=None):
+        self.processes = processes
+        self.max_pending = max_pending or 2 * processes
+        self._executor = None
+        # Semaphores belong to a loop, so every loop gets its own
+        self._slots = weakref.WeakKeyDictionary()
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                self.processes, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    async def run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        slots = self._slots.get(loop)
+        if slots is None:
+            slots = self._slots[loop] = asyncio.Semaphore(self.max_pending)
+        async with slots:
+            return await loop.run_in_executor(self._pool(), fn, *args)
+
+    async def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
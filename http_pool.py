@@ -0,0 +1,66 @@
+"""Process-wide pooled aiohttp sessions shared by every outbound client."""
+
+import asyncio
+import logging
+import os
+import weakref
+
+import aiohttp
+
+POOL_LIMIT = int(os.environ.get("HTTP_POOL_LIMIT", 100))
+POOL_LIMIT_PER_HOST = int(os.environ.get("HTTP_POOL_LIMIT_PER_HOST", 20))
+DNS_CACHE_TTL = int(os.environ.get("HTTP_DNS_CACHE_TTL", 300))
+KEEPALIVE_TIMEOUT = float(os.environ.get("HTTP_KEEPALIVE_TIMEOUT", 60))
+
+# Hosts we talk to on almost every request, connected to ahead of time.
+WARM_UP_URLS = (
+    "https://apic-appmobile.musixmatch.com/",
+    "https://api.spotify.com/",
+)
+
+# aiohttp sessions are bound to the loop they were created in, so the pool
+# keeps one session per running loop.
+_sessions: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aiohttp.ClientSession]" = weakref.WeakKeyDictionary()
+
+
+def _build_session() -> aiohttp.ClientSession:
+    connector = aiohttp.TCPConnector(
+        limit=POOL_LIMIT,
+        limit_per_host=POOL_LIMIT_PER_HOST,
+        ttl_dns_cache=DNS_CACHE_TTL,
+        keepalive_timeout=KEEPALIVE_TIMEOUT,
+    )
+    return aiohttp.ClientSession(connector=connector)
+
+
+def get_session() -> aiohttp.ClientSession:
+    """Return the pooled session of the running loop, creating it on first use."""
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        session = _build_session()
+        _sessions[loop] = session
+    return session
+
+
+async def warm_up(urls=WARM_UP_URLS) -> None:
+    """Resolve DNS and open keep-alive connections to the hosts we use most."""
+    session = get_session()
+
+    async def touch(url):
+        try:
+            async with session.head(
+                url, timeout=aiohttp.ClientTimeout(total=5), allow_redirects=False
+            ):
+                pass
+        except (TimeoutError, aiohttp.ClientError) as e:
+            logging.warning(f"HTTP pool warm up failed for {url}: {e}")
+
+    await asyncio.gather(*(touch(url) for url in urls))
+
+
+async def close() -> None:
+    """Close the pooled session of the running loop."""
+    session = _sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None and not session.closed:
+        await session.close()
@@ -0,0 +1,162 @@
+"""Persistent map of the identifiers lookups have resolved across platforms."""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+# Identifier kinds
+ISRC = "isrc"
+SPOTIFY = "spotify"
+APPLE = "apple"
+COMMONTRACK_ID = "commontrack_id"
+TRACK_ID = "track_id"
+ALBUM_ID = "album_id"
+# spotify.link short link code -> the open.spotify.com URL it redirects to
+SHORT_LINK = "spotify_link"
+URL = "url"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS edges (
+    src_kind TEXT NOT NULL,
+    src_id TEXT NOT NULL,
+    dst_kind TEXT NOT NULL,
+    dst_id TEXT NOT NULL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (src_kind, src_id, dst_kind)
+);
+CREATE TABLE IF NOT EXISTS entities (
+    kind TEXT NOT NULL,
+    id TEXT NOT NULL,
+    data TEXT NOT NULL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (kind, id)
+);
+"""
+
+
+class IdGraph:
+    """
+    SQLite store of resolved identifiers and the payloads they resolved to.
+
+    Edges are directed and record *how* something was resolved: an ISRC
+    looked up on Musixmatch points at the page ``track.get`` returned, while
+    a Spotify ID points at the page the matcher returned. The two can differ
+    (that's how ISRC issues are spotted), so edges are never followed
+    transitively. Entities hold the last payload seen for an ID, e.g. the
+    Musixmatch track for a track_id. Tracks sharing a commontrack_id differ
+    in lyrics, URL and restrictions, so payloads are never keyed by it.
+
+    Storage errors are logged and treated as misses, so a broken database
+    only costs the network calls it was meant to save.
+
+    The methods block on SQLite; async callers run them in a thread.
+
+    :param path: SQLite database file.
+    :param max_age: Seconds an entity is served before it's fetched again.
+    :param track_max_age: Seconds a Musixmatch track is served. Its lyrics
+        status, instrumental flag and restrictions change, so it's short.
+    """
+
+    def __init__(self, path, max_age=86400, track_max_age=600):
+        self.path = path
+        self.max_age = max_age
+        self.track_max_age = track_max_age
+        self._local = threading.local()
+
+    def _db(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.executescript(SCHEMA)
+            self._local.db = db
+        return db
+
+    def link(self, src_kind, src_id, **targets):
+        """Record that ``src_id`` resolved to each of ``targets`` (kind=id)."""
+        if src_id is None:
+            return
+        now = time.time()
+        rows = [
+            (src_kind, str(src_id), kind, str(dst_id), now)
+            for kind, dst_id in targets.items()
+            if dst_id is not None
+        ]
+        try:
+            self._db().executemany(
+                "INSERT OR REPLACE INTO edges VALUES (?, ?, ?, ?, ?)", rows
+            )
+        except sqlite3.Error as e:
+            logging.warning(f"ID graph write failed: {e}")
+
+    def resolve(self, src_kind, src_id, dst_kind):
+        """The ``dst_kind`` ID ``src_id`` last resolved to, or None."""
+        if src_id is None:
+            return None
+        try:
+            row = (
+                self._db()
+                .execute(
+                    "SELECT dst_id FROM edges"
+                    " WHERE src_kind = ? AND src_id = ? AND dst_kind = ?",
+                    (src_kind, str(src_id), dst_kind),
+                )
+                .fetchone()
+            )
+        except sqlite3.Error as e:
+            logging.warning(f"ID graph read failed: {e}")
+            return None
+        return row[0] if row else None
+
+    def put(self, kind, id, data):
+        """Store the payload for an ID."""
+        try:
+            self._db().execute(
+                "INSERT OR REPLACE INTO entities VALUES (?, ?, ?, ?)",
+                (kind, str(id), json.dumps(data), time.time()),
+            )
+        except sqlite3.Error as e:
+            logging.warning(f"ID graph write failed: {e}")
+
+    def get(self, kind, id):
+        """The payload stored for an ID if it's fresh, else None."""
+        if id is None:
+            return None
+        try:
+            row = (
+                self._db()
+                .execute(
+                    "SELECT data, updated FROM entities WHERE kind = ? AND id = ?",
+                    (kind, str(id)),
+                )
+                .fetchone()
+            )
+        except sqlite3.Error as e:
+            logging.warning(f"ID graph read failed: {e}")
+            return None
+        max_age = self.track_max_age if kind == TRACK_ID else self.max_age
+        if row is None or time.time() - row[1] > max_age:
+            return None
+        return json.loads(row[0])
+
+    def follow(self, src_kind, src_id, dst_kind):
+        """The fresh payload of whatever ``src_id`` resolved to, or None."""
+        return self.get(dst_kind, self.resolve(src_kind, src_id, dst_kind))
+
+    def close(self):
+        db = getattr(self._local, "db", None)
+        if db is not None:
+            db.close()
+            self._local.db = None
+
+
+# Shared by the MXM and Spotify clients in the process
+id_graph = IdGraph(
+    os.environ.get("IDGRAPH_PATH", "idgraph.sqlite3"),
+    max_age=float(os.environ.get("IDGRAPH_MAX_AGE", 86400)),
+    track_max_age=float(os.environ.get("IDGRAPH_TRACK_MAX_AGE", 600)),
+)
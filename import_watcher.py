@@ -0,0 +1,99 @@
+"""Re-poll tracks Musixmatch hasn't imported yet and patch the cached results."""
+
+import asyncio
+import inspect
+import logging
+import os
+import random
+import time
+
+
+class ImportWatcher:
+    """
+    Poll each missing ISRC with backoff until it imports, then fill it in.
+
+    Every cached result waiting on an ISRC subscribes with its cache key and
+    position; one poll per ISRC serves them all. Polls run as tasks on the
+    serving loop, so they only outlive the request under the native ASGI
+    server.
+
+    :param first_delay: Seconds before the first poll.
+    :param max_delay: Cap of the doubling delay between polls.
+    :param give_up_after: Seconds after which an ISRC stops being polled.
+    """
+
+    def __init__(self, first_delay=30, max_delay=300, give_up_after=3600):
+        self.first_delay = first_delay
+        self.max_delay = max_delay
+        self.give_up_after = give_up_after
+        self._tasks = {}
+        self._subscribers = {}
+
+    def watching(self, cache_key):
+        """Whether a poll will still patch the result cached under ``cache_key``."""
+        return any(
+            key == cache_key
+            for subscribers in self._subscribers.values()
+            for key, _index, _update in subscribers
+        )
+
+    def watch(self, isrc, cache_key, index, resolve, update):
+        """
+        Patch ``cache_key`` at ``index`` once ``isrc`` imports.
+
+        :param resolve: Coroutine function returning the track's link once
+            it's imported, or None while it's still missing.
+        :param update: Called as ``update(cache_key, index, link)``; may be a
+            coroutine function.
+        """
+        subscribers = self._subscribers.setdefault(isrc, [])
+        if (cache_key, index) not in [(k, i) for k, i, _ in subscribers]:
+            subscribers.append((cache_key, index, update))
+        if isrc not in self._tasks:
+            self._tasks[isrc] = asyncio.get_running_loop().create_task(
+                self._poll(isrc, resolve)
+            )
+
+    async def _poll(self, isrc, resolve):
+        delay = self.first_delay
+        deadline = time.monotonic() + self.give_up_after
+        try:
+            while time.monotonic() < deadline:
+                await asyncio.sleep(delay * random.uniform(0.8, 1.2))
+                try:
+                    link = await resolve()
+                except Exception:
+                    logging.exception(f"Re-polling {isrc} failed")
+                    link = None
+                if link is not None:
+                    logging.info(f"{isrc} was imported, updating cached results")
+                    await self._publish(isrc, link)
+                    return
+                delay = min(delay * 2, self.max_delay)
+            logging.info(f"Gave up waiting for {isrc} to be imported")
+        finally:
+            self._tasks.pop(isrc, None)
+            self._subscribers.pop(isrc, None)
+
+    async def _publish(self, isrc, link):
+        for cache_key, index, update in self._subscribers.get(isrc, ()):
+            try:
+                result = update(cache_key, index, link)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception:
+                logging.exception(f"Updating {cache_key} with {isrc} failed")
+
+    async def close(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+# Shared by every request served by the process
+import_watcher = ImportWatcher(
+    first_delay=float(os.environ.get("MXM_IMPORT_POLL_FIRST", 30)),
+    max_delay=float(os.environ.get("MXM_IMPORT_POLL_MAX", 300)),
+    give_up_after=float(os.environ.get("MXM_IMPORT_POLL_TIMEOUT", 3600)),
+)
@@ -0,0 +1,314 @@
+"""Pool of Musixmatch API keys with per-key health tracking shared through Redis."""
+
+import asyncio
+import datetime
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import redis
+
+from Asyncmxm.exceptions import MXMException
+
+HEALTHY = "healthy"
+THROTTLED = "throttled"
+EXHAUSTED = "exhausted"
+
+# Musixmatch answers 401/402 in the body's status_code once a key is out of
+# daily quota. An HTTP 401/402 may be a passing auth hiccup instead.
+QUOTA_CODES = (401, 402)
+THROTTLE_CODES = (429, 503)
+
+# Published whenever keys or their health change so workers reload at once.
+KEYS_CHANNEL = "mxm:keys:changed"
+
+
+def _next_quota_reset():
+    """Daily quotas reset at midnight UTC."""
+    now = datetime.datetime.now(datetime.UTC)
+    tomorrow = (now + datetime.timedelta(days=1)).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+    return tomorrow.timestamp()
+
+
+def key_id(key):
+    """Stable identifier for a key that doesn't reveal it."""
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+
+def env_keys():
+    """Keys configured through the comma separated MXM_API_KEYS."""
+    keys = os.environ.get("MXM_API_KEYS", "").split(",")
+    return [k.strip() for k in keys if k.strip()]
+
+
+def fallback_keys():
+    """MXM_API and MXM_API2, only used while no other key is healthy."""
+    keys = [os.environ.get("MXM_API"), os.environ.get("MXM_API2")]
+    return [k.strip() for k in keys if k and k.strip()]
+
+
+class KeyPool:
+    """
+    Route calls across N keys by least load and take unhealthy keys out of rotation.
+
+    A key is *healthy*, *throttled* (429/503, until the server's Retry-After
+    or ``throttle_seconds``; an HTTP 401/402, for ``auth_seconds``) or
+    *exhausted* (a 401/402 ``status_code`` from Musixmatch, until the daily
+    reset). State changes are written to a Redis hash so every worker skips
+    the same keys; ``load_from_redis`` pulls the other workers' view.
+
+    ``fallback`` keys (the user's own MXM_API/MXM_API2) are only leased
+    while none of the pooled keys is healthy, so they don't spend quota
+    while the live keys can serve.
+    """
+
+    REDIS_HEALTH_KEY = "mxm:keypool:health"
+
+    def __init__(
+        self, keys=(), throttle_seconds=60, redis_url=None, fallback=(), auth_seconds=30
+    ):
+        self.throttle_seconds = throttle_seconds
+        self.auth_seconds = auth_seconds
+        self.redis_url = redis_url
+        self._keys = []
+        self._fallback = []
+        self._health = {}
+        self._inflight = {}
+        self._uses = {}
+        self.set_keys(keys, fallback)
+
+    def __len__(self):
+        return len(self._keys) + len(self._fallback)
+
+    @property
+    def keys(self):
+        return [*self._keys, *self._fallback]
+
+    def set_keys(self, keys, fallback=()):
+        """Replace the keys in rotation, keeping what we know about the others."""
+        self._keys = list(dict.fromkeys(k for k in keys if k))
+        self._fallback = [
+            k for k in dict.fromkeys(fallback) if k and k not in self._keys
+        ]
+
+    def state(self, key):
+        state, until = self._health.get(key, (HEALTHY, 0))
+        if state != HEALTHY and until <= time.time():
+            self._health.pop(key, None)
+            return HEALTHY
+        return state
+
+    def acquire(self):
+        """Lease the least loaded healthy key. Pair every call with ``release``."""
+        # Pooled keys before the fallback ones. Throttled keys come back
+        # soonest, so prefer them to failing.
+        tiers = (
+            [k for k in keys if self.state(k) == state]
+            for state in (HEALTHY, THROTTLED)
+            for keys in (self._keys, self._fallback)
+        )
+        healthy = next((tier for tier in tiers if tier), None)
+        if not healthy:
+            raise MXMException(401, None)
+
+        key = min(
+            healthy, key=lambda k: (self._inflight.get(k, 0), self._uses.get(k, 0))
+        )
+        self._inflight[key] = self._inflight.get(key, 0) + 1
+        self._uses[key] = self._uses.get(key, 0) + 1
+        return key
+
+    def release(self, key):
+        self._inflight[key] = max(0, self._inflight.get(key, 0) - 1)
+
+    def report(self, key, status_code, retry_after=None, in_body=False):
+        """
+        Record an error answer for ``key``.
+
+        :param in_body: ``status_code`` is Musixmatch's own, from the response
+            body, rather than the HTTP status.
+        :return: True if the key was taken out of rotation.
+        """
+        if status_code in QUOTA_CODES:
+            if in_body:
+                self._mark(key, EXHAUSTED, _next_quota_reset())
+            else:
+                self._mark(key, THROTTLED, time.time() + self.auth_seconds)
+            return True
+        if status_code in THROTTLE_CODES:
+            self._mark(
+                key, THROTTLED, time.time() + (retry_after or self.throttle_seconds)
+            )
+            return True
+        return False
+
+    def _mark(self, key, state, until):
+        if self._health.get(key) == (state, until):
+            return
+        self._health[key] = (state, until)
+        logging.warning(
+            f"MXM key {key_id(key)} is {state} until "
+            f"{datetime.datetime.fromtimestamp(until, datetime.UTC):%Y-%m-%d %H:%M:%S} UTC"
+        )
+        self._publish(key, state, until)
+
+    def _publish(self, key, state, until):
+        if not self.redis_url:
+            return
+        payload = json.dumps({"state": state, "until": until})
+
+        def write():
+            try:
+                r = redis.from_url(self.redis_url)
+                r.hset(self.REDIS_HEALTH_KEY, key_id(key), payload)
+                r.publish(KEYS_CHANNEL, key_id(key))
+                r.close()
+            except Exception as e:
+                logging.warning(f"Failed to publish MXM key health: {e}")
+
+        try:
+            asyncio.get_running_loop().run_in_executor(None, write)
+        except RuntimeError:
+            write()
+
+    def load_from_redis(self, r):
+        """
+        Load the ``live:*`` keys and the shared health table from Redis.
+
+        :return: The live keys found in Redis.
+        """
+        live = sorted(
+            (name.decode() for name in r.scan_iter("live:*")),
+            key=lambda name: (len(name), name),
+        )
+        values = r.mget(live) if live else []
+        live_keys = [v.decode() for v in values if v]
+
+        now = time.time()
+        by_id = {key_id(k): k for k in [*live_keys, *self.keys]}
+        for field, raw in r.hgetall(self.REDIS_HEALTH_KEY).items():
+            key = by_id.get(field.decode())
+            if key is None:
+                continue
+            entry = json.loads(raw)
+            if (
+                entry["until"] > now
+                and entry["until"] > self._health.get(key, ("", 0))[1]
+            ):
+                self._health[key] = (entry["state"], entry["until"])
+        return live_keys
+
+
+def _check_keyspace_events(r):
+    try:
+        flags = r.config_get("notify-keyspace-events").get("notify-keyspace-events")
+    except redis.RedisError:
+        # Managed Redis may forbid CONFIG; nothing to check then
+        return
+    if flags is not None and not (
+        "K" in flags and ("A" in flags or ("$" in flags and "g" in flags))
+    ):
+        logging.info(
+            "Redis keyspace notifications are off (notify-keyspace-events="
+            f"{flags!r}); live:* edits are picked up every MXM_KEYS_TTL seconds"
+        )
+
+
+class KeyProvider:
+    """
+    Keep the live keys in memory so requests never wait on Redis for them.
+
+    ``get`` always answers from memory; once the copy is older than ``ttl`` it
+    schedules a reload on a background thread. A listener thread also reloads
+    as soon as something is published on ``KEYS_CHANNEL``, or a ``live:*`` key
+    changes when the server sends keyspace notifications
+    (``notify-keyspace-events`` including ``K$g``). The server's setting is
+    never changed; without it, edits made straight in Redis show up after
+    ``ttl``.
+    """
+
+    def __init__(self, pool, redis_url=None, ttl=60):
+        self.pool = pool
+        self.redis_url = redis_url
+        self.ttl = ttl
+        self.live_keys = []
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._listener = None
+
+    def get(self):
+        """Return the live keys, reloading them in the background once stale."""
+        if self.redis_url and (
+            self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl
+        ):
+            self._refresh_in_background()
+        return self.live_keys
+
+    def refresh(self):
+        """Reload the live keys and the shared key health from Redis."""
+        r = redis.from_url(self.redis_url)
+        try:
+            self.live_keys = self.pool.load_from_redis(r)
+        finally:
+            r.close()
+        self.pool.set_keys([*self.live_keys, *env_keys()], fallback_keys())
+        self._loaded_at = time.monotonic()
+
+    def _safe_refresh(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            logging.warning(f"Failed to load MXM keys from Redis: {e}")
+            # Don't hammer a Redis that is down, try again after the TTL.
+            self._loaded_at = time.monotonic()
+        finally:
+            self._refreshing = False
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._safe_refresh, daemon=True).start()
+
+    async def start(self):
+        """Load the keys once and start listening for changes."""
+        if not self.redis_url:
+            return
+        with self._lock:
+            self._refreshing = True
+        await asyncio.to_thread(self._safe_refresh)
+        if self._listener is None:
+            self._listener = threading.Thread(target=self._listen, daemon=True)
+            self._listener.start()
+
+    def _listen(self):
+        while True:
+            try:
+                r = redis.from_url(self.redis_url)
+                _check_keyspace_events(r)
+                pubsub = r.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe("__keyspace@*__:live:*")
+                pubsub.subscribe(KEYS_CHANNEL)
+                for _message in pubsub.listen():
+                    self._safe_refresh()
+            except Exception as e:
+                logging.warning(f"MXM key listener disconnected: {e}")
+                time.sleep(30)
+
+
+# Shared by every MXM instance in the process
+key_pool = KeyPool(
+    env_keys(), redis_url=os.environ.get("REDIS_URL"), fallback=fallback_keys()
+)
+key_provider = KeyProvider(
+    key_pool,
+    redis_url=os.environ.get("REDIS_URL"),
+    ttl=float(os.environ.get("MXM_KEYS_TTL", 60)),
+)
@@ -0,0 +1,118 @@
+"""Canonical keys for the links and codes users look up, e.g. ``spotify:album:X``."""
+
+import re
+from urllib.parse import parse_qsl, unquote, urlencode, urlparse
+
+_ISRC = re.compile(r"[A-Z]{2}[A-Z0-9]{3}\d{7}")
+_SPOTIFY_KINDS = "track|album|artist|playlist"
+# Localized (/intl-id/) and embed links open the same entity
+_SPOTIFY_PATH = re.compile(
+    rf"^/(?:intl-[\w-]+/)?(?:embed/)?(?P<kind>{_SPOTIFY_KINDS})/(?P<id>\w+)"
+)
+_SPOTIFY_URI = re.compile(rf"^spotify:(?P<kind>{_SPOTIFY_KINDS}):(?P<id>\w+)$")
+_SHORT_LINK = re.compile(r"spotify.link/\w+")
+# /<storefront>/<kind>/<slug>/<id>; storefront and slug are optional
+APPLE_PATH = re.compile(
+    r"^/(?:(?P<cc>[a-z]{2})/)?(?P<kind>album|song|playlist|music-video)"
+    r"/(?:[^/]+/)?(?P<id>[\w.-]+)/?$"
+)
+# The parts MXM.album_sp_id looks the page up by
+_MXM_PATH = re.compile(r"/(?P<kind>album|lyrics)/(?P<id>[^?#]+?)/?$")
+
+
+def is_short_link(link):
+    """Whether ``link`` is a spotify.link short link, keyed once it's resolved."""
+    return bool(_SHORT_LINK.search(link))
+
+
+def _parse(link):
+    return urlparse(link if "//" in link else "https://" + link)
+
+
+def _host_is(hostname, domain):
+    return bool(hostname) and (hostname == domain or hostname.endswith("." + domain))
+
+
+def _spotify_key(parsed):
+    match = _SPOTIFY_PATH.match(parsed.path)
+    return f"spotify:{match['kind']}:{match['id']}" if match else None
+
+
+def _apple_key(parsed):
+    match = APPLE_PATH.match(parsed.path)
+    if not match:
+        return None
+    # The song picked from an album (?i=) and the page's language (?l=)
+    # change the answer; tracking parameters don't
+    query = urlencode(
+        sorted((k, v) for k, v in parse_qsl(parsed.query) if k in ("i", "l") and v)
+    )
+    key = f"apple:{match['kind']}:{match['cc'] or ''}:{match['id']}"
+    return f"{key}?{query}" if query else key
+
+
+def _mxm_key(parsed):
+    match = _MXM_PATH.search(unquote(parsed.path))
+    return f"mxm:{match['kind']}:{match['id']}" if match else None
+
+
+def canonical_key(link):
+    """
+    ``platform:kind:id`` of the entity a link or code points at.
+
+    Tracking parameters, localized paths and URI forms all map to the same
+    key: ``open.spotify.com/intl-id/album/X?si=abc``, ``open.spotify.com/
+    album/X`` and ``spotify:album:X`` are all ``spotify:album:X``. Apple keys
+    keep the storefront and the ``?i=``/``?l=`` parameters, e.g.
+    ``apple:album:us:123?i=456``. A bare ISRC is ``isrc:<ISRC>``.
+
+    None for anything else, including spotify.link short links, whose target
+    is only known after following the redirect.
+    """
+    link = link.strip()
+    code = link.upper()
+    if _ISRC.fullmatch(code):
+        return f"isrc:{code}"
+    match = _SPOTIFY_URI.match(link)
+    if match:
+        return f"spotify:{match['kind']}:{match['id']}"
+
+    parsed = _parse(link)
+    hostname = (parsed.hostname or "").lower()
+    if hostname == "open.spotify.com":
+        return _spotify_key(parsed)
+    if _host_is(hostname, "music.apple.com"):
+        return _apple_key(parsed)
+    if _host_is(hostname, "musixmatch.com"):
+        return _mxm_key(parsed)
+    return None
+
+
+def canonical_link(link):
+    """
+    The form of ``link`` the lookups are run on.
+
+    Whatever is cached under a ``canonical_key`` must come from input every
+    variant of it turns into, or one variant's answer (say, an error for a
+    form a route doesn't accept) would be served for all of them. Known
+    links become their plain URLs and ISRCs are upper-cased; anything else
+    is returned as given.
+    """
+    if link is None:
+        return None
+    key = canonical_key(link)
+    if key is None:
+        return link
+    platform, rest = key.split(":", 1)
+    if platform == "spotify":
+        kind, id = rest.split(":", 1)
+        return f"https://open.spotify.com/{kind}/{id}"
+    if platform == "mxm":
+        kind, id = rest.split(":", 1)
+        return f"https://www.musixmatch.com/{kind}/{id}"
+    if platform == "apple":
+        # The slug stays: Apple redirects slugless links
+        query = rest.partition("?")[2]
+        parsed = _parse(link.strip())
+        return parsed._replace(scheme="https", query=query, fragment="").geturl()
+    return rest
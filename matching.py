@@ -0,0 +1,241 @@
+"""Match source (Spotify/Apple) tracks to a Musixmatch album's tracks."""
+
+import re
+
+import jellyfish
+
+# Titles less similar than this are never paired, as before.
+TITLE_THRESHOLD = 0.85
+
+# How much each signal counts once the titles are close enough. Signals a
+# source doesn't have (Apple pages carry no durations) are left out.
+WEIGHTS = {"title": 0.6, "artist": 0.15, "index": 0.1, "duration": 0.15}
+
+# Durations further apart than this (seconds) add nothing to the score.
+DURATION_TOLERANCE = 15
+
+
+# Version tags that differ between services but not between recordings.
+_VERSION_TAG = re.compile(
+    r"\s*(?:[(\[](?:feat|ft|with)\.?\s[^)\]]*[)\]]"
+    r"|-\s*(?:\d{4}\s+)?remaster(?:ed)?(?:\s+\d{4})?(?:\s+version)?$)",
+    re.IGNORECASE,
+)
+
+
+def normalize(text):
+    text = _VERSION_TAG.sub("", text or "")
+    return re.sub(r"[()-.]", "", text).lower().strip()
+
+
+def source_features(sp_track, index):
+    """(isrc, title, artist, index, seconds) of a Spotify/Apple track."""
+    track = sp_track.get("track") or {}
+    artists = track.get("artists") or [{}]
+    duration = track.get("duration_ms")
+    return (
+        sp_track.get("isrc"),
+        normalize(track.get("name")),
+        normalize(artists[0].get("name")),
+        index,
+        duration / 1000 if duration else None,
+    )
+
+
+def mxm_features(mxm_track, index):
+    """(isrc, title, artist, index, seconds) of a Musixmatch track."""
+    return (
+        mxm_track.get("track_isrc"),
+        normalize(mxm_track.get("track_name")),
+        normalize(mxm_track.get("artist_name")),
+        index,
+        mxm_track.get("track_length") or None,
+    )
+
+
+def match_tracks(sources, candidates):
+    """
+    Pair every source with at most one candidate and vice versa.
+
+    ISRC matches and unique exact titles are taken first. The rest is solved
+    as one assignment problem over every pair whose titles clear
+    TITLE_THRESHOLD, scored by title, artist, album position and duration, so
+    two sources can never claim the same Musixmatch track.
+
+    :param sources: Features from ``source_features``.
+    :param candidates: Features from ``mxm_features``.
+    :return: The matched candidate index (or None) for each source.
+    """
+    matches = [None] * len(sources)
+    by_isrc = {}
+    for j, cand in enumerate(candidates):
+        if cand[0]:
+            by_isrc.setdefault(cand[0], j)
+
+    taken = set()
+    rows = []
+    for i, src in enumerate(sources):
+        j = by_isrc.get(src[0]) if src[0] else None
+        if j is not None and j not in taken:
+            matches[i] = j
+            taken.add(j)
+        else:
+            rows.append(i)
+    cols = [j for j in range(len(candidates)) if j not in taken]
+
+    # Titles found exactly once on both sides need no scoring either.
+    src_titles = {}
+    for i in rows:
+        src_titles.setdefault(sources[i][1], []).append(i)
+    cand_titles = {}
+    for j in cols:
+        cand_titles.setdefault(candidates[j][1], []).append(j)
+    for title, (i,) in ((t, r) for t, r in src_titles.items() if len(r) == 1):
+        if len(cand_titles.get(title, ())) == 1:
+            matches[i] = cand_titles[title][0]
+    rows = [i for i in rows if matches[i] is None]
+    taken.update(m for m in matches if m is not None)
+    cols = [j for j in cols if j not in taken]
+    if not rows or not cols:
+        return matches
+
+    edges = _score_pairs([sources[i] for i in rows], [candidates[j] for j in cols])
+    for component in _components(edges):
+        comp_rows = sorted({r for r, _ in component})
+        comp_cols = sorted({c for _, c in component})
+        for r, c in _assign(comp_rows, comp_cols, component):
+            matches[rows[r]] = cols[c]
+    return matches
+
+
+def _score_pairs(sources, candidates):
+    """Score every eligible (source, candidate) pair."""
+    # Jaro can't clear the threshold when one title is much shorter than the
+    # other, which lets most pairs be skipped without comparing them.
+    min_ratio = 3 * TITLE_THRESHOLD - 2
+    artist_sim = {}
+    edges = {}
+    for r, src in enumerate(sources):
+        src_len = len(src[1])
+        for c, cand in enumerate(candidates):
+            cand_len = len(cand[1])
+            if min(src_len, cand_len) <= min_ratio * max(src_len, cand_len):
+                continue
+            title = jellyfish.jaro_similarity(src[1], cand[1])
+            if title <= TITLE_THRESHOLD:
+                continue
+
+            score = WEIGHTS["title"] * title
+            total = WEIGHTS["title"]
+            if src[2] and cand[2]:
+                key = (src[2], cand[2])
+                if key not in artist_sim:
+                    artist_sim[key] = jellyfish.jaro_similarity(*key)
+                score += WEIGHTS["artist"] * artist_sim[key]
+                total += WEIGHTS["artist"]
+            score += WEIGHTS["index"] / (1 + abs(src[3] - cand[3]))
+            total += WEIGHTS["index"]
+            if src[4] and cand[4]:
+                gap = abs(src[4] - cand[4])
+                score += WEIGHTS["duration"] * max(0.0, 1 - gap / DURATION_TOLERANCE)
+                total += WEIGHTS["duration"]
+            edges[r, c] = score / total
+    return edges
+
+
+def _components(edges):
+    """Split the pairs into independent groups that can be solved apart."""
+    parent = {}
+
+    def find(node):
+        while parent.setdefault(node, node) != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    for r, c in edges:
+        parent[find(("r", r))] = find(("c", c))
+
+    groups = {}
+    for (r, c), score in edges.items():
+        groups.setdefault(find(("r", r)), {})[r, c] = score
+    return list(groups.values())
+
+
+def _assign(rows, cols, scores):
+    """Best total score assignment of ``rows`` to ``cols``, as (row, col) pairs."""
+    if len(rows) == 1 and len(cols) == 1:
+        return [(rows[0], cols[0])]
+
+    transpose = len(rows) > len(cols)
+    if transpose:
+        rows, cols = cols, rows
+        scores = {(c, r): s for (r, c), s in scores.items()}
+
+    # A missing pair costs more than any set of real ones, so the solver
+    # pairs up as many tracks as it can before it optimizes the scores.
+    missing = len(rows) + 1
+    cost = [[1 - scores.get((r, c), -missing) for c in cols] for r in rows]
+
+    pairs = []
+    for i, j in enumerate(_hungarian(cost)):
+        if (rows[i], cols[j]) in scores:
+            pairs.append((cols[j], rows[i]) if transpose else (rows[i], cols[j]))
+    return pairs
+
+
+def _hungarian(cost):
+    """
+    Minimum cost assignment for an n x m matrix with n <= m.
+
+    Shortest augmenting path with potentials, O(n^2 m).
+
+    :return: The column assigned to each row.
+    """
+    n, m = len(cost), len(cost[0])
+    inf = float("inf")
+    u = [0.0] * (n + 1)
+    v = [0.0] * (m + 1)
+    owner = [0] * (m + 1)  # row (1-based) assigned to each column, 0 if free
+    way = [0] * (m + 1)
+
+    for i in range(1, n + 1):
+        owner[0] = i
+        j0 = 0
+        minv = [inf] * (m + 1)
+        used = [False] * (m + 1)
+        while True:
+            used[j0] = True
+            i0 = owner[j0]
+            row = cost[i0 - 1]
+            ui0 = u[i0]
+            delta = inf
+            j1 = 0
+            for j in range(1, m + 1):
+                if not used[j]:
+                    cur = row[j - 1] - ui0 - v[j]
+                    if cur < minv[j]:
+                        minv[j] = cur
+                        way[j] = j0
+                    if minv[j] < delta:
+                        delta = minv[j]
+                        j1 = j
+            for j in range(m + 1):
+                if used[j]:
+                    u[owner[j]] += delta
+                    v[j] -= delta
+                else:
+                    minv[j] -= delta
+            j0 = j1
+            if owner[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            owner[j0] = owner[j1]
+            j0 = j1
+
+    assignment = [0] * n
+    for j in range(1, m + 1):
+        if owner[j]:
+            assignment[owner[j] - 1] = j - 1
+    return assignment
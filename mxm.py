@@ -1,49 +1,139 @@
 import asyncio
 import os
 import re
+from contextlib import aclosing
 from urllib.parse import unquote
 
 import jellyfish
 import redis
-from flask_babel import _
 
 import Asyncmxm
+import http_pool
+import idgraph
+import matching
+import notes
+from concurrency import FANOUT_LIMIT, bounded_as_completed
+from idgraph import id_graph
+from keypool import key_pool, key_provider
+
+# Per-key request budget shared by every MXM instance in the process
+rate_limiter = Asyncmxm.RateLimiter(
+    float(os.environ.get("MXM_RATE_LIMIT", 10)),
+    int(os.environ.get("MXM_RATE_BURST", 10)),
+)
+
+
+def _build_response_cache():
+    backend = os.environ.get("MXM_CACHE_BACKEND", "memory")
+    if backend == "none":
+        return None
+    if backend == "redis":
+        client = redis.from_url(os.environ["REDIS_URL"])
+        return Asyncmxm.ResponseCache(Asyncmxm.RedisCache(client))
+    return Asyncmxm.ResponseCache(
+        Asyncmxm.MemoryCache(int(os.environ.get("MXM_CACHE_SIZE", 4096)))
+    )
 
 
-class MXM:
-    DEFAULT_KEY = os.environ.get("MXM_API")
-    DEFAULT_KEY2 = os.environ.get("MXM_API2")
+# Musixmatch answers shared by every MXM instance (and API key) in the process
+response_cache = _build_response_cache()
 
-    def __init__(self, key=None, session=None, key2=None):
-        try:
-            r = redis.from_url(os.environ.get("REDIS_URL"))
-            key1 = r.get("live:1")
-            key2_redis = r.get("live:2")
 
-            if key1:
-                self.key = key1.decode()
-            else:
-                self.key = key or self.DEFAULT_KEY
+def _track_response(track):
+    # Shaped like a track.get answer so callers can't tell the difference
+    return {"message": {"header": {"status_code": 200}, "body": {"track": track}}}
 
-            if key2_redis:
-                self.key2 = key2_redis.decode()
-            else:
-                self.key2 = key2 or self.DEFAULT_KEY2
 
-            r.close()
-        except Exception:
-            # Fallback if Redis fails or keys are missing
-            self.key = key or self.DEFAULT_KEY
-            self.key2 = key2 or self.DEFAULT_KEY2
+def _body_track(response):
+    return response.get("message", {}).get("body", {}).get("track")
 
+
+def _fanout_error(item, e):
+    # Failed tracks surface as error strings, like the MXMException paths
+    return str(e)
+
+
+class MXM:
+    def __init__(
+        self,
+        key=None,
+        session=None,
+        key2=None,
+        refresh=False,
+        fanout=FANOUT_LIMIT,
+        graph=id_graph,
+    ):
+        # Served from memory, the provider reloads from Redis off the hot path
+        live_keys = key_provider.get()
+
+        # Keys from Redis take precedence over the user's own key, as before
+        pooled = bool(live_keys) or not key
+        self.key = None if pooled else key
+        self.key2 = key2
+        # Per-track calls this request may have in flight at once
+        self.fanout = fanout
+        # Identifiers resolved before; skipped when refreshing
+        self.graph = graph
+        self.refresh = refresh
+        # Indices of the tracks Tracks_Data found not imported yet
+        self.not_imported = []
+
+        # Borrow from the process-wide pool unless a session is handed in
         self.session = session
-        self.musixmatch = Asyncmxm.Musixmatch(self.key, requests_session=session)
-        self.musixmatch2 = Asyncmxm.Musixmatch(self.key2, requests_session=session)
+        requests_session = session or http_pool.get_session
+        self.musixmatch = Asyncmxm.Musixmatch(
+            self.key,
+            requests_session=requests_session,
+            rate_limiter=rate_limiter,
+            key_pool=key_pool if pooled else None,
+            cache=response_cache,
+            refresh_cache=refresh,
+        )
+        self.musixmatch2 = Asyncmxm.Musixmatch(
+            self.key2,
+            requests_session=requests_session,
+            rate_limiter=rate_limiter,
+            key_pool=None if key2 else key_pool,
+            cache=response_cache,
+            refresh_cache=refresh,
+        )
 
     def change_key(self, key):
         self.key = key
 
+    async def _known(self, kind, value):
+        """A Musixmatch track resolved before from ``value``, or None."""
+        if self.graph is None or self.refresh or not value:
+            return None
+        return await asyncio.to_thread(self.graph.follow, kind, value, idgraph.TRACK_ID)
+
+    async def _remember(self, track, **sources):
+        """Record a Musixmatch track and the IDs (kind=id) it was resolved from."""
+        if self.graph is None or not isinstance(track, dict):
+            return
+        if not track.get("track_id"):
+            return
+        # A copy: callers sharing the answer may add to it meanwhile
+        await asyncio.to_thread(self._store_track, dict(track), sources)
+
+    def _store_track(self, track, sources):
+        track_id = track["track_id"]
+        self.graph.put(idgraph.TRACK_ID, track_id, track)
+        self.graph.link(
+            idgraph.TRACK_ID,
+            track_id,
+            commontrack_id=track.get("commontrack_id"),
+            album_id=track.get("album_id"),
+        )
+        for kind, value in sources.items():
+            self.graph.link(kind, value, track_id=track_id)
+
     async def track_get(self, isrc=None, commontrack_id=None, vanity_id=None) -> dict:
+        known = await self._known(idgraph.ISRC, isrc) or await self._known(
+            idgraph.COMMONTRACK_ID, commontrack_id
+        )
+        if known:
+            return _track_response(known)
         try:
             response = await self.musixmatch.track_get(
                 track_isrc=isrc,
@@ -51,6 +141,9 @@ class MXM:
                 commontrack_vanity_id=vanity_id,
                 part="track_lyrics_translation_status,publishing_info",
             )
+            await self._remember(
+                _body_track(response), isrc=isrc, commontrack_id=commontrack_id
+            )
             return response
         except Asyncmxm.exceptions.MXMException as e:
             return str(e)
@@ -68,12 +161,16 @@ class MXM:
             return str(e)
 
     async def matcher_track(self, sp_id):
+        known = await self._known(idgraph.SPOTIFY, sp_id)
+        if known:
+            return _track_response(known)
         try:
             response = await self.musixmatch2.matcher_track_get(
                 q_track="null",
                 track_spotify_id=sp_id,
                 part="track_lyrics_translation_status,publishing_info",
             )
+            await self._remember(_body_track(response), spotify=sp_id)
             return dict(response)
         except Asyncmxm.exceptions.MXMException as e:
             return str(e)
@@ -224,7 +321,25 @@ class MXM:
         return None
 
     async def Tracks_Data(self, sp_data, split_check=False):
-        links = []
+        if not isinstance(sp_data, list):
+            return []
+        links = [None] * len(sp_data)
+        async with aclosing(self.iter_tracks_data(sp_data, split_check)) as results:
+            async for i, link in results:
+                links[i] = link
+        return links
+
+    async def iter_tracks_data(self, sp_data, split_check=False):
+        """
+        Resolve every track and yield ``(index, link)`` as soon as it's ready.
+
+        Each track's ISRC lookup and matcher lookup run side by side, and the
+        comparison runs as soon as both are in, so a slow track doesn't hold
+        back the others.
+        """
+        # Safety check: ensure sp_data is non-empty before accessing sp_data[0]
+        if not sp_data or not isinstance(sp_data, list):
+            return
 
         # Check if it looks like an album (more than 1 track)
         album_tracks_mxm = None
@@ -238,196 +353,143 @@ class MXM:
             album_tracks_mxm = await self.get_album_tracks_by_first_track(sp_data)
 
         if album_tracks_mxm:
-            # We have the album tracks from MXM. Now we need to match them to sp_data
-            # sp_data is ordered. album_tracks_mxm might be ordered by track_index.
-            # Let's try to match by ISRC first, then by title/fuzzy.
-
-            # Create a map of MXM tracks for easier lookup
-            mxm_map_by_isrc = {}
-            mxm_map_by_title = {}  # (title_normalized, artist_normalized) -> track
-
-            for item in album_tracks_mxm:
-                t = item["track"]
-                if t.get("track_isrc"):
-                    mxm_map_by_isrc[t["track_isrc"]] = t
-
-                # Normalize for fuzzy matching prep
-                t_title = re.sub(r"[()-.]", "", t.get("track_name", "")).lower()
-                # artist might be in t['artist_name']
-                # But for now let's just use title if artist matches album artist roughly
-                mxm_map_by_title[t_title] = t
-
-            tracks = []
-
-            # Since we are confident these tracks belong to the album, we can use them as matchers too.
-            # We'll build the matchers list in parallel to avoid the second API loop.
-            matchers = []
-
-            for sp_track in sp_data:
-                found_mxm = None
-                sp_isrc = sp_track.get("isrc")
-
-                # Try ISRC
-                if sp_isrc in mxm_map_by_isrc:
-                    found_mxm = mxm_map_by_isrc[sp_isrc]
-
-                if not found_mxm:
-                    # Try Title
-                    sp_title = sp_track["track"]["name"]
-                    sp_title_norm = re.sub(r"[()-.]", "", sp_title).lower()
-
-                    # Direct match
-                    if sp_title_norm in mxm_map_by_title:
-                        found_mxm = mxm_map_by_title[sp_title_norm]
-                    else:
-                        # Fuzzy match against all mxm titles
-                        best_score = 0
-                        best_match = None
-                        for mt_title, mt_track in mxm_map_by_title.items():
-                            score = jellyfish.jaro_similarity(sp_title_norm, mt_title)
-                            if score > 0.85 and score > best_score:
-                                best_score = score
-                                best_match = mt_track
-                        if best_match:
-                            found_mxm = best_match
-
-                if found_mxm:
-                    # Make a shallow copy to avoid mutating the original in lookup maps
-                    new_mxm = dict(found_mxm)
-                    new_mxm["isrc"] = sp_isrc or new_mxm.get("track_isrc")
-                    new_mxm["image"] = sp_track.get("image")
-                    new_mxm["beta"] = str(new_mxm["track_share_url"]).replace(
-                        "www.", "com-beta.", 1
-                    )
-                    tracks.append(new_mxm)
-                    matchers.append(dict(new_mxm))  # Use same data for matcher
-                else:
-                    # Fallback to individual fetch for this specific track
-                    individual_res = await self.Track_links(sp_track)
-                    if isinstance(individual_res, dict):
-                        tracks.append(individual_res)
-                    else:
-                        tracks.append(individual_res)  # likely error string
-
-                    # For matcher fallback, we need to call matcher logic individually too
-                    # Or just use the individual_res if it's good?
-                    # Original logic pairs tracks_get() result with tracks_matcher() result to compare.
-                    # tracks_matcher() does more loose matching (by text).
-                    # But Track_links (which is tracks_get fallback) already does text matching fallback!
-                    # So individual_res is likely already the best match.
-                    matchers.append(individual_res)
+            found = self._match_album_tracks(sp_data, album_tracks_mxm)
+
+            async def resolve(i):
+                if found[i]:
+                    return found[i], dict(found[i])  # Use same data for matcher
+                # Fallback to individual fetch for this specific track.
+                # Track_links already falls back to text matching, so its
+                # answer is likely the best matcher as well.
+                individual_res = await self.Track_links(sp_data[i])
+                return individual_res, individual_res
+
+        elif isinstance(sp_data[0], dict) and sp_data[0].get("track"):
+
+            async def resolve(i):
+                return await asyncio.gather(
+                    self.Track_links(sp_data[i]), self.matcher_links(sp_data[i])
+                )
 
         else:
-            # Safety check: ensure sp_data is non-empty before accessing sp_data[0]
-            if not sp_data or not isinstance(sp_data, list) or len(sp_data) == 0:
-                return []
-            tracks = await self.tracks_get(sp_data)
-            # Only run matchers loop if we took the old path
-            if isinstance(sp_data[0], dict) and sp_data[0].get("track"):
-                matchers = await self.tracks_matcher(sp_data)
-            else:
-                return tracks
+            # Nothing for the matcher to work with, hand the lookups back as is
+            async with aclosing(
+                bounded_as_completed(
+                    self.Track_links, sp_data, self.fanout, on_error=_fanout_error
+                )
+            ) as results:
+                async for i, track, _error in results:
+                    yield i, track
+            return
+
+        async with aclosing(
+            bounded_as_completed(
+                resolve, range(len(sp_data)), self.fanout, on_error=_fanout_error
+            )
+        ) as results:
+            async for i, pair, error in results:
+                if error is not None:
+                    yield i, pair
+                    continue
+                track, matcher = pair
+                if split_check:
+                    yield i, track
+                    continue
+                if (
+                    isinstance(track, str)
+                    and isinstance(matcher, str)
+                    and re.search("404", track)
+                ):
+                    self.not_imported.append(i)
+                yield i, self._compare_track(sp_data[i], track, matcher)
+
+    def _match_album_tracks(self, sp_data, album_tracks_mxm):
+        """Pair each source track with its MXM album track, or None."""
+        mxm_tracks = [item["track"] for item in album_tracks_mxm]
+        sources = [i for i, t in enumerate(sp_data) if isinstance(t, dict)]
+        matches = matching.match_tracks(
+            [matching.source_features(sp_data[i], i) for i in sources],
+            [matching.mxm_features(t, j) for j, t in enumerate(mxm_tracks)],
+        )
 
-        for i in range(len(tracks)):
-            track = tracks[i]
-            matcher = matchers[i]
-            if split_check:
-                links.append(track)
+        found = [None] * len(sp_data)
+        for i, j in zip(sources, matches, strict=True):
+            if j is None:
                 continue
-
-            # detecting what issues can facing the track
-            # Use duck typing: check if objects have 'get' method (dict-like)
-            track_is_dict = hasattr(track, "get")
-            matcher_is_dict = hasattr(matcher, "get")
-            if track_is_dict and matcher_is_dict:
-                # the get call and the matcher call are the same and both have valid response
-                if track["commontrack_id"] == matcher["commontrack_id"]:
-                    track["matcher_album"] = [
-                        matcher["album_id"],
-                        matcher["album_name"],
-                    ]
-                    links.append(dict(track))
-                    """ when we get different data, the sp id attached to the matcher so we try to detect if the matcher one is vailid or it just a ISRC error. I used the probability here to choose the most accurate data to the spotify data """
-                else:
-                    matcher_title = re.sub(r"[()-.]", "", matcher.get("track_name"))
-                    matcher_album = re.sub(r"[()-.]", "", matcher.get("album_name"))
-                    sp_title = re.sub(r"[()-.]", "", sp_data[i]["track"]["name"])
-                    sp_album = re.sub(
-                        r"[()-.]", "", sp_data[i]["track"]["album"]["name"]
+            sp_track = sp_data[i]
+            # Make a shallow copy to avoid mutating the album track
+            new_mxm = dict(mxm_tracks[j])
+            new_mxm["isrc"] = sp_track.get("isrc") or new_mxm.get("track_isrc")
+            new_mxm["image"] = sp_track.get("image")
+            new_mxm["beta"] = str(new_mxm["track_share_url"]).replace(
+                "www.", "com-beta.", 1
+            )
+            found[i] = new_mxm
+        return found
+
+    def _compare_track(self, sp_track, track, matcher):
+        """Pick the link to show for a track from its ISRC and matcher lookups."""
+        # detecting what issues can facing the track
+        # Use duck typing: check if objects have 'get' method (dict-like)
+        track_is_dict = hasattr(track, "get")
+        matcher_is_dict = hasattr(matcher, "get")
+        if track_is_dict and matcher_is_dict:
+            # the get call and the matcher call are the same and both have valid response
+            if track["commontrack_id"] == matcher["commontrack_id"]:
+                track["matcher_album"] = [
+                    matcher["album_id"],
+                    matcher["album_name"],
+                ]
+                return dict(track)
+            else:
+                # when we get different data, the sp id attached to the matcher so we try to detect if the matcher one is vailid or it just a ISRC error. I used the probability here to choose the most accurate data to the spotify data
+                matcher_title = re.sub(r"[()-.]", "", matcher.get("track_name"))
+                matcher_album = re.sub(r"[()-.]", "", matcher.get("album_name"))
+                sp_title = re.sub(r"[()-.]", "", sp_track["track"]["name"])
+                sp_album = re.sub(r"[()-.]", "", sp_track["track"]["album"]["name"])
+                track_title = re.sub(r"[()-.]", "", track.get("track_name"))
+                track_album = re.sub(r"[()-.]", "", track.get("album_name"))
+                if (
+                    matcher.get("album_name") == sp_track["track"]["album"]["name"]
+                    and matcher.get("track_name") == sp_track["track"]["name"]
+                    or jellyfish.jaro_similarity(
+                        matcher_title.lower(), sp_title.lower()
                     )
-                    track_title = re.sub(r"[()-.]", "", track.get("track_name"))
-                    track_album = re.sub(r"[()-.]", "", track.get("album_name"))
-                    if (
-                        matcher.get("album_name")
-                        == sp_data[i]["track"]["album"]["name"]
-                        and matcher.get("track_name") == sp_data[i]["track"]["name"]
-                        or jellyfish.jaro_similarity(
-                            matcher_title.lower(), sp_title.lower()
-                        )
-                        * jellyfish.jaro_similarity(
-                            matcher_album.lower(), sp_album.lower()
-                        )
-                        >= jellyfish.jaro_similarity(
-                            track_title.lower(), sp_title.lower()
-                        )
-                        * jellyfish.jaro_similarity(
-                            track_album.lower(), sp_album.lower()
-                        )
-                    ):
-                        matcher["note"] = _(
-                            'This track may having two pages with the same ISRC, the other <a class="card-link" href="%(track_url)s" target="_blank">page</a> from <a class="card-link" href="https://www.musixmatch.com/album/%(artist_id)s/%(album_id)s" target="_blank">album</a>.',
-                            track_url=track["track_share_url"],
-                            artist_id=track["artist_id"],
-                            album_id=track["album_id"],
-                        )
-                        links.append(dict(matcher))
-                    else:
-                        track["note"] = _(
-                            'This track may be facing an ISRC issue as the Spotify ID is connected to another <a class="card-link" href="%(track_url)s" target="_blank">page</a> from <a class="card-link" href="https://www.musixmatch.com/album/%(artist_id)s/%(album_id)s" target="_blank">album</a>.',
-                            track_url=matcher["track_share_url"],
-                            artist_id=matcher["artist_id"],
-                            album_id=matcher["album_id"],
-                        )
-                        links.append(dict(track))
-                continue
-
-            elif isinstance(track, str) and isinstance(matcher, str):
-                if re.search("404", track):
-                    track = _(
-                        "The track hasn't been imported yet. Please try again after 1-5 minutes. Sometimes it may take longer, up to 15 minutes, depending on the MXM API and their servers."
+                    * jellyfish.jaro_similarity(matcher_album.lower(), sp_album.lower())
+                    >= jellyfish.jaro_similarity(track_title.lower(), sp_title.lower())
+                    * jellyfish.jaro_similarity(track_album.lower(), sp_album.lower())
+                ):
+                    matcher["note"] = notes.note(
+                        notes.TWO_PAGES,
+                        track_url=track["track_share_url"],
+                        artist_id=track["artist_id"],
+                        album_id=track["album_id"],
                     )
-                    links.append(track)
-                    continue
-                else:
-                    links.append(track)
-            elif isinstance(track, str) and matcher_is_dict:
-                if matcher.get("album_name") == sp_data[i]["track"]["album"]["name"]:
-                    links.append(dict(matcher))
-                    continue
+                    return dict(matcher)
                 else:
-                    links.append(dict(matcher))
-            elif track_is_dict and isinstance(matcher, str):
-                track["note"] = _("This track may missing its Spotify id")
-                links.append(dict(track))
-            else:
-                # Ensure dict conversion for any fallback case
-                if hasattr(track, "get"):
-                    links.append(dict(track))
-                else:
-                    links.append(track)
-        return links
-
-    async def tracks_get(self, data):
-        coro = [self.Track_links(isrc) for isrc in data]
-        tasks = [asyncio.create_task(c) for c in coro]
-        tracks = await asyncio.gather(*tasks)
-        return tracks
+                    track["note"] = notes.note(
+                        notes.ISRC_ISSUE,
+                        track_url=matcher["track_share_url"],
+                        artist_id=matcher["artist_id"],
+                        album_id=matcher["album_id"],
+                    )
+                    return dict(track)
 
-    async def tracks_matcher(self, data):
-        coro = [self.matcher_links(isrc) for isrc in data]
-        tasks = [asyncio.create_task(c) for c in coro]
-        tracks = await asyncio.gather(*tasks)
-        return tracks
+        elif isinstance(track, str) and isinstance(matcher, str):
+            if re.search("404", track):
+                track = notes.NOT_IMPORTED
+            return track
+        elif isinstance(track, str) and matcher_is_dict:
+            return dict(matcher)
+        elif track_is_dict and isinstance(matcher, str):
+            track["note"] = notes.note(notes.MISSING_SPOTIFY_ID)
+            return dict(track)
+        else:
+            # Ensure dict conversion for any fallback case
+            if hasattr(track, "get"):
+                return dict(track)
+            else:
+                return track
 
     async def album_sp_id(self, link):
         site = re.search(r"musixmatch.com", link)
@@ -466,13 +528,26 @@ class MXM:
     async def abstrack(self, id: int) -> tuple[dict, dict]:
         """Get the track and the album data from the abstrack."""
         try:
-            track = await self.musixmatch.track_get(
-                commontrack_id=id,
-                part="track_lyrics_translation_status,publishing_info",
-            )
-            track = track["message"]["body"]["track"]
-            album = await self.musixmatch.album_get(track["album_id"])
-            album = album["message"]["body"]["album"]
+            track = await self._known(idgraph.COMMONTRACK_ID, id)
+            if not track:
+                track = await self.musixmatch.track_get(
+                    commontrack_id=id,
+                    part="track_lyrics_translation_status,publishing_info",
+                )
+                track = track["message"]["body"]["track"]
+                await self._remember(track, commontrack_id=id)
+            album = None
+            if self.graph is not None and not self.refresh:
+                album = await asyncio.to_thread(
+                    self.graph.get, idgraph.ALBUM_ID, track["album_id"]
+                )
+            if not album:
+                album = await self.musixmatch.album_get(track["album_id"])
+                album = album["message"]["body"]["album"]
+                if self.graph is not None:
+                    await asyncio.to_thread(
+                        self.graph.put, idgraph.ALBUM_ID, track["album_id"], album
+                    )
             return track, album
         except Asyncmxm.exceptions.MXMException as e:
             return {"error": str(e)}, {"error": str(e)}
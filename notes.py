@@ -0,0 +1,52 @@
+"""Notes on resolved tracks, cached as codes and translated when rendered."""
+
+from flask_babel import gettext
+
+# A whole entry: the track isn't on Musixmatch yet
+NOT_IMPORTED = "not_imported"
+# A track's "note": {"code": ..., **parameters}
+TWO_PAGES = "two_pages"
+ISRC_ISSUE = "isrc_issue"
+MISSING_SPOTIFY_ID = "missing_spotify_id"
+
+
+def N_(message):
+    """Mark ``message`` for extraction; it's translated by ``localize``."""
+    return message
+
+
+MESSAGES = {
+    NOT_IMPORTED: N_(
+        "The track hasn't been imported yet. Please try again after 1-5 minutes. Sometimes it may take longer, up to 15 minutes, depending on the MXM API and their servers."
+    ),
+    TWO_PAGES: N_(
+        'This track may having two pages with the same ISRC, the other <a class="card-link" href="%(track_url)s" target="_blank">page</a> from <a class="card-link" href="https://www.musixmatch.com/album/%(artist_id)s/%(album_id)s" target="_blank">album</a>.'
+    ),
+    ISRC_ISSUE: N_(
+        'This track may be facing an ISRC issue as the Spotify ID is connected to another <a class="card-link" href="%(track_url)s" target="_blank">page</a> from <a class="card-link" href="https://www.musixmatch.com/album/%(artist_id)s/%(album_id)s" target="_blank">album</a>.'
+    ),
+    MISSING_SPOTIFY_ID: N_("This track may missing its Spotify id"),
+}
+
+
+def note(code, **params):
+    """A track note, e.g. ``note(TWO_PAGES, track_url=..., ...)``."""
+    return {"code": code, **params}
+
+
+def localize(value):
+    """
+    The text of a note or note code in the current locale.
+
+    Anything else (track entries, untranslated error messages) is returned
+    as is, so templates can pass every entry through.
+    """
+    if isinstance(value, dict):
+        message = MESSAGES.get(value.get("code"))
+        if message is None:
+            return value
+        params = {k: v for k, v in value.items() if k != "code"}
+        return gettext(message, **params)
+    if isinstance(value, str) and value in MESSAGES:
+        return gettext(MESSAGES[value])
+    return value
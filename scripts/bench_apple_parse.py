@@ -0,0 +1,117 @@
+"""
+CPU time per Apple Music page: regex scanner vs full BeautifulSoup parse.
+
+Both columns include loading the JSON-LD; "same" checks that both found
+the same music data.
+
+Pass saved pages (``curl -o page.html https://music.apple.com/...``) to
+measure real ones. Without arguments, synthetic pages shaped like Apple's
+are used: JSON-LD and og: tags in the head, a large serialized-server-data
+script and a body with a few elements per track.
+
+    python scripts/bench_apple_parse.py
+    python scripts/bench_apple_parse.py saved/*.html
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+from apple import _music_item, scan_page, soup_page  # noqa: E402
+
+
+def make_page(tracks):
+    album = {
+        "@context": "http://schema.org",
+        "@type": "MusicAlbum",
+        "name": "Synthetic Album",
+        "image": "https://is1-ssl.mzstatic.com/image/thumb/album.jpg",
+        "byArtist": [{"@type": "MusicGroup", "name": "Artist"}],
+        "tracks": [
+            {
+                "@type": "MusicRecording",
+                "name": f"Track {n}",
+                "isrc": f"USAAA{n:07d}",
+                "url": f"https://music.apple.com/us/song/track-{n}/{1000 + n}",
+                "duration": "PT3M30S",
+            }
+            for n in range(tracks)
+        ],
+    }
+    server_data = json.dumps(
+        [
+            {"data": {"sections": [{"id": n, "items": ["x" * 200] * 20}]}}
+            for n in range(tracks * 4)
+        ]
+    )
+    head = "".join(
+        f'<meta name="meta-{n}" content="value {n}"><link rel="preload" href="/a{n}.js">'
+        for n in range(60)
+    )
+    body = "".join(
+        f'<div class="songs-list-row"><div class="songs-list-row__song-name">'
+        f'Track {n}</div><span class="time">3:30</span></div>'
+        for n in range(tracks)
+    )
+    return (
+        "<!DOCTYPE html><html><head>"
+        f"{head}"
+        '<meta property="og:title" content="Synthetic Album by Artist">'
+        '<meta property="og:image" content="https://is1-ssl.mzstatic.com/og.jpg">'
+        f'<script type="application/ld+json">{json.dumps(album)}</script>'
+        f'<script type="application/json" id="serialized-server-data">{server_data}</script>'
+        f"</head><body>{body}</body></html>"
+    )
+
+
+def with_soup(page):
+    return _music_item(soup_page(page)[0])
+
+
+def with_scan(page):
+    return _music_item(scan_page(page)[0])
+
+
+def cpu_ms(fn, page, runs):
+    times = []
+    for _ in range(runs):
+        start = time.process_time()
+        fn(page)
+        times.append(time.process_time() - start)
+    return statistics.median(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("pages", nargs="*", help="saved Apple Music pages")
+    parser.add_argument("--tracks", type=int, nargs="+", default=[12, 50, 200])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.pages:
+        pages = []
+        for path in args.pages:
+            with open(path, encoding="utf-8") as f:
+                pages.append((os.path.basename(path), f.read()))
+    else:
+        pages = [(f"synthetic {n} tracks", make_page(n)) for n in args.tracks]
+
+    print(f"{'page':<24} {'KiB':>6} {'soup ms':>9} {'scan ms':>9} {'same':>5}")
+    for name, page in pages:
+        same = with_scan(page) == with_soup(page)
+        soup = cpu_ms(with_soup, page, args.runs)
+        scan = cpu_ms(with_scan, page, args.runs)
+        print(
+            f"{name[:24]:<24} {len(page) // 1024:>6} {soup:>9.2f} {scan:>9.2f} "
+            f"{'yes' if same else 'NO':>5}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Compare the native ASGI mode against the WsgiToAsgi bridge.
+
+Requests are driven straight into ``app.asgi_app`` on one event loop (the way
+hypercorn runs it) with Musixmatch mocked by a fixed upstream latency, so the
+numbers only reflect the serving path.
+
+    python scripts/bench_asgi.py --requests 400 --concurrency 50
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+ROUTES = {
+    # plain async view
+    "index": lambda i: ("/", f"link=BENCH{i:07d}&refresh=1".encode()),
+    # async view wrapped by cache.cached (runs as a sync view)
+    "history": lambda i: ("/history", f"id={i}".encode()),
+}
+
+
+async def drive(asgi_app, route, total, concurrency):
+    build = ROUTES[route]
+    latencies = []
+    counter = iter(range(total))
+
+    async def one(i):
+        path, query = build(i)
+        scope = {
+            "type": "http",
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": path,
+            "root_path": "",
+            "query_string": query,
+            "headers": [(b"host", b"bench")],
+            "server": ("bench", 80),
+            "client": ("127.0.0.1", 0),
+        }
+        sent_request = False
+        status = None
+
+        async def receive():
+            nonlocal sent_request
+            if not sent_request:
+                sent_request = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            await asyncio.Event().wait()
+
+        async def send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+
+        start = time.perf_counter()
+        await asgi_app(scope, receive, send)
+        latencies.append(time.perf_counter() - start)
+        assert status == 200, status
+
+    async def worker():
+        for i in counter:
+            await one(i)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "rps": total / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+
+def run_mode(args):
+    os.environ.setdefault("SPOTIPY_CLIENT_ID", "bench")
+    os.environ.setdefault("SPOTIPY_CLIENT_SECRET", "bench")
+    for name in ("REDIS_HOST", "REDIS_PORT", "REDIS_PASSWD", "REDIS_URL"):
+        os.environ.pop(name, None)
+
+    import logging
+
+    import mxm
+
+    logging.disable(logging.CRITICAL)
+    latency = args.upstream_ms / 1000
+
+    async def fake_tracks_data(self, sp_data, split_check=False):
+        await asyncio.sleep(latency)
+        return [f"Track {sp_data[0]['isrc']}"]
+
+    async def fake_track_history(self, commontrack_id):
+        await asyncio.sleep(latency)
+        return [{"user": {"user_name": "bench"}}]
+
+    mxm.MXM.Tracks_Data = fake_tracks_data
+    mxm.MXM.track_history = fake_track_history
+
+    import app
+
+    app.print = lambda *a, **k: None
+    results = {}
+    for route in ROUTES:
+        results[route] = asyncio.run(
+            drive(app.asgi_app, route, args.requests, args.concurrency)
+        )
+    print(json.dumps(results))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--upstream-ms", type=float, default=20)
+    parser.add_argument("--mode", choices=["native", "wsgi"])
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args)
+        return
+
+    print(
+        f"{args.requests} requests, concurrency {args.concurrency}, "
+        f"mocked upstream {args.upstream_ms:g} ms"
+    )
+    print(f"{'mode':<8} {'route':<8} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    for mode in ("wsgi", "native"):
+        output = subprocess.run(
+            [sys.executable, __file__, *sys.argv[1:], "--mode", mode],
+            env={**os.environ, "ASGI_MODE": mode},
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        for route, r in json.loads(output.strip().splitlines()[-1]).items():
+            print(
+                f"{mode:<8} {route:<8} {r['rps']:>9.1f} "
+                f"{r['p50_ms']:>9.1f} {r['p99_ms']:>9.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
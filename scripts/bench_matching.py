@@ -0,0 +1,170 @@
+"""
+Compare the global album matcher with the old greedy title loop.
+
+Synthetic albums mimic what trips the greedy loop: a share of tracks without
+ISRCs (or with ISRCs Musixmatch doesn't have), "Remastered"/"feat." title
+variants, misspellings and near-identical titles such as "Dream" /
+"Dream II".
+
+    python scripts/bench_matching.py --sizes 20 100 500
+"""
+
+import argparse
+import os
+import random
+import re
+import statistics
+import sys
+import time
+
+import jellyfish
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+import matching  # noqa: E402
+
+WORDS = (
+    "love night dream fire heart rain gold summer shadow light river city "
+    "home wild blue stars ocean road echo silver broken dance ghost young"
+).split()
+
+
+def make_album(size, rng):
+    """Return (sp_data, mxm_tracks, truth) where truth[i] is the mxm index."""
+    titles = set()
+    while len(titles) < size:
+        title = " ".join(rng.sample(WORDS, rng.choice((1, 2, 3)))).title()
+        if rng.random() < 0.1:
+            title += f" {rng.choice(['II', 'III', 'Part 2', 'Reprise'])}"
+        titles.add(title)
+    titles = list(titles)
+
+    mxm_tracks = []
+    for j, title in enumerate(titles):
+        mxm_tracks.append(
+            {
+                "track_isrc": f"MXM{j:05d}" if rng.random() < 0.6 else None,
+                "track_name": title,
+                "artist_name": "Artist",
+                "track_length": rng.randint(120, 300),
+                "commontrack_id": j,
+            }
+        )
+
+    order = list(range(size))
+    # Streaming services and Musixmatch sometimes disagree on the order.
+    for _ in range(size // 10):
+        a, b = rng.randrange(size), rng.randrange(size)
+        order[a], order[b] = order[b], order[a]
+
+    sp_data = []
+    for j in order:
+        mxm = mxm_tracks[j]
+        name = mxm["track_name"]
+        roll = rng.random()
+        if roll < 0.15:
+            name += " - Remastered"
+        elif roll < 0.25:
+            name += " (feat. Guest)"
+        elif roll < 0.45:
+            # Spelling and punctuation differences
+            k = rng.randrange(len(name))
+            name = name[:k] + rng.choice("aeiou'") + name[k + 1 :]
+        sp_data.append(
+            {
+                "isrc": mxm["track_isrc"] if rng.random() < 0.7 else None,
+                "track": {
+                    "name": name,
+                    "artists": [{"name": "Artist"}],
+                    "duration_ms": (mxm["track_length"] + rng.randint(-2, 2)) * 1000,
+                },
+            }
+        )
+    return sp_data, mxm_tracks, order
+
+
+def greedy_match(sp_data, mxm_tracks):
+    """The matching loop Tracks_Data used before the global matcher."""
+    by_isrc = {}
+    by_title = {}
+    for j, t in enumerate(mxm_tracks):
+        if t.get("track_isrc"):
+            by_isrc[t["track_isrc"]] = j
+        by_title[re.sub(r"[()-.]", "", t["track_name"]).lower()] = j
+
+    found = []
+    for sp_track in sp_data:
+        match = by_isrc.get(sp_track.get("isrc"))
+        if match is None:
+            title = re.sub(r"[()-.]", "", sp_track["track"]["name"]).lower()
+            if title in by_title:
+                match = by_title[title]
+            else:
+                best_score = 0
+                for mt_title, j in by_title.items():
+                    score = jellyfish.jaro_similarity(title, mt_title)
+                    if score > 0.85 and score > best_score:
+                        best_score = score
+                        match = j
+        found.append(match)
+    return found
+
+
+def global_match(sp_data, mxm_tracks):
+    return matching.match_tracks(
+        [matching.source_features(t, i) for i, t in enumerate(sp_data)],
+        [matching.mxm_features(t, j) for j, t in enumerate(mxm_tracks)],
+    )
+
+
+def measure(fn, albums):
+    times = []
+    correct = wrong = missing = conflicts = 0
+    for sp_data, mxm_tracks, truth in albums:
+        start = time.perf_counter()
+        found = fn(sp_data, mxm_tracks)
+        times.append(time.perf_counter() - start)
+        claimed = [j for j in found if j is not None]
+        conflicts += len(claimed) - len(set(claimed))
+        for got, want in zip(found, truth, strict=True):
+            if got is None:
+                missing += 1
+            elif got == want:
+                correct += 1
+            else:
+                wrong += 1
+    total = correct + wrong + missing
+    return {
+        "ms": statistics.median(times) * 1000,
+        "correct": correct / total,
+        "wrong": wrong / total,
+        "missing": missing / total,
+        "conflicts": conflicts / len(albums),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[20, 100, 500])
+    parser.add_argument("--albums", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(
+        f"{'tracks':>6} {'matcher':<7} {'median ms':>10} {'correct':>8} "
+        f"{'wrong':>6} {'missing':>8} {'dup claims/album':>17}"
+    )
+    for size in args.sizes:
+        albums = [make_album(size, rng) for _ in range(args.albums)]
+        for name, fn in (("greedy", greedy_match), ("global", global_match)):
+            r = measure(fn, albums)
+            print(
+                f"{size:>6} {name:<7} {r['ms']:>10.2f} {r['correct']:>8.1%} "
+                f"{r['wrong']:>6.1%} {r['missing']:>8.1%} {r['conflicts']:>17.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
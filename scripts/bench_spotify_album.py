@@ -0,0 +1,121 @@
+"""
+Compare album resolution before and after paging/chunking.
+
+"old" is a single album tracks page plus one tracks call, which stops at the
+first page; "serial" pages and chunks one call at a time; "new" fetches the
+remaining pages and the 50-track chunks concurrently.
+
+A mocked aiohttp session answers the album tracks and tracks endpoints after
+a fixed latency and enforces the Web API's 50-item limits, so the numbers
+reflect the number and overlap of the round trips rather than the network.
+
+    python scripts/bench_spotify_album.py --tracks 200 --latency 0.15
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from unittest.mock import patch
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+import spotify  # noqa: E402
+
+
+class FakeResponse:
+    def __init__(self, body, latency):
+        self.status = 200
+        self.headers = {}
+        self._body = body
+        self._latency = latency
+
+    async def __aenter__(self):
+        await asyncio.sleep(self._latency)
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def json(self):
+        return self._body
+
+
+class FakeSession:
+    def __init__(self, size, latency):
+        self.ids = [f"track{n:04d}" for n in range(size)]
+        self.latency = latency
+
+    def post(self, url, **kwargs):
+        return FakeResponse({"access_token": "bench", "expires_in": 3600}, 0)
+
+    def get(self, url, params=None, **kwargs):
+        params = params or {}
+        if url.endswith("/tracks") and "albums/" in url:
+            offset = params.get("offset", 0)
+            limit = min(params.get("limit", 20), 50)
+            body = {
+                "items": [{"id": i} for i in self.ids[offset : offset + limit]],
+                "total": len(self.ids),
+                "next": "next" if offset + limit < len(self.ids) else None,
+            }
+        else:
+            ids = params["ids"].split(",")
+            if len(ids) > 50:
+                raise ValueError("Too many ids requested")
+            body = {
+                "tracks": [
+                    {"id": i, "external_ids": {"isrc": f"ISRC{i}"}, "album": {}}
+                    for i in ids
+                ]
+            }
+        return FakeResponse(body, self.latency)
+
+
+async def old_get_isrc(client, album_id):
+    """The album path of get_isrc before paging: one page, one tracks call."""
+    page = await client._get(f"albums/{album_id}/tracks")
+    ids = ",".join(t["id"] for t in page["items"])
+    return (await client._get("tracks", {"ids": ids}))["tracks"]
+
+
+async def new_get_isrc(client, album_id):
+    return await client.get_isrc(f"https://open.spotify.com/album/{album_id}")
+
+
+async def sequential_get_isrc(client, album_id):
+    """Paged and chunked, but one call at a time."""
+    with patch.object(spotify, "FETCH_CONCURRENCY", 1):
+        return await new_get_isrc(client, album_id)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tracks", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.15)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    session = FakeSession(args.tracks, args.latency)
+    client = spotify.AsyncSpotify("bench", "x", requests_session=session)
+
+    print(f"{'version':<8} {'median s':>9} {'tracks':>7}")
+    versions = (
+        ("old", old_get_isrc),
+        ("serial", sequential_get_isrc),
+        ("new", new_get_isrc),
+    )
+    for name, fn in versions:
+        times = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            result = await fn(client, "album")
+            times.append(time.perf_counter() - start)
+        print(f"{name:<8} {statistics.median(times):>9.3f} {len(result):>7}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,9 +1,11 @@
+import asyncio
 import json
 
+import http_pool
 from apple import AppleMusic
 
 
-def test():
+async def test():
     am = AppleMusic()
     links = [
         "https://music.apple.com/album/1844274179",
@@ -12,9 +14,10 @@ def test():
 
     for link in links:
         print(f"\nTesting with link: {link}")
-        data = am.get_apple_music_data(link)
+        data = await am.fetch_apple_music_data(link)
         print(json.dumps(data, indent=2))
+    await http_pool.close()
 
 
 if __name__ == "__main__":
-    test()
+    asyncio.run(test())
@@ -1,182 +1,445 @@
+import asyncio
 import logging
 import re
+import time
 from os import environ
 
-import redis
-import requests
-import spotipy
-from spotipy.oauth2 import SpotifyClientCredentials
+import aiohttp
 
+import http_pool
+import idgraph
+from Asyncmxm.ratelimit import backoff, retry_after
+from concurrency import MicroBatcher, bounded_map
+from spotify_credentials import credential_rotation
 
-class Spotify:
-    def __init__(self, client_id=None, client_secret=None) -> None:
-        self.client_id = client_id if client_id else environ.get("SPOTIPY_CLIENT_ID")
-        self.client_secret = (
-            client_secret if client_secret else environ.get("SPOTIPY_CLIENT_SECRET")
-        )
-        if not (self.client_id and self.client_secret):
-            self.RRAuth()
-        else:
-            cred = SpotifyClientCredentials(self.client_id, self.client_secret)
-            self.sp = spotipy.Spotify(client_credentials_manager=cred, retries=3)
-        self.session = requests.Session()
-        # if client_id is not None:
-
-    def RRAuth(self):
-        try:
-            r = redis.Redis(
-                host=environ.get("REDIS_HOST"),
-                port=environ.get("REDIS_PORT"),
-                password=environ.get("REDIS_PASSWD"),
+# Most items the Web API returns per album/discography page or tracks call
+PAGE_SIZE = 50
+# Spotify calls one lookup may have in flight at once
+FETCH_CONCURRENCY = int(environ.get("SPOTIFY_FETCH_CONCURRENCY", 4))
+
+API_URL = "https://api.spotify.com/v1/"
+TOKEN_URL = "https://accounts.spotify.com/api/token"
+
+# Single-track lookups arriving within this many seconds share one tracks
+# call; 0 sends each on its own.
+BATCH_WINDOW = float(environ.get("SPOTIFY_BATCH_WINDOW_MS", 0)) / 1000
+
+# Only well-formed IDs are batched: one bad ID fails a whole tracks call.
+_TRACK_ID = re.compile(r"[0-9A-Za-z]{22}")
+
+# Seconds a spotify.link short link gets to redirect
+SHORT_LINK_TIMEOUT = 5
+
+# Releases listed on an artist's page
+ALBUM_GROUPS = "album,single,compilation"
+
+
+class DiscographyCache:
+    """Artist discographies by artist ID, each kept for ``ttl`` seconds."""
+
+    def __init__(self, ttl=3600):
+        self.ttl = ttl
+        self._entries = {}
+
+    def get(self, artist):
+        entry = self._entries.get(artist)
+        if entry is None or entry[1] <= time.monotonic():
+            return None
+        return list(entry[0])
+
+    def set(self, artist, albums):
+        now = time.monotonic()
+        self._entries = {k: v for k, v in self._entries.items() if v[1] > now}
+        self._entries[artist] = (list(albums), now + self.ttl)
+        return list(albums)
+
+
+# Shared by every Spotify client in the process
+discography_cache = DiscographyCache(
+    ttl=float(environ.get("SPOTIFY_DISCOGRAPHY_TTL", 3600))
+)
+
+
+def _unique_albums(pages):
+    """The albums of every page in order, each ID once."""
+    seen = set()
+    albums = []
+    for page in pages:
+        for album in page["items"]:
+            # Pages fetched concurrently may overlap if the listing shifts.
+            # Same-named releases (explicit/clean, regional) keep their own
+            # IDs and Musixmatch pages, so they stay.
+            if album.get("id") in seen:
+                continue
+            seen.add(album.get("id"))
+            albums.append(album)
+    return albums
+
+
+def get_spotify_id(link):
+    match = re.search(r"track/(\w+)", link)
+    if match:
+        return match.group(1)
+
+    match = re.search(r"artist/(\w+)", link)
+    if match:
+        return match.group(1)
+
+    return None
+
+
+def _known_tracks(graph, ids):
+    return {i: graph.get(idgraph.SPOTIFY, i) for i in ids}
+
+
+def _remember_tracks(graph, tracks):
+    for track in tracks:
+        if track and track.get("id"):
+            graph.put(idgraph.SPOTIFY, track["id"], track)
+            graph.link(
+                idgraph.SPOTIFY,
+                track["id"],
+                isrc=track.get("external_ids", {}).get("isrc"),
             )
 
-            # Use 'spotify' key directly instead of json path if possible, or handle missing key
-            doc = r.json().get("spotify", "$")
 
-            if not doc:
-                logging.warning(
-                    "No Spotify credentials found in Redis (key: 'spotify'). Using environment variables or failing."
-                )
-                # Fallback to env vars if Redis fails to provide credentials
-                if environ.get("SPOTIPY_CLIENT_ID") and environ.get(
-                    "SPOTIPY_CLIENT_SECRET"
-                ):
-                    cred = SpotifyClientCredentials(
-                        environ.get("SPOTIPY_CLIENT_ID"),
-                        environ.get("SPOTIPY_CLIENT_SECRET"),
-                    )
-                    self.sp = spotipy.Spotify(
-                        client_credentials_manager=cred, retries=3
-                    )
-                    r.close()
-                    return
-                else:
-                    raise ValueError(
-                        "Spotify credentials not found in Redis or Environment variables."
-                    )
-
-            doc = doc[0]
-            cred = doc["cred"][doc["rr"]]
-            logging.info(f"Using Spotify credential set index: {doc['rr']}")
-            r.json().set("spotify", "$.rr", (doc["rr"] + 1) % len(doc["cred"]))
-            r.close()
-            cred = SpotifyClientCredentials(cred[0], cred[1])
-            self.sp = spotipy.Spotify(client_credentials_manager=cred, retries=3)
-        except Exception as e:
-            logging.error(f"Failed to initialize Spotify via RRAuth: {e}")
-            # Final fallback attempt
-            if environ.get("SPOTIPY_CLIENT_ID") and environ.get(
-                "SPOTIPY_CLIENT_SECRET"
-            ):
-                cred = SpotifyClientCredentials(
-                    environ.get("SPOTIPY_CLIENT_ID"),
-                    environ.get("SPOTIPY_CLIENT_SECRET"),
-                )
-                self.sp = spotipy.Spotify(client_credentials_manager=cred, retries=3)
-            else:
-                raise
+def _short_link_code(link):
+    match = re.search(r"spotify.link/(\w+)", link)
+    return match.group(1) if match else None
 
-    def get_track(self, link=None, track=None) -> dict:
-        if link is not None:
-            track = self.get_spotify_id(link)
-        return self.sp.track(track)
 
-    def get_album_tracks(self, id: str) -> dict:
-        return self.sp.album_tracks(id)
+def _known_short_link(graph, link):
+    if graph is None:
+        return None
+    return graph.resolve(idgraph.SHORT_LINK, _short_link_code(link), idgraph.URL)
 
-    def get_tracks(self, ids) -> list:
-        return self.sp.tracks(ids)["tracks"]
 
-    def get_isrc(self, link):
-        if not (self.client_id and self.client_secret):
-            self.RRAuth()
-        isrcs = []
-        track = None
-        match = re.search(r"spotify.link/\w+", link)
-        if match:
-            link = self.session.get(link).url
+def _remember_short_link(graph, link, url):
+    # Only real redirects are kept, not a landing page we got stuck on
+    if graph is not None and "open.spotify.com" in url:
+        graph.link(idgraph.SHORT_LINK, _short_link_code(link), url=url)
+    return url
 
-        match = re.search(r"album/(\w+)", link)
-        if match:
-            tracks = self.get_album_tracks(match.group(1))
-            link = None
-            ids = [temp["id"] for temp in tracks["items"]]
-            tracks = self.get_tracks(ids)
-
-            for i in tracks:
-                if "external_ids" in i:
-                    try:
-                        image = i["album"]["images"][1]["url"]
-                    except (IndexError, KeyError, TypeError):
-                        image = None
-
-                    if i["external_ids"].get("isrc"):
-                        isrcs.append(
-                            {
-                                "isrc": i["external_ids"]["isrc"],
-                                "image": image,
-                                "track": i,
-                            }
-                        )
-                    else:
-                        isrcs.append("The Track is missing its ISRC on Spotify.")
-                else:
-                    return "Error in get_isrc"
 
-            return isrcs
+def _track_image(track):
+    try:
+        return track["album"]["images"][1]["url"]
+    except (IndexError, KeyError, TypeError):
+        return None
+
 
-        else:
-            track = self.get_track(link, track)
-            print(link)
-            if "external_ids" in track:
-                try:
-                    img = track["album"]["images"][1]["url"]
-                except (IndexError, KeyError, TypeError):
-                    img = None
+def _album_isrcs(tracks):
+    """get_isrc's answer for the tracks of an album."""
+    isrcs = []
+    for i in tracks:
+        if "external_ids" in i:
+            if i["external_ids"].get("isrc"):
                 isrcs.append(
                     {
-                        "isrc": track["external_ids"]["isrc"],
-                        "image": img,
-                        "track": track,
+                        "isrc": i["external_ids"]["isrc"],
+                        "image": _track_image(i),
+                        "track": i,
                     }
                 )
-                return isrcs
             else:
-                return "Error in get_isrc"
+                isrcs.append("The Track is missing its ISRC on Spotify.")
+        else:
+            return "Error in get_isrc"
+    return isrcs
+
+
+def _track_isrcs(track):
+    """get_isrc's answer for a single track."""
+    if "external_ids" not in track:
+        return "Error in get_isrc"
+    return [
+        {
+            "isrc": track["external_ids"]["isrc"],
+            "image": _track_image(track),
+            "track": track,
+        }
+    ]
 
-    def artist_albums(self, link, albums=[], offset=0) -> list:
-        data = self.sp.artist_albums(
-            link, limit=50, offset=offset, album_type="album,single,compilation"
+
+def _search_isrcs(data, isrc):
+    """search_by_isrc's answer for a search response."""
+    if data["tracks"]["items"]:
+        track = data["tracks"]["items"][0]
+        if isrc == track["external_ids"]["isrc"]:
+            return [
+                {
+                    "isrc": track["external_ids"]["isrc"],
+                    "image": _track_image(track),
+                    "track": track,
+                }
+            ]
+    return ["No track found with this ISRC"]
+
+
+class SpotifyError(Exception):
+    def __init__(self, status_code, message=None):
+        self.status_code = status_code
+        self.message = message or "Spotify request failed"
+
+    def __str__(self):
+        return f"Spotify error {self.status_code}: {self.message}"
+
+
+class AsyncSpotify:
+    """
+    Spotify Web API client for the serving loop.
+
+    Requests go through the pooled aiohttp session shared with Musixmatch.
+    The client-credentials token is cached until shortly before it expires;
+    concurrent callers wait on a single refresh.
+
+    :param client_id: Defaults to SPOTIPY_CLIENT_ID. Without an id and a
+        secret, requests rotate through the sets of ``credentials``, each
+        with its own cached token.
+    :param credentials: A CredentialRotation, the process-wide one by default.
+    :param discographies: A DiscographyCache, the process-wide one by default.
+    :param batch_window: Seconds single-track lookups of concurrent requests
+        are collected for to share one tracks call; 0 disables batching.
+    :param graph: An IdGraph to serve known tracks from, or None.
+    :param requests_session: An aiohttp session, or a callable returning one.
+    :param retries: Attempts after a 429, 5xx or network error.
+    :param max_retry_after: Longest Retry-After (seconds) worth waiting for;
+        longer ones fail the call right away.
+    """
+
+    retry_codes = (429, 500, 502, 503, 504)
+
+    def __init__(
+        self,
+        client_id=None,
+        client_secret=None,
+        graph=None,
+        requests_session=http_pool.get_session,
+        retries=3,
+        requests_timeout=10,
+        backoff_factor=0.3,
+        max_retry_after=30,
+        credentials=None,
+        discographies=None,
+        batch_window=BATCH_WINDOW,
+    ):
+        self.client_id = client_id or environ.get("SPOTIPY_CLIENT_ID")
+        self.client_secret = client_secret or environ.get("SPOTIPY_CLIENT_SECRET")
+        self.graph = graph
+        self.retries = retries
+        self.requests_timeout = requests_timeout
+        self.backoff_factor = backoff_factor
+        self.max_retry_after = max_retry_after
+        self.credentials = (
+            credentials if credentials is not None else credential_rotation
         )
-        offset = offset + 50
-        albums.extend(data["items"])
-        if data["next"]:
-            return self.artist_albums(link, albums, offset)
+        self.discographies = (
+            discographies if discographies is not None else discography_cache
+        )
+        self._session = requests_session
+        self._track_batcher = (
+            MicroBatcher(self._fetch_tracks, batch_window, PAGE_SIZE)
+            if batch_window
+            else None
+        )
+        # (token, expiry) and pending refresh per credential set
+        self._tokens = {}
+        self._token_refresh = {}
+
+    @property
+    def session(self):
+        if callable(self._session):
+            return self._session()
+        return self._session
+
+    async def _credentials(self):
+        if self.client_id and self.client_secret:
+            return self.client_id, self.client_secret
+        if not self.credentials.loaded:
+            return await asyncio.to_thread(self.credentials.next)
+        return self.credentials.next()
+
+    async def _fetch_token(self, cred):
+        async with self.session.post(
+            TOKEN_URL,
+            data={"grant_type": "client_credentials"},
+            auth=aiohttp.BasicAuth(*cred),
+            timeout=aiohttp.ClientTimeout(total=self.requests_timeout),
+        ) as response:
+            if response.status != 200:
+                raise SpotifyError(response.status, await response.text())
+            data = await response.json()
+        # Renew a minute early so no request goes out with an expiring token
+        expires = time.monotonic() + data.get("expires_in", 3600) - 60
+        self._tokens[cred] = (data["access_token"], expires)
+        return data["access_token"]
+
+    async def _access_token(self):
+        """``(credential set, token)`` for the next request."""
+        cred = await self._credentials()
+        token, expires = self._tokens.get(cred, (None, 0.0))
+        if token and time.monotonic() < expires:
+            return cred, token
+        task = self._token_refresh.get(cred)
+        if (
+            task is None
+            or task.done()
+            or task.get_loop() is not asyncio.get_running_loop()
+        ):
+            task = asyncio.ensure_future(self._fetch_token(cred))
+            self._token_refresh[cred] = task
+        # A cancelled caller mustn't cancel the refresh others are waiting on
+        return cred, await asyncio.shield(task)
+
+    async def _get(self, path, params=None):
+        attempt = 0
+        renewed = False
+        while True:
+            cred, token = await self._access_token()
+            delay = None
+            try:
+                async with self.session.get(
+                    API_URL + path,
+                    params=params,
+                    headers={"Authorization": f"Bearer {token}"},
+                    timeout=aiohttp.ClientTimeout(total=self.requests_timeout),
+                ) as response:
+                    if response.status == 401 and not renewed:
+                        # Revoked or expired early: mint a new token once
+                        renewed = True
+                        if self._tokens.get(cred, (None,))[0] == token:
+                            del self._tokens[cred]
+                        continue
+                    if response.status in self.retry_codes:
+                        delay = retry_after(response.headers)
+                        if delay is not None and delay > self.max_retry_after:
+                            raise SpotifyError(
+                                response.status, f"Retry-After {delay:.0f}s"
+                            )
+                    elif response.status >= 400:
+                        try:
+                            error = (await response.json())["error"]["message"]
+                        except (aiohttp.ContentTypeError, KeyError, TypeError):
+                            error = None
+                        raise SpotifyError(response.status, error)
+                    else:
+                        return await response.json()
+            except (TimeoutError, aiohttp.ClientError) as e:
+                logging.warning(f"Spotify request {path} failed: {e}")
+
+            attempt += 1
+            if attempt > self.retries:
+                raise SpotifyError(503, f"{path} failed after {self.retries} retries")
+            await asyncio.sleep(
+                delay if delay is not None else backoff(attempt, self.backoff_factor)
+            )
+
+    async def _fetch_all(self, fn, args):
+        results = await bounded_map(fn, args, limit=FETCH_CONCURRENCY)
+        if results.failed:
+            raise results[results.failed[0]]
+        return list(results)
+
+    async def get_track(self, link=None, track=None) -> dict:
+        if link is not None:
+            track = get_spotify_id(link)
+        if self.graph is not None:
+            known = await asyncio.to_thread(self.graph.get, idgraph.SPOTIFY, track)
+            if known:
+                return known
+        if self._track_batcher is not None and _TRACK_ID.fullmatch(track or ""):
+            found = await self._track_batcher.get(track)
+            if found is None:
+                raise SpotifyError(404, "Non existing id")
         else:
-            return albums
+            found = await self._get(f"tracks/{track}")
+        await self._remember([found])
+        return found
 
-    def get_spotify_id(self, link):
-        match = re.search(r"track/(\w+)", link)
-        if match:
-            return match.group(1)
+    async def get_album_tracks(self, id: str) -> dict:
+        """The album's whole tracklist; pages past the first are fetched together."""
+        path = f"albums/{id}/tracks"
+        first = await self._get(path, {"limit": PAGE_SIZE})
+        if not first.get("next"):
+            return first
+        offsets = range(len(first["items"]), first["total"], PAGE_SIZE)
+        pages = await self._fetch_all(
+            lambda offset: self._get(path, {"limit": PAGE_SIZE, "offset": offset}),
+            list(offsets),
+        )
+        items = list(first["items"])
+        for page in pages:
+            items.extend(page["items"])
+        return {**first, "items": items, "next": None}
+
+    async def _fetch_tracks(self, ids):
+        chunks = [ids[i : i + PAGE_SIZE] for i in range(0, len(ids), PAGE_SIZE)]
+        pages = await self._fetch_all(
+            lambda chunk: self._get("tracks", {"ids": ",".join(chunk)}), chunks
+        )
+        return [track for page in pages for track in page["tracks"]]
+
+    async def get_tracks(self, ids) -> list:
+        if self.graph is None:
+            return await self._fetch_tracks(ids)
+        known = await asyncio.to_thread(_known_tracks, self.graph, ids)
+        missing = [i for i in ids if not known[i]]
+        if missing:
+            fetched = [t for t in await self._fetch_tracks(missing) if t]
+            await self._remember(fetched)
+            known.update((track["id"], track) for track in fetched)
+        return [known[i] for i in ids if known.get(i)]
+
+    async def _remember(self, tracks):
+        if self.graph is not None:
+            await asyncio.to_thread(_remember_tracks, self.graph, tracks)
+
+    async def resolve_short_link(self, link):
+        """Follow a spotify.link redirect without downloading the page."""
+        known = await asyncio.to_thread(_known_short_link, self.graph, link)
+        if known:
+            return known
+        timeout = aiohttp.ClientTimeout(total=SHORT_LINK_TIMEOUT)
+        async with self.session.head(
+            link, allow_redirects=True, timeout=timeout
+        ) as response:
+            url, refused = str(response.url), response.status >= 400
+        if refused:
+            # Some hosts refuse HEAD; the GET's body is never read
+            async with self.session.get(link, timeout=timeout) as response:
+                url = str(response.url)
+        return await asyncio.to_thread(_remember_short_link, self.graph, link, url)
 
-        match = re.search(r"artist/(\w+)", link)
+    async def get_isrc(self, link):
+        if re.search(r"spotify.link/\w+", link):
+            link = await self.resolve_short_link(link)
+
+        match = re.search(r"album/(\w+)", link)
         if match:
-            return match.group(1)
+            tracks = await self.get_album_tracks(match.group(1))
+            ids = [temp["id"] for temp in tracks["items"]]
+            return _album_isrcs(await self.get_tracks(ids))
 
-        return None
+        return _track_isrcs(await self.get_track(link))
 
-    def search_by_isrc(self, isrc):
-        data = self.sp.search(f"isrc:{isrc}")
-        if data["tracks"]["items"]:
-            track = data["tracks"]["items"][0]
-            if isrc == track["external_ids"]["isrc"]:
-                img = track["album"]["images"][1]["url"]
-                return [
-                    {
-                        "isrc": track["external_ids"]["isrc"],
-                        "image": img,
-                        "track": track,
-                    }
-                ]
-        return ["No track found with this ISRC"]
+    async def artist_albums(self, link) -> list:
+        """The artist's releases; pages past the first are fetched together."""
+        artist = get_spotify_id(link) or link
+        cached = self.discographies.get(artist)
+        if cached is not None:
+            return cached
+
+        def page(offset):
+            return self._get(
+                f"artists/{artist}/albums",
+                {"limit": PAGE_SIZE, "offset": offset, "include_groups": ALBUM_GROUPS},
+            )
+
+        first = await page(0)
+        offsets = range(PAGE_SIZE, first["total"], PAGE_SIZE) if first["next"] else []
+        pages = await self._fetch_all(page, list(offsets))
+        return self.discographies.set(artist, _unique_albums([first, *pages]))
+
+    async def search_by_isrc(self, isrc):
+        data = await self._get("search", {"q": f"isrc:{isrc}", "type": "track"})
+        return _search_isrcs(data, isrc)
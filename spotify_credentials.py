@@ -0,0 +1,131 @@
+"""Spotify client-credential sets, rotated in process and resynced from Redis."""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+
+import redis
+
+# JSON document holding {"cred": [[client_id, client_secret], ...], "rr": n}
+REDIS_KEY = "spotify"
+
+
+def env_credentials():
+    """The set configured through SPOTIPY_CLIENT_ID/SECRET, or None."""
+    client_id = os.environ.get("SPOTIPY_CLIENT_ID")
+    client_secret = os.environ.get("SPOTIPY_CLIENT_SECRET")
+    return (client_id, client_secret) if client_id and client_secret else None
+
+
+def _redis():
+    return redis.Redis(
+        host=os.environ.get("REDIS_HOST"),
+        port=os.environ.get("REDIS_PORT"),
+        password=os.environ.get("REDIS_PASSWD"),
+    )
+
+
+class CredentialRotation:
+    """
+    Hand out the credential sets stored in Redis round robin, from memory.
+
+    The sets are read once and then again every ``sync_interval`` seconds on
+    a background thread; requests never wait on Redis after the first load.
+    Each sync also advances the shared ``rr`` index, so workers start their
+    rotation on different sets. When Redis has no sets,
+    SPOTIPY_CLIENT_ID/SECRET are used.
+
+    :param sync_interval: Seconds the sets are used before Redis is re-read.
+    :param redis_factory: Returns a Redis client; closed after every sync.
+    """
+
+    def __init__(self, sync_interval=300, redis_factory=_redis):
+        self.sync_interval = sync_interval
+        self._redis_factory = redis_factory
+        self._sets = []
+        self._position = 0
+        self._synced_at = None
+        self._lock = threading.Lock()
+        self._syncing = False
+
+    def __len__(self):
+        return len(self._sets)
+
+    @property
+    def loaded(self):
+        return self._synced_at is not None
+
+    def sync(self):
+        """Reload the sets from Redis and take the next ``rr`` start."""
+        r = self._redis_factory()
+        try:
+            doc = r.json().get(REDIS_KEY, "$")
+            doc = doc[0] if doc else {}
+            sets = [(cred[0], cred[1]) for cred in doc.get("cred", [])]
+            start = doc.get("rr", 0)
+            if sets:
+                r.json().set(REDIS_KEY, "$.rr", (start + 1) % len(sets))
+        finally:
+            r.close()
+
+        if not sets:
+            logging.warning(
+                "No Spotify credentials found in Redis (key: 'spotify'). Using environment variables or failing."
+            )
+            env = env_credentials()
+            sets = [env] if env else []
+        with self._lock:
+            if self._synced_at is None:
+                self._position = start
+            self._sets = sets
+            self._synced_at = time.monotonic()
+        logging.info(f"Loaded {len(sets)} Spotify credential set(s)")
+
+    def _safe_sync(self):
+        try:
+            self.sync()
+        except Exception as e:
+            logging.error(f"Failed to load Spotify credentials from Redis: {e}")
+            with self._lock:
+                if not self._sets and env_credentials():
+                    self._sets = [env_credentials()]
+                # Don't hammer a Redis that is down, try again after the interval
+                self._synced_at = time.monotonic()
+        finally:
+            self._syncing = False
+
+    def _sync_in_background(self):
+        with self._lock:
+            if self._syncing:
+                return
+            self._syncing = True
+        threading.Thread(target=self._safe_sync, daemon=True).start()
+
+    def next(self):
+        """The next (client_id, client_secret); only the first call blocks on Redis."""
+        if self._synced_at is None:
+            self._safe_sync()
+        elif time.monotonic() - self._synced_at > self.sync_interval:
+            self._sync_in_background()
+        with self._lock:
+            if not self._sets:
+                raise ValueError(
+                    "Spotify credentials not found in Redis or Environment variables."
+                )
+            cred = self._sets[self._position % len(self._sets)]
+            self._position += 1
+            return cred
+
+    async def start(self):
+        """Load the sets before the first request needs them."""
+        # Clients only rotate when no SPOTIPY_CLIENT_ID/SECRET is configured
+        if self._synced_at is None and not env_credentials():
+            await asyncio.to_thread(self._safe_sync)
+
+
+# Shared by every Spotify client in the process
+credential_rotation = CredentialRotation(
+    sync_interval=float(os.environ.get("SPOTIFY_CREDENTIALS_TTL", 300))
+)
@@ -136,6 +136,68 @@ if (howToUseCloseBtn && howToUseModal) {
   });
 }
 
+// Streamed results: the page arrives empty and each track card is pushed
+// over Server-Sent Events as soon as its links are resolved.
+const streamTarget = document.querySelector("#track-cards[data-stream-url]");
+
+if (streamTarget) {
+  // Translated by the template, like every other string on the page
+  const loadingText = streamTarget.dataset.loadingText;
+  const loadingSpinner = document.querySelector("#loading");
+  if (loadingSpinner) loadingSpinner.style.display = "block";
+
+  const source = new EventSource(streamTarget.dataset.streamUrl);
+  let received = 0;
+
+  const finish = () => {
+    source.close();
+    if (loadingSpinner) loadingSpinner.style.display = "none";
+  };
+
+  source.addEventListener("start", (event) => {
+    const { total } = JSON.parse(event.data);
+    const slots = [];
+    for (let i = 0; i < total; i++) {
+      slots.push(
+        '<div class="col-sm-6 col-md-4 col-lg-3" data-index="' +
+          i +
+          '"><div class="card card-pending"><div class="card-details">' +
+          '<p class="card-text">' +
+          escapeHtml(loadingText) +
+          "</p></div></div></div>",
+      );
+    }
+    streamTarget.innerHTML = slots.join("");
+  });
+
+  source.addEventListener("track", (event) => {
+    const { index, html } = JSON.parse(event.data);
+    const slot = streamTarget.querySelector('[data-index="' + index + '"]');
+    if (slot) {
+      // Cards are rendered by the server from the same template as before
+      slot.outerHTML = html;
+      received++;
+    }
+  });
+
+  source.addEventListener("failed", (event) => {
+    const { html } = JSON.parse(event.data);
+    streamTarget.insertAdjacentHTML("beforeend", html);
+  });
+
+  source.addEventListener("done", finish);
+
+  source.onerror = () => {
+    finish();
+    // Without a stream (e.g. a proxy dropped it) fall back to the full page
+    if (!received) {
+      const url = new URL(window.location.href);
+      url.searchParams.set("stream", "0");
+      window.location.replace(url);
+    }
+  };
+}
+
 // History modal elements
 const historyModal = document.getElementById("history-modal");
 const historyModalClose = document.getElementById("history-modal-close");
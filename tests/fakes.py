@@ -0,0 +1,81 @@
+"""Fake aiohttp sessions and responses shared by the client tests."""
+
+import json
+
+import aiohttp
+
+
+class FakeContent:
+    """``response.content``: the body in chunks, counting the ones read."""
+
+    def __init__(self, data, chunk_size):
+        self.chunks = [
+            data[i : i + chunk_size] for i in range(0, len(data), chunk_size)
+        ]
+        self.read = 0
+
+    async def iter_chunked(self, size):
+        for chunk in self.chunks:
+            self.read += 1
+            yield chunk
+
+
+class FakeResponse:
+    """
+    An aiohttp response. A str ``body`` is the page text; anything else is
+    what ``json()`` returns.
+    """
+
+    def __init__(self, status=200, body=None, headers=None, url=None, chunk_size=64):
+        self.status = status
+        self.headers = headers or {}
+        self.url = url
+        self.charset = "utf-8"
+        self._body = body
+        self.content = FakeContent(self._text().encode(), chunk_size)
+
+    def _text(self):
+        return self._body if isinstance(self._body, str) else json.dumps(self._body)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise aiohttp.ClientResponseError(None, (), status=self.status)
+
+    async def json(self):
+        return self._body
+
+    async def text(self):
+        return self._text()
+
+
+class FakeSession:
+    """
+    An aiohttp session answering from ``responses``: a list handed out in
+    order, or ``responses(method, url, **kwargs)``. Every request is kept
+    in ``calls`` as ``(method, url, kwargs)``.
+    """
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.calls = []
+
+    def request(self, method, url, **kwargs):
+        self.calls.append((method, url, kwargs))
+        if callable(self.responses):
+            return self.responses(method, url, **kwargs)
+        return self.responses.pop(0)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.request("HEAD", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
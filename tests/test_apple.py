@@ -1,8 +1,12 @@
-from unittest.mock import Mock
+import asyncio
+import json
+import threading
 
 import pytest
+from fakes import FakeResponse, FakeSession
 
-from apple import AppleMusic
+import apple
+from apple import AppleMusic, page_data, page_key, scan_page, soup_page
 
 
 @pytest.fixture
@@ -10,11 +14,14 @@ def apple_music():
     return AppleMusic()
 
 
-def test_get_apple_music_data_success(apple_music, mocker):
-    # Mock response
-    mock_response = Mock()
-    mock_response.status_code = 200
+async def fetch(apple_music, link, response):
+    return await apple_music.fetch_apple_music_data(
+        link, session=FakeSession([response])
+    )
 
+
+@pytest.mark.asyncio
+async def test_fetch_apple_music_data_success(apple_music):
     # Sample HTML with JSON-LD
     html_content = """
     <html>
@@ -44,12 +51,10 @@ def test_get_apple_music_data_success(apple_music, mocker):
     <body></body>
     </html>
     """
-    mock_response.text = html_content
-
-    # Mock session.get
-    mocker.patch.object(apple_music.session, "get", return_value=mock_response)
 
-    result = apple_music.get_apple_music_data("https://music.apple.com/test")
+    result = await fetch(
+        apple_music, "https://music.apple.com/test", FakeResponse(body=html_content)
+    )
 
     assert len(result) == 1
     track = result[0]
@@ -59,10 +64,8 @@ def test_get_apple_music_data_success(apple_music, mocker):
     assert track["track"]["album"]["name"] == "Test Album"
 
 
-def test_get_apple_music_data_opengraph_fallback(apple_music, mocker):
-    mock_response = Mock()
-    mock_response.status_code = 200
-
+@pytest.mark.asyncio
+async def test_fetch_apple_music_data_opengraph_fallback(apple_music):
     html_content = """
     <html>
     <head>
@@ -72,11 +75,10 @@ def test_get_apple_music_data_opengraph_fallback(apple_music, mocker):
     <body></body>
     </html>
     """
-    mock_response.text = html_content
 
-    mocker.patch.object(apple_music.session, "get", return_value=mock_response)
-
-    result = apple_music.get_apple_music_data("https://music.apple.com/fallback")
+    result = await fetch(
+        apple_music, "https://music.apple.com/fallback", FakeResponse(body=html_content)
+    )
 
     assert len(result) == 1
     track = result[0]
@@ -86,13 +88,171 @@ def test_get_apple_music_data_opengraph_fallback(apple_music, mocker):
     assert track["image"] == "http://example.com/og_image.jpg"
 
 
-def test_get_apple_music_data_error(apple_music, mocker):
-    mock_response = Mock()
-    mock_response.status_code = 404
-
-    mocker.patch.object(apple_music.session, "get", return_value=mock_response)
-
-    result = apple_music.get_apple_music_data("https://music.apple.com/error")
+@pytest.mark.asyncio
+async def test_fetch_apple_music_data_error(apple_music):
+    result = await fetch(
+        apple_music, "https://music.apple.com/error", FakeResponse(404, body="")
+    )
 
     assert len(result) == 1
     assert "Error" in result[0]
+
+
+def test_scan_page_matches_soup_on_varied_markup():
+    page = """
+    <HTML><head>
+    <meta content="Song &amp; Co by Artist" property="og:title">
+    <meta property='og:image' content='http://example.com/a.jpg'/>
+    <meta property="og:title" content="ignored second title">
+    <script id="schema" TYPE="application/ld+json">{"@type": "MusicAlbum"}</script>
+    <script type="application/json">{"@type": "MusicRecording"}</script>
+    </head></HTML>
+    """
+
+    assert scan_page(page) == soup_page(page)
+    assert scan_page(page) == (
+        ['{"@type": "MusicAlbum"}'],
+        {"og:title": "Song & Co by Artist", "og:image": "http://example.com/a.jpg"},
+    )
+
+
+@pytest.mark.asyncio
+async def test_page_data_falls_back_to_soup(apple_music):
+    # A ">" inside an attribute throws the scanner off
+    page = """
+    <script data-note="a>b" type="application/ld+json">
+    {"@type": "MusicRecording", "name": "Song", "isrc": "ISRC1"}
+    </script>
+    """
+
+    result = await fetch(
+        apple_music, "https://music.apple.com/song", FakeResponse(body=page)
+    )
+
+    assert result[0]["isrc"] == "ISRC1"
+
+
+LD_HEAD = """<html><head>
+<script type="application/ld+json">
+{"@type": "MusicRecording", "name": "Song", "isrc": "ISRC1"}
+</script>
+</head>"""
+
+
+@pytest.mark.asyncio
+async def test_fetch_stops_reading_after_the_head(apple_music):
+    response = FakeResponse(body=LD_HEAD + "<body>" + "x" * 10_000 + "</body></html>")
+
+    result = await apple_music.fetch_apple_music_data(
+        "https://music.apple.com/song", session=FakeSession([response])
+    )
+
+    assert result[0]["isrc"] == "ISRC1"
+    assert response.content.read < len(response.content.chunks) / 10
+
+
+@pytest.mark.asyncio
+async def test_fetch_reads_on_when_the_head_has_no_data(apple_music):
+    page = (
+        "<html><head><title>x</title></head><body>"
+        + LD_HEAD.split("<head>")[1].replace("</head>", "")
+        + "</body></html>"
+    )
+    response = FakeResponse(body=page)
+
+    result = await apple_music.fetch_apple_music_data(
+        "https://music.apple.com/song", session=FakeSession([response])
+    )
+
+    assert result[0]["isrc"] == "ISRC1"
+    assert response.content.read == len(response.content.chunks)
+
+
+@pytest.mark.asyncio
+async def test_fetch_rejects_other_hosts(apple_music):
+    result = await apple_music.fetch_apple_music_data("https://example.com/x")
+
+    assert result == ["Error: Invalid hostname"]
+
+
+def test_song_links_into_an_album_share_its_page_key():
+    album = ("album", "us", "123", "")
+    assert page_key("https://music.apple.com/us/album/name/123?i=456") == album
+    assert page_key("https://music.apple.com/us/album/name/123?i=789") == album
+    assert page_key("https://music.apple.com/us/album/123") == album
+    assert page_key("https://music.apple.com/album/123") == ("album", "", "123", "")
+    assert page_key("https://music.apple.com/id/album/x/123?l=en") == (
+        "album",
+        "id",
+        "123",
+        "en",
+    )
+    assert page_key("https://music.apple.com/us/browse") is None
+
+
+@pytest.mark.asyncio
+async def test_album_is_fetched_once_for_every_song_link(apple_music):
+    album = {
+        "@type": "MusicAlbum",
+        "name": "Album",
+        "tracks": [
+            {"name": f"Song {n}", "isrc": f"ISRC{n}", "url": f"/album/x/123?i={n}"}
+            for n in (456, 789)
+        ],
+    }
+    page = (
+        f'<html><head><script type="application/ld+json">{json.dumps(album)}'
+        "</script></head></html>"
+    )
+    session = FakeSession(lambda method, url, **kwargs: FakeResponse(body=page))
+    songs = await asyncio.gather(
+        *(
+            apple_music.fetch_apple_music_data(
+                f"https://music.apple.com/us/album/x/123?i={n}", session=session
+            )
+            for n in (456, 789, 456)
+        )
+    )
+    whole = await apple_music.fetch_apple_music_data(
+        "https://music.apple.com/us/album/x/123", session=session
+    )
+
+    assert [s[0]["isrc"] for s in songs] == ["ISRC456", "ISRC789", "ISRC456"]
+    assert len(whole) == 2
+    assert [url for _, url, _ in session.calls] == [
+        "https://music.apple.com/us/album/x/123"
+    ]
+
+
+@pytest.mark.asyncio
+async def test_large_pages_are_parsed_in_the_pool(monkeypatch):
+    calls = []
+
+    class Pool:
+        async def run(self, fn, page):
+            calls.append(len(page))
+            return fn(page)
+
+    monkeypatch.setattr(apple, "PARSE_PROCESS_MIN_BYTES", 1000)
+    apple_music = AppleMusic(parse_pool=Pool())
+    small = LD_HEAD + "</html>"
+    large = LD_HEAD + "<body>" + "x" * 2000 + "</body></html>"
+
+    assert await apple_music._parse(small, len(small)) == page_data(small)
+    assert await apple_music._parse(large, len(large)) == page_data(large)
+    assert calls == [len(large)]
+
+
+@pytest.mark.asyncio
+async def test_pages_are_parsed_off_the_loop_without_a_pool(monkeypatch):
+    threads = []
+
+    def recording_page_data(page):
+        threads.append(threading.get_ident())
+        return page_data(page)
+
+    monkeypatch.setattr(apple, "page_data", recording_page_data)
+    apple_music = AppleMusic(parse_pool=None)
+
+    assert await apple_music._parse(LD_HEAD, len(LD_HEAD)) == page_data(LD_HEAD)
+    assert threads and threads[0] != threading.get_ident()
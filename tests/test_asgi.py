@@ -0,0 +1,198 @@
+import asyncio
+
+import pytest
+from flask import Flask, Response, current_app, request
+
+from asgi import FlaskASGI
+
+
+async def call(asgi_app, path, query=b"", headers=()):
+    scope = {
+        "type": "http",
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "root_path": "",
+        "query_string": query,
+        "headers": list(headers),
+        "server": ("testserver", 80),
+        "client": ("127.0.0.1", 1234),
+    }
+    messages = []
+    sent_request = False
+
+    async def receive():
+        nonlocal sent_request
+        if not sent_request:
+            sent_request = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await asyncio.Event().wait()
+
+    async def send(message):
+        messages.append(message)
+
+    await asgi_app(scope, receive, send)
+    status = messages[0]["status"]
+    body = b"".join(m.get("body", b"") for m in messages[1:])
+    return status, dict(messages[0]["headers"]), body
+
+
+@pytest.fixture
+def flask_app():
+    app = Flask(__name__)
+    app.loops = []
+
+    @app.route("/async")
+    async def async_view():
+        app.loops.append(asyncio.get_running_loop())
+        return f"hello {request.args.get('name')}"
+
+    @app.route("/sync-wrapped")
+    def sync_wrapped_view():
+        async def inner():
+            app.loops.append(asyncio.get_running_loop())
+            return request.cookies.get("lang", "none")
+
+        return current_app.ensure_sync(inner)()
+
+    @app.route("/stream")
+    def stream_view():
+        return Response(iter([b"a", b"b", b"c"]))
+
+    @app.after_request
+    def add_header(response):
+        response.headers["X-After"] = "1"
+        return response
+
+    return app
+
+
+@pytest.mark.asyncio
+async def test_async_views_share_the_serving_loop(flask_app):
+    asgi_app = FlaskASGI(flask_app)
+
+    status, headers, body = await call(asgi_app, "/async", b"name=mxm")
+    await call(asgi_app, "/async")
+
+    assert status == 200
+    assert body == b"hello mxm"
+    assert headers[b"x-after"] == b"1"
+    assert flask_app.loops == [asyncio.get_running_loop()] * 2
+
+
+@pytest.mark.asyncio
+async def test_sync_views_run_coroutines_on_the_serving_loop(flask_app):
+    asgi_app = FlaskASGI(flask_app)
+
+    status, _, body = await call(
+        asgi_app,
+        "/sync-wrapped",
+        headers=[(b"cookie", b"a=1"), (b"cookie", b"lang=id")],
+    )
+
+    assert status == 200
+    assert body == b"id"
+    assert flask_app.loops == [asyncio.get_running_loop()]
+
+
+@pytest.mark.asyncio
+async def test_streamed_and_missing_routes(flask_app):
+    asgi_app = FlaskASGI(flask_app)
+
+    assert (await call(asgi_app, "/stream"))[2] == b"abc"
+    assert (await call(asgi_app, "/missing"))[0] == 404
+
+
+@pytest.mark.asyncio
+async def test_async_bodies_are_sent_as_they_are_produced():
+    app = Flask(__name__)
+
+    @app.route("/events")
+    def events_view():
+        async def events():
+            yield "data: 1\n\n"
+            await asyncio.sleep(0)
+            yield b"data: 2\n\n"
+
+        return Response(events(), mimetype="text/event-stream")
+
+    status, headers, body = await call(FlaskASGI(app), "/events")
+
+    assert status == 200
+    assert headers[b"content-type"] == b"text/event-stream; charset=utf-8"
+    assert body == b"data: 1\n\ndata: 2\n\n"
+
+
+@pytest.mark.asyncio
+async def test_lifespan_runs_hooks(flask_app):
+    events = []
+
+    async def startup():
+        events.append("startup")
+
+    async def shutdown():
+        events.append("shutdown")
+
+    asgi_app = FlaskASGI(flask_app, on_startup=[startup], on_shutdown=[shutdown])
+    incoming = iter([{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}])
+    sent = []
+
+    async def receive():
+        return next(incoming)
+
+    async def send(message):
+        sent.append(message["type"])
+
+    await asgi_app({"type": "lifespan"}, receive, send)
+
+    assert events == ["startup", "shutdown"]
+    assert sent == ["lifespan.startup.complete", "lifespan.shutdown.complete"]
+
+
+@pytest.mark.asyncio
+async def test_client_disconnect_cancels_the_view():
+    app = Flask(__name__)
+    cancelled = asyncio.Event()
+
+    @app.route("/slow")
+    async def slow_view():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+        return "done"
+
+    incoming = iter(
+        [
+            {"type": "http.request", "body": b"", "more_body": False},
+            {"type": "http.disconnect"},
+        ]
+    )
+
+    async def receive():
+        message = next(incoming)
+        if message["type"] == "http.disconnect":
+            await asyncio.sleep(0.01)
+        return message
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http",
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/slow",
+        "root_path": "",
+        "query_string": b"",
+        "headers": [],
+    }
+    await asyncio.wait_for(FlaskASGI(app)(scope, receive, send), 1)
+
+    assert cancelled.is_set()
+    assert sent == []
@@ -0,0 +1,226 @@
+import asyncio
+
+import pytest
+from fakes import FakeResponse, FakeSession
+
+from Asyncmxm import (
+    MemoryCache,
+    Musixmatch,
+    MXMException,
+    RateLimiter,
+    ResponseCache,
+    RetryBudget,
+    SingleFlight,
+)
+from Asyncmxm.ratelimit import TokenBucket, retry_after
+from keypool import EXHAUSTED, KeyPool
+
+
+def make_client(key, group):
+    return Musixmatch(key, requests_session=lambda: None, singleflight=group)
+
+
+@pytest.mark.asyncio
+async def test_identical_calls_are_coalesced(mocker):
+    group = SingleFlight()
+    calls = []
+
+    async def fake_request(self, method, api_method, params):
+        calls.append(params["track_isrc"])
+        await asyncio.sleep(0.01)
+        return {"message": {"body": {"track": {"commontrack_id": 1}}}}
+
+    mocker.patch.object(Musixmatch, "_request", fake_request)
+    clients = [make_client(f"key{i}", group) for i in range(5)]
+
+    results = await asyncio.gather(
+        *(c.track_get(track_isrc="ISRC1") for c in clients),
+        clients[0].track_get(track_isrc="ISRC2"),
+    )
+
+    assert sorted(calls) == ["ISRC1", "ISRC2"]
+    assert group.saved == 4
+    assert all(r == results[0] for r in results[:5])
+    # Each caller gets its own copy to mutate
+    results[1]["message"]["body"]["track"]["isrc"] = "changed"
+    assert "isrc" not in results[2]["message"]["body"]["track"]
+
+
+@pytest.mark.asyncio
+async def test_coalesced_errors_reach_every_caller(mocker):
+    group = SingleFlight()
+
+    async def fake_request(self, method, api_method, params):
+        await asyncio.sleep(0.01)
+        raise MXMException(404, None)
+
+    mocker.patch.object(Musixmatch, "_request", fake_request)
+    client = make_client("key", group)
+
+    results = await asyncio.gather(
+        client.track_get(track_isrc="ISRC1"),
+        client.track_get(track_isrc="ISRC1"),
+        return_exceptions=True,
+    )
+
+    assert [r.status_code for r in results] == [404, 404]
+    assert group.saved == 1
+
+
+OK_BODY = {"message": {"header": {"status_code": 200}, "body": {}}}
+
+
+@pytest.mark.asyncio
+async def test_retry_after_pauses_the_key(mocker):
+    sleep = mocker.patch("Asyncmxm.ratelimit.asyncio.sleep")
+    limiter = RateLimiter(rate=100, burst=100)
+    session = FakeSession(
+        [FakeResponse(429, headers={"Retry-After": "2"}), FakeResponse(200, OK_BODY)]
+    )
+    client = Musixmatch(
+        "key", requests_session=lambda: session, singleflight=None, rate_limiter=limiter
+    )
+
+    assert await client.track_get(track_isrc="ISRC1") == OK_BODY
+    assert len(session.calls) == 2
+    # The second attempt queued behind the 2 second pause
+    assert sleep.await_args.args[0] == pytest.approx(2, abs=0.1)
+
+
+@pytest.mark.asyncio
+async def test_client_errors_are_not_retried(mocker):
+    mocker.patch("Asyncmxm.client.asyncio.sleep")
+    session = FakeSession([FakeResponse(404), FakeResponse(200, OK_BODY)])
+    client = Musixmatch("key", requests_session=lambda: session, singleflight=None)
+
+    with pytest.raises(MXMException) as error:
+        await client.track_get(track_isrc="ISRC1")
+    assert error.value.status_code == 404
+    assert len(session.calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_exhausted_retry_budget_stops_retrying(mocker):
+    mocker.patch("Asyncmxm.client.asyncio.sleep")
+    session = FakeSession([FakeResponse(503), FakeResponse(200, OK_BODY)])
+    client = Musixmatch(
+        "key",
+        requests_session=lambda: session,
+        singleflight=None,
+        retry_budget=RetryBudget(min_per_second=0, max_tokens=0),
+    )
+
+    with pytest.raises(Exception, match="failed after retries"):
+        await client.track_get(track_isrc="ISRC1")
+    assert len(session.calls) == 1
+
+
+def test_token_bucket_queues_reservations():
+    bucket = TokenBucket(rate=10, burst=2)
+
+    delays = [bucket.reserve() for _ in range(4)]
+
+    assert delays[:2] == [0, 0]
+    assert delays[2] == pytest.approx(0.1, abs=0.01)
+    assert delays[3] == pytest.approx(0.2, abs=0.01)
+
+
+def test_retry_after_parsing():
+    assert retry_after({"Retry-After": "3"}) == 3
+    assert retry_after({}) is None
+    assert retry_after({"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"}) == 0
+
+
+def quota_body(status_code):
+    return {"message": {"header": {"status_code": status_code}, "body": ""}}
+
+
+@pytest.mark.asyncio
+async def test_key_pool_fails_over_on_quota_errors():
+    pool = KeyPool(["key1", "key2", "key3"])
+    session = FakeSession(
+        [FakeResponse(200, quota_body(401)), FakeResponse(200, OK_BODY)]
+    )
+    client = Musixmatch(
+        None, requests_session=lambda: session, singleflight=None, key_pool=pool
+    )
+
+    assert await client.track_get(track_isrc="ISRC1") == OK_BODY
+    assert pool.state("key1") == EXHAUSTED
+    assert len(session.calls) == 2
+    assert pool.acquire() == "key3"  # key2 served a call already
+
+
+@pytest.mark.asyncio
+async def test_key_pool_gives_up_when_every_key_is_exhausted():
+    pool = KeyPool(["key1", "key2"])
+    session = FakeSession([FakeResponse(200, quota_body(402)) for _ in range(2)])
+    client = Musixmatch(
+        None, requests_session=lambda: session, singleflight=None, key_pool=pool
+    )
+
+    with pytest.raises(MXMException):
+        await client.track_get(track_isrc="ISRC1")
+    with pytest.raises(MXMException):
+        pool.acquire()
+
+
+@pytest.mark.asyncio
+async def test_response_cache_is_shared_across_keys(mocker):
+    cache = ResponseCache(MemoryCache())
+    calls = []
+
+    async def fake_request(self, method, api_method, params):
+        calls.append(params["track_isrc"])
+        return {"message": {"body": {"track": {"commontrack_id": 1}}}}
+
+    mocker.patch.object(Musixmatch, "_request", fake_request)
+    first = Musixmatch("key1", requests_session=lambda: None, cache=cache)
+    second = Musixmatch("key2", requests_session=lambda: None, cache=cache)
+
+    res = await first.track_get(track_isrc="ISRC1")
+    res["message"]["body"]["track"]["commontrack_id"] = 2
+    assert await second.track_get(track_isrc="ISRC1") == {
+        "message": {"body": {"track": {"commontrack_id": 1}}}
+    }
+    assert calls == ["ISRC1"]
+    assert cache.hits == 1
+
+    refreshing = Musixmatch(
+        "key1", requests_session=lambda: None, cache=cache, refresh_cache=True
+    )
+    await refreshing.track_get(track_isrc="ISRC1")
+    assert calls == ["ISRC1", "ISRC1"]
+
+
+@pytest.mark.asyncio
+async def test_response_cache_remembers_not_found(mocker):
+    cache = ResponseCache(MemoryCache(), negative_ttl=60)
+    calls = []
+
+    async def fake_request(self, method, api_method, params):
+        calls.append(params["track_isrc"])
+        raise MXMException(404, None)
+
+    mocker.patch.object(Musixmatch, "_request", fake_request)
+    client = Musixmatch("key", requests_session=lambda: None, cache=cache)
+
+    for _ in range(2):
+        with pytest.raises(MXMException) as e:
+            await client.track_get(track_isrc="MISSING")
+        assert e.value.status_code == 404
+    assert calls == ["MISSING"]
+
+
+@pytest.mark.asyncio
+async def test_memory_cache_evicts_and_expires():
+    backend = MemoryCache(maxsize=2)
+    await backend.set("a", "1", 60)
+    await backend.set("b", "2", 60)
+    await backend.get("a")
+    await backend.set("c", "3", 60)
+    assert await backend.get("b") is None
+    assert await backend.get("a") == "1"
+
+    await backend.set("d", "4", 0)
+    assert await backend.get("d") is None
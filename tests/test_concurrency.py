@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+
+from concurrency import MicroBatcher, ProcessOffload, bounded_map
+
+
+@pytest.mark.asyncio
+async def test_bounded_map_limits_concurrency_and_keeps_order():
+    running = 0
+    peak = 0
+
+    async def fn(i):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.001 * (10 - i))
+        running -= 1
+        if i == 3:
+            raise ValueError("boom")
+        return i * 2
+
+    results = await bounded_map(fn, range(10), limit=3, on_error=lambda i, e: str(e))
+
+    assert peak == 3
+    assert results == [0, 2, 4, "boom", 8, 10, 12, 14, 16, 18]
+    assert results.failed == [3]
+
+
+@pytest.mark.asyncio
+async def test_cancelling_the_caller_cancels_outstanding_calls():
+    started = []
+    cancelled = []
+
+    async def fn(i):
+        started.append(i)
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(i)
+            raise
+
+    task = asyncio.create_task(bounded_map(fn, range(5), limit=2))
+    await asyncio.sleep(0.01)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    assert started == [0, 1]
+    assert sorted(cancelled) == [0, 1]
+
+
+@pytest.mark.asyncio
+async def test_micro_batcher_shares_calls_between_callers():
+    calls = []
+
+    async def fetch_many(keys):
+        calls.append(keys)
+        return [k.upper() for k in keys]
+
+    batcher = MicroBatcher(fetch_many, window=0.01, max_size=3)
+
+    results = await asyncio.gather(*(batcher.get(k) for k in "abacde"))
+
+    assert results == ["A", "B", "A", "C", "D", "E"]
+    # Full batches go out at once, the rest after the window
+    assert calls == [["a", "b", "c"], ["d", "e"]]
+
+
+@pytest.mark.asyncio
+async def test_micro_batcher_errors_reach_every_caller():
+    async def fetch_many(keys):
+        raise ValueError("upstream down")
+
+    batcher = MicroBatcher(fetch_many, window=0.001)
+    results = await asyncio.gather(
+        batcher.get("a"), batcher.get("b"), return_exceptions=True
+    )
+
+    assert [str(r) for r in results] == ["upstream down"] * 2
+
+
+@pytest.mark.asyncio
+async def test_process_offload_runs_in_workers_and_bounds_pending(monkeypatch):
+    offload = ProcessOffload(1, max_pending=2)
+    submitted = 0
+    peak = 0
+    run_in_executor = asyncio.get_running_loop().run_in_executor
+
+    async def counting(executor, fn, *args):
+        nonlocal submitted, peak
+        submitted += 1
+        peak = max(peak, submitted)
+        try:
+            return await run_in_executor(executor, fn, *args)
+        finally:
+            submitted -= 1
+
+    monkeypatch.setattr(asyncio.get_running_loop(), "run_in_executor", counting)
+    try:
+        results = await asyncio.gather(*(offload.run(pow, n, 2) for n in range(6)))
+    finally:
+        await offload.close()
+
+    assert results == [0, 1, 4, 9, 16, 25]
+    assert peak == 2
@@ -0,0 +1,34 @@
+import asyncio
+
+import pytest
+
+import http_pool
+from mxm import MXM
+
+
+@pytest.mark.asyncio
+async def test_get_session_is_shared_within_loop():
+    session = http_pool.get_session()
+    assert http_pool.get_session() is session
+
+    await http_pool.close()
+    assert session.closed
+    assert http_pool.get_session() is not session
+    await http_pool.close()
+
+
+def test_get_session_is_per_loop():
+    async def grab():
+        session = http_pool.get_session()
+        await http_pool.close()
+        return session
+
+    assert asyncio.run(grab()) is not asyncio.run(grab())
+
+
+@pytest.mark.asyncio
+async def test_mxm_borrows_pooled_session():
+    mxm = MXM("key", key2="key2")
+    assert mxm.musixmatch.session is http_pool.get_session()
+    assert mxm.musixmatch2.session is mxm.musixmatch.session
+    await http_pool.close()
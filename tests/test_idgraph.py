@@ -0,0 +1,95 @@
+from unittest.mock import AsyncMock
+
+import pytest
+
+import idgraph
+from idgraph import IdGraph
+from mxm import MXM
+
+
+@pytest.fixture
+def graph(tmp_path):
+    graph = IdGraph(str(tmp_path / "ids.sqlite3"))
+    yield graph
+    graph.close()
+
+
+def test_links_are_directed_and_latest_wins(graph):
+    graph.link(idgraph.ISRC, "ISRC1", commontrack_id=1)
+    graph.link(idgraph.SPOTIFY, "sp1", commontrack_id=2, isrc="ISRC1")
+    graph.link(idgraph.ISRC, "ISRC1", commontrack_id=3)
+
+    assert graph.resolve(idgraph.ISRC, "ISRC1", idgraph.COMMONTRACK_ID) == "3"
+    assert graph.resolve(idgraph.SPOTIFY, "sp1", idgraph.COMMONTRACK_ID) == "2"
+    assert graph.resolve(idgraph.COMMONTRACK_ID, "3", idgraph.ISRC) is None
+
+
+def test_entities_expire(graph):
+    graph.put(idgraph.COMMONTRACK_ID, 1, {"commontrack_id": 1})
+    graph.link(idgraph.ISRC, "ISRC1", commontrack_id=1)
+    assert graph.follow(idgraph.ISRC, "ISRC1", idgraph.COMMONTRACK_ID) == {
+        "commontrack_id": 1
+    }
+
+    graph.max_age = -1
+    assert graph.get(idgraph.COMMONTRACK_ID, 1) is None
+
+
+def test_tracks_expire_sooner(graph):
+    graph.put(idgraph.TRACK_ID, 1, {"track_id": 1})
+    graph.put(idgraph.ALBUM_ID, 2, {"album_id": 2})
+
+    graph.track_max_age = -1
+    assert graph.get(idgraph.TRACK_ID, 1) is None
+    assert graph.get(idgraph.ALBUM_ID, 2) == {"album_id": 2}
+
+
+def test_broken_database_is_a_miss(tmp_path):
+    graph = IdGraph(str(tmp_path / "missing" / "ids.sqlite3"))
+    graph.link(idgraph.ISRC, "ISRC1", commontrack_id=1)
+    assert graph.resolve(idgraph.ISRC, "ISRC1", idgraph.COMMONTRACK_ID) is None
+
+
+@pytest.mark.asyncio
+async def test_mxm_serves_repeat_lookups_from_the_graph(graph):
+    track = {"commontrack_id": 7, "track_id": 70, "album_id": 700}
+    mxm = MXM("key", session=object(), graph=graph)
+    mxm.musixmatch.track_get = AsyncMock(
+        return_value={"message": {"body": {"track": track}}}
+    )
+
+    await mxm.track_get("ISRC7")
+    again = await mxm.track_get("ISRC7")
+
+    assert again["message"]["body"]["track"] == track
+    assert mxm.musixmatch.track_get.await_count == 1
+    assert graph.resolve(idgraph.TRACK_ID, 70, idgraph.COMMONTRACK_ID) == "7"
+
+    # ?refresh=1 goes back to Musixmatch
+    mxm.refresh = True
+    await mxm.track_get("ISRC7")
+    assert mxm.musixmatch.track_get.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_tracks_sharing_a_commontrack_keep_their_own_payload(graph):
+    by_isrc = {"commontrack_id": 7, "track_id": 70, "has_lyrics": 1}
+    by_spotify = {"commontrack_id": 7, "track_id": 71, "has_lyrics": 0}
+    mxm = MXM("key", session=object(), graph=graph)
+    mxm.musixmatch.track_get = AsyncMock(
+        return_value={"message": {"body": {"track": by_isrc}}}
+    )
+    mxm.musixmatch2.matcher_track_get = AsyncMock(
+        return_value={"message": {"body": {"track": by_spotify}}}
+    )
+
+    await mxm.track_get("ISRC7")
+    await mxm.matcher_track("sp7")
+
+    isrc_hit = await mxm.track_get("ISRC7")
+    spotify_hit = await mxm.matcher_track("sp7")
+    assert isrc_hit["message"]["body"]["track"] == by_isrc
+    assert spotify_hit["message"]["body"]["track"] == by_spotify
+    assert mxm.musixmatch.track_get.await_count == 1
+    # Only a commontrack_id lookup answers for the commontrack_id
+    assert graph.resolve(idgraph.COMMONTRACK_ID, 7, idgraph.TRACK_ID) is None
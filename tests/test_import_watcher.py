@@ -0,0 +1,45 @@
+import asyncio
+
+import pytest
+
+from import_watcher import ImportWatcher
+
+
+@pytest.mark.asyncio
+async def test_one_poll_patches_every_waiting_result():
+    watcher = ImportWatcher(first_delay=0.001, max_delay=0.002, give_up_after=5)
+    polls = 0
+    updates = []
+
+    async def resolve():
+        nonlocal polls
+        polls += 1
+        return {"commontrack_id": 1} if polls == 3 else None
+
+    async def update(cache_key, index, link):
+        updates.append((cache_key, index, link["commontrack_id"]))
+
+    watcher.watch("ISRC1", "album:a", 2, resolve, update)
+    watcher.watch("ISRC1", "album:b", 0, resolve, update)
+    assert watcher.watching("album:a")
+
+    while watcher._tasks:
+        await asyncio.sleep(0.005)
+
+    assert polls == 3
+    assert updates == [("album:a", 2, 1), ("album:b", 0, 1)]
+    assert not watcher.watching("album:a")
+
+
+@pytest.mark.asyncio
+async def test_polling_gives_up():
+    watcher = ImportWatcher(first_delay=0.001, max_delay=0.001, give_up_after=0.02)
+
+    async def resolve():
+        return None
+
+    watcher.watch("ISRC1", "album:a", 0, resolve, lambda *args: None)
+    await asyncio.sleep(0.05)
+
+    assert not watcher.watching("album:a")
+    await watcher.close()
@@ -21,7 +21,7 @@ async def test():
     print(f"Testing with link: {link}")
 
     # 1. Get data from Apple Music
-    apple_data = am.get_apple_music_data(link)
+    apple_data = await am.fetch_apple_music_data(link)
     print("Apple Music Data:")
     print(json.dumps(apple_data, indent=2))
 
@@ -0,0 +1,102 @@
+import json
+import time
+
+import pytest
+
+from keypool import EXHAUSTED, THROTTLED, KeyPool, KeyProvider, key_id
+
+
+def test_key_pool_routes_by_least_load():
+    pool = KeyPool(["key1", "key2"])
+
+    first = pool.acquire()
+    second = pool.acquire()
+    pool.release(first)
+
+    assert {first, second} == {"key1", "key2"}
+    assert pool.acquire() == first
+    pool.report(second, 429, retry_after=30)
+    assert pool.state(second) == THROTTLED
+
+
+def test_fallback_keys_wait_for_the_pool():
+    pool = KeyPool(["live"], fallback=["own"])
+
+    assert [pool.acquire() for _ in range(3)] == ["live"] * 3
+    pool.report("live", 402, in_body=True)
+    assert pool.state("live") == EXHAUSTED
+    assert pool.acquire() == "own"
+
+
+def test_http_auth_errors_only_cool_down():
+    pool = KeyPool(["key1"], auth_seconds=30)
+
+    assert pool.report("key1", 401)
+    assert pool.state("key1") == THROTTLED
+    assert pool._health["key1"][1] < time.time() + 31
+
+
+class FakeRedis:
+    def __init__(self, values, health=None):
+        self.values = values
+        self.health = health or {}
+
+    def scan_iter(self, pattern):
+        return [k.encode() for k in self.values]
+
+    def mget(self, names):
+        return [self.values[n].encode() for n in names]
+
+    def hgetall(self, name):
+        return self.health
+
+
+def test_load_from_redis_reads_live_keys_and_shared_health():
+    until = time.time() + 3600
+    r = FakeRedis(
+        {"live:10": "key10", "live:2": "key2", "live:1": "key1"},
+        {key_id("key2").encode(): json.dumps({"state": EXHAUSTED, "until": until})},
+    )
+    pool = KeyPool()
+
+    assert pool.load_from_redis(r) == ["key1", "key2", "key10"]
+    assert pool.state("key2") == EXHAUSTED
+
+
+def test_key_provider_serves_from_memory(mocker):
+    r = FakeRedis({"live:1": "key1"})
+    r.close = lambda: None
+    mocker.patch("keypool.redis.from_url", return_value=r)
+    pool = KeyPool()
+    provider = KeyProvider(pool, redis_url="redis://test", ttl=60)
+    background = mocker.patch.object(provider, "_refresh_in_background")
+
+    # Nothing loaded yet: answer right away and load in the background
+    assert provider.get() == []
+    assert background.call_count == 1
+
+    provider.refresh()
+    r.values["live:1"] = "rotated"
+
+    assert provider.get() == ["key1"]
+    assert "key1" in pool.keys
+    assert background.call_count == 1
+
+
+def test_listener_leaves_the_server_config_alone(mocker):
+    class Stop(BaseException):
+        pass
+
+    r = mocker.Mock()
+    r.config_get.return_value = {"notify-keyspace-events": ""}
+    r.pubsub.return_value.listen.return_value = iter([{"type": "message"}])
+    mocker.patch("keypool.redis.from_url", side_effect=[r, Exception("gone")])
+    mocker.patch("keypool.time.sleep", side_effect=Stop)
+    provider = KeyProvider(KeyPool(), redis_url="redis://test")
+    refresh = mocker.patch.object(provider, "_safe_refresh")
+
+    with pytest.raises(Stop):
+        provider._listen()
+
+    r.config_set.assert_not_called()
+    assert refresh.call_count == 1
@@ -0,0 +1,82 @@
+from links import canonical_key, canonical_link, is_short_link
+
+ALBUM = "4aawyAB9vmqN3uQ7FjRGTy"
+
+
+def test_spotify_link_forms_share_a_key():
+    key = f"spotify:album:{ALBUM}"
+    assert canonical_key(f"https://open.spotify.com/album/{ALBUM}") == key
+    assert (
+        canonical_key(f"https://open.spotify.com/intl-id/album/{ALBUM}?si=abc") == key
+    )
+    assert canonical_key(f"open.spotify.com/embed/album/{ALBUM}") == key
+    assert canonical_key(f"spotify:album:{ALBUM}") == key
+    assert canonical_key(f"https://open.spotify.com/track/{ALBUM}") == (
+        f"spotify:track:{ALBUM}"
+    )
+    assert canonical_key("https://open.spotify.com/user/someone") is None
+
+
+def test_short_links_wait_for_their_redirect():
+    assert is_short_link("https://spotify.link/AbC123")
+    assert canonical_key("https://spotify.link/AbC123") is None
+    assert not is_short_link(f"https://open.spotify.com/album/{ALBUM}")
+
+
+def test_apple_keys_keep_storefront_song_and_language():
+    assert canonical_key("https://music.apple.com/us/album/name/123") == (
+        "apple:album:us:123"
+    )
+    assert canonical_key("https://music.apple.com/us/album/123?uo=4") == (
+        "apple:album:us:123"
+    )
+    assert canonical_key("https://music.apple.com/us/album/name/123?i=456") == (
+        "apple:album:us:123?i=456"
+    )
+    assert canonical_key("https://music.apple.com/id/album/name/123?l=en&i=4") == (
+        "apple:album:id:123?i=4&l=en"
+    )
+    assert canonical_key("https://music.apple.com/us/song/name/456") == (
+        "apple:song:us:456"
+    )
+    assert canonical_key("https://music.apple.evil.com/us/album/123") is None
+
+
+def test_musixmatch_and_isrc_keys():
+    assert canonical_key(
+        "https://www.musixmatch.com/album/Artist/Album-Name/?utm=x"
+    ) == ("mxm:album:Artist/Album-Name")
+    assert canonical_key("https://www.musixmatch.com/lyrics/Artist/Song%20Name") == (
+        "mxm:lyrics:Artist/Song Name"
+    )
+    assert canonical_key(" usaaa1234567 ") == "isrc:USAAA1234567"
+    assert canonical_key("USAAA123456") is None
+
+
+def test_variants_are_looked_up_as_one_link():
+    variants = [
+        [
+            f"spotify:track:{ALBUM}",
+            f"https://open.spotify.com/intl-id/track/{ALBUM}?si=x",
+            f"open.spotify.com/track/{ALBUM}",
+        ],
+        ["usaaa1234567", " USAAA1234567"],
+        [
+            "https://www.musixmatch.com/album/Artist/Album/?utm=1",
+            "https://www.musixmatch.com/album/Artist/Album",
+        ],
+    ]
+    for links in variants:
+        assert len({canonical_link(link) for link in links}) == 1
+        assert len({canonical_key(link) for link in links}) == 1
+        # The link looked up keys to the same entry
+        assert canonical_key(canonical_link(links[0])) == canonical_key(links[0])
+
+    assert canonical_link(f"spotify:track:{ALBUM}") == (
+        f"https://open.spotify.com/track/{ALBUM}"
+    )
+    assert canonical_link("music.apple.com/us/album/name/123?uo=4&i=456#x") == (
+        "https://music.apple.com/us/album/name/123?i=456"
+    )
+    assert canonical_link("not a link") == "not a link"
+    assert canonical_link(None) is None
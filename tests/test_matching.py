@@ -0,0 +1,60 @@
+import itertools
+import random
+
+import matching
+
+
+def src(isrc, name, index, seconds=None):
+    track = {"name": name, "artists": [{"name": "Artist"}]}
+    if seconds:
+        track["duration_ms"] = seconds * 1000
+    return matching.source_features({"isrc": isrc, "track": track}, index)
+
+
+def cand(isrc, name, index, seconds=None):
+    return matching.mxm_features(
+        {
+            "track_isrc": isrc,
+            "track_name": name,
+            "artist_name": "Artist",
+            "track_length": seconds,
+        },
+        index,
+    )
+
+
+def test_isrc_then_titles_with_version_tags():
+    sources = [
+        src("A", "Something Else", 0),
+        src(None, "Golden Hour - 2011 Remaster", 1),
+        src(None, "Night Drive (feat. Guest)", 2),
+        src(None, "Unrelated", 3),
+    ]
+    candidates = [
+        cand("A", "Intro", 0),
+        cand(None, "Golden Hour", 1),
+        cand(None, "Night Drive", 2),
+    ]
+
+    assert matching.match_tracks(sources, candidates) == [0, 1, 2, None]
+
+
+def test_two_sources_never_claim_the_same_track():
+    # Same title twice on the album: the lengths settle who gets which.
+    sources = [src(None, "Interlude", 0, 60), src(None, "Interlude", 1, 200)]
+    candidates = [cand(None, "Interlude", 0, 200), cand(None, "Interlude", 1, 60)]
+
+    assert matching.match_tracks(sources, candidates) == [1, 0]
+
+
+def test_hungarian_matches_brute_force():
+    rng = random.Random(0)
+    for n, m in [(3, 3), (3, 5), (5, 6)]:
+        cost = [[rng.random() for _ in range(m)] for _ in range(n)]
+        best = min(
+            sum(cost[i][j] for i, j in enumerate(perm))
+            for perm in itertools.permutations(range(m), n)
+        )
+        assignment = matching._hungarian(cost)
+        assert len(set(assignment)) == n
+        assert abs(sum(cost[i][j] for i, j in enumerate(assignment)) - best) < 1e-9
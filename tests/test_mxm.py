@@ -0,0 +1,113 @@
+import asyncio
+import time
+
+import pytest
+from flask import Flask
+from flask_babel import Babel
+
+from mxm import MXM
+
+
+def sp_track(i):
+    return {
+        "isrc": f"ISRC{i}",
+        "image": None,
+        "track": {
+            "id": f"sp{i}",
+            "name": f"Song {i}",
+            "artists": [{"name": "Artist"}],
+            "album": {"name": "Album"},
+        },
+    }
+
+
+def mxm_track(i):
+    return {
+        "commontrack_id": i,
+        "track_name": f"Song {i}",
+        "album_id": 1,
+        "album_name": "Album",
+        "track_share_url": f"https://www.musixmatch.com/lyrics/{i}",
+    }
+
+
+@pytest.fixture(autouse=True)
+def app_context():
+    app = Flask(__name__)
+    Babel(app)
+    with app.app_context():
+        yield
+
+
+@pytest.mark.asyncio
+async def test_tracks_data_runs_both_lookups_per_track_concurrently(mocker):
+    async def track_links(self, data):
+        i = int(data["isrc"][4:])
+        await asyncio.sleep(0.05 if i == 0 else 0.01)
+        return mxm_track(i)
+
+    async def matcher_links(self, data):
+        await asyncio.sleep(0.01)
+        return mxm_track(int(data["isrc"][4:]))
+
+    mocker.patch.object(MXM, "Track_links", track_links)
+    mocker.patch.object(MXM, "matcher_links", matcher_links)
+    # Not an album Musixmatch knows, so every track is looked up
+    mocker.patch.object(MXM, "get_album_tracks_by_first_track", return_value=None)
+    mxm = MXM("key", session=object(), fanout=4)
+    sp_data = [sp_track(i) for i in range(4)]
+
+    start = time.perf_counter()
+    order = [i async for i, _ in mxm.iter_tracks_data(sp_data)]
+    elapsed = time.perf_counter() - start
+
+    # The slow first track doesn't hold back the others
+    assert order == [1, 2, 3, 0]
+    assert elapsed < 0.09
+
+    links = await mxm.Tracks_Data(sp_data)
+    assert [link["commontrack_id"] for link in links] == [0, 1, 2, 3]
+    assert links[0]["matcher_album"] == [1, "Album"]
+
+
+@pytest.mark.asyncio
+async def test_tracks_data_reports_failed_tracks_in_place(mocker):
+    async def track_links(self, data):
+        if data["isrc"] == "ISRC1":
+            raise RuntimeError("upstream broke")
+        return mxm_track(int(data["isrc"][4:]))
+
+    async def matcher_links(self, data):
+        return mxm_track(int(data["isrc"][4:]))
+
+    mocker.patch.object(MXM, "Track_links", track_links)
+    mocker.patch.object(MXM, "matcher_links", matcher_links)
+    mocker.patch.object(MXM, "get_album_tracks_by_first_track", return_value=None)
+
+    links = await MXM("key", session=object()).Tracks_Data(
+        [sp_track(i) for i in range(3)]
+    )
+
+    assert links[0]["commontrack_id"] == 0
+    assert links[1] == "upstream broke"
+    assert links[2]["commontrack_id"] == 2
+
+
+@pytest.mark.asyncio
+async def test_album_tracks_are_matched_once_and_the_rest_looked_up(mocker):
+    album = [{"track": {**mxm_track(i), "track_isrc": f"ISRC{i}"}} for i in range(2)]
+    looked_up = []
+
+    async def track_links(self, data):
+        looked_up.append(data["isrc"])
+        return mxm_track(9)
+
+    mocker.patch.object(MXM, "Track_links", track_links)
+    mocker.patch.object(MXM, "get_album_tracks_by_first_track", return_value=album)
+
+    links = await MXM("key", session=object()).Tracks_Data(
+        [sp_track(1), sp_track(0), sp_track(5)]
+    )
+
+    assert [link["commontrack_id"] for link in links] == [1, 0, 9]
+    assert looked_up == ["ISRC5"]
@@ -0,0 +1,45 @@
+import os
+
+import pytest
+from flask import Flask
+from flask_babel import Babel, force_locale
+
+import notes
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config["BABEL_TRANSLATION_DIRECTORIES"] = os.path.join(ROOT, "translations")
+    Babel(app)
+    with app.app_context():
+        yield app
+
+
+def test_one_cached_note_renders_in_every_locale(app):
+    note = notes.note(notes.MISSING_SPOTIFY_ID)
+
+    with force_locale("en"):
+        assert notes.localize(note) == "This track may missing its Spotify id"
+    with force_locale("id"):
+        assert notes.localize(note) == "Trek ini mungkin tidak memiliki ID Spotify"
+
+
+def test_note_parameters_are_filled_in_at_render(app):
+    note = notes.note(
+        notes.ISRC_ISSUE, track_url="https://mxm/t", artist_id=1, album_id=2
+    )
+
+    with force_locale("en"):
+        text = notes.localize(note)
+    assert 'href="https://mxm/t"' in text
+    assert "album/1/2" in text
+
+
+def test_other_values_pass_through(app):
+    track = {"track_name": "Song"}
+    assert notes.localize(track) is track
+    assert notes.localize("Error: 401") == "Error: 401"
+    assert notes.localize(notes.NOT_IMPORTED).startswith("The track hasn't")
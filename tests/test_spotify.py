@@ -1,88 +1,257 @@
-from unittest.mock import Mock, patch
+import asyncio
 
 import pytest
+from fakes import FakeResponse, FakeSession
 
-from spotify import Spotify
+from idgraph import IdGraph
+from spotify import API_URL, AsyncSpotify, DiscographyCache, SpotifyError
 
 
-@pytest.fixture
-def mock_spotipy():
-    with patch("spotify.spotipy.Spotify") as mock_sp_cls:
-        mock_sp_instance = Mock()
-        mock_sp_cls.return_value = mock_sp_instance
-        yield mock_sp_instance
+def discography(total):
+    albums = [
+        {
+            "id": f"a{n}",
+            "name": f"Album {n}",
+            "release_date": "2020",
+            "total_tracks": 10,
+        }
+        for n in range(total)
+    ]
+    # Listed twice (overlapping pages), and a clean edition of the first
+    albums.append(albums[0])
+    albums.append({**albums[0], "id": "a0-clean"})
 
+    def page(offset, limit):
+        end = offset + limit
+        return {
+            "items": albums[offset:end],
+            "total": len(albums),
+            "next": "more" if end < len(albums) else None,
+        }
 
-@pytest.fixture
-def spotify_client(mock_spotipy):
-    with patch("spotify.SpotifyClientCredentials"):
-        # Mock env vars to avoid Redis auth
-        with patch.dict(
-            "os.environ",
-            {"SPOTIPY_CLIENT_ID": "fake_id", "SPOTIPY_CLIENT_SECRET": "fake_secret"},
-        ):
-            return Spotify()
+    return page
 
 
-def test_get_isrc_single_track(spotify_client, mock_spotipy):
-    # Setup mock return for track
-    mock_track_data = {
+SHORT_LINK_TARGET = "https://open.spotify.com/track/" + "1" * 22 + "?si=x"
+
+
+def spotify_session(handler):
+    """Mints tokens, redirects HEADs and answers API calls with ``handler``."""
+
+    def answer(method, url, params=None, **kwargs):
+        if method == "POST":
+            return FakeResponse(200, {"access_token": f"token{tokens(session)}"})
+        if method == "HEAD":
+            return FakeResponse(200, url=SHORT_LINK_TARGET)
+        return handler(url.removeprefix(API_URL), params)
+
+    session = FakeSession(answer)
+    return session
+
+
+def tokens(session):
+    return sum(method == "POST" for method, _, _ in session.calls)
+
+
+def api_calls(session):
+    """``(path, params, Authorization)`` of the API requests made."""
+    return [
+        (url.removeprefix(API_URL), kw.get("params"), kw["headers"]["Authorization"])
+        for method, url, kw in session.calls
+        if method == "GET"
+    ]
+
+
+def async_client(handler):
+    session = spotify_session(handler)
+    client = AsyncSpotify("id", "secret", requests_session=lambda: session)
+    return client, session
+
+
+@pytest.mark.asyncio
+async def test_async_token_is_cached_across_calls():
+    track = {"id": "t1", "external_ids": {"isrc": "ISRC1"}, "album": {}}
+    client, session = async_client(lambda path, params: FakeResponse(200, track))
+
+    await asyncio.gather(*(client.get_isrc(f"/track/t{n}") for n in range(3)))
+    result = await client.get_isrc("https://open.spotify.com/track/t1")
+
+    assert result == [{"isrc": "ISRC1", "image": None, "track": track}]
+    assert tokens(session) == 1
+    assert {auth for _, _, auth in api_calls(session)} == {"Bearer token1"}
+
+
+@pytest.mark.asyncio
+async def test_get_isrc_single_track():
+    track = {
         "external_ids": {"isrc": "US1234567890"},
         "album": {"images": [{"url": "http://img.com/1"}, {"url": "http://img.com/2"}]},
         "name": "Test Track",
         "artists": [{"name": "Test Artist"}],
     }
-    mock_spotipy.track.return_value = mock_track_data
+    client, session = async_client(lambda path, params: FakeResponse(200, track))
+
+    result = await client.get_isrc("https://open.spotify.com/track/12345")
+
+    assert result == [
+        {"isrc": "US1234567890", "image": "http://img.com/2", "track": track}
+    ]
+    assert api_calls(session)[0][0] == "tracks/12345"
+
+
+@pytest.mark.asyncio
+async def test_get_isrc_missing_external_ids():
+    track = {"album": {"images": [{}, {"url": "img"}]}, "name": "No ISRC Track"}
+    client, _ = async_client(lambda path, params: FakeResponse(200, track))
+
+    assert await client.get_isrc("https://open.spotify.com/track/missing") == (
+        "Error in get_isrc"
+    )
+
 
-    # Call method
-    link = "https://open.spotify.com/track/12345"
-    result = spotify_client.get_isrc(link)
+@pytest.mark.asyncio
+async def test_get_tracks_only_fetches_unknown_ids(tmp_path):
+    t1 = {"id": "t1", "external_ids": {"isrc": "ISRC1"}}
+    t2 = {"id": "t2", "external_ids": {"isrc": "ISRC2"}}
+    by_id = {"t1": t1, "t2": t2}
+    client, session = async_client(
+        lambda path, params: FakeResponse(
+            200, {"tracks": [by_id[i] for i in params["ids"].split(",")]}
+        )
+    )
+    client.graph = IdGraph(str(tmp_path / "ids.sqlite3"))
 
-    assert len(result) == 1
-    assert result[0]["isrc"] == "US1234567890"
-    assert result[0]["image"] == "http://img.com/2"
-    assert result[0]["track"] == mock_track_data
+    assert await client.get_tracks(["t1"]) == [t1]
+    assert await client.get_tracks(["t1", "t2"]) == [t1, t2]
+    assert [params["ids"] for _, params, _ in api_calls(session)] == ["t1", "t2"]
+    assert client.graph.resolve("spotify", "t2", "isrc") == "ISRC2"
 
 
-def test_get_isrc_album(spotify_client, mock_spotipy):
-    # Setup mock return for album tracks and tracks
-    mock_album_tracks = {"items": [{"id": "t1"}, {"id": "t2"}]}
-    mock_spotipy.album_tracks.return_value = mock_album_tracks
+@pytest.mark.asyncio
+async def test_async_client_honours_retry_after(mocker):
+    sleep = mocker.patch("spotify.asyncio.sleep")
+    answers = [
+        FakeResponse(429, headers={"Retry-After": "2"}),
+        FakeResponse(200, {"tracks": {"items": []}}),
+    ]
+    client, session = async_client(lambda path, params: answers.pop(0))
 
-    mock_tracks_data = {
-        "tracks": [
+    assert await client.search_by_isrc("ISRC1") == ["No track found with this ISRC"]
+    assert len(api_calls(session)) == 2
+    sleep.assert_awaited_once_with(2.0)
+
+
+@pytest.mark.asyncio
+async def test_async_client_fails_fast_on_long_retry_after():
+    client, _ = async_client(
+        lambda path, params: FakeResponse(429, headers={"Retry-After": "3600"})
+    )
+
+    with pytest.raises(SpotifyError) as e:
+        await client.search_by_isrc("ISRC1")
+    assert e.value.status_code == 429
+
+
+@pytest.mark.asyncio
+async def test_async_album_pages_and_chunks():
+    ids = [f"t{n}" for n in range(120)]
+
+    def handler(path, params):
+        if path == "tracks":
+            chunk = params["ids"].split(",")
+            assert len(chunk) <= 50
+            tracks = [{"id": i, "external_ids": {"isrc": f"I-{i}"}} for i in chunk]
+            return FakeResponse(200, {"tracks": tracks})
+        offset = params.get("offset", 0)
+        end = offset + params["limit"]
+        return FakeResponse(
+            200,
             {
-                "id": "t1",
-                "external_ids": {"isrc": "ISRC1"},
-                "album": {"images": [{}, {"url": "img1"}]},
+                "items": [{"id": i} for i in ids[offset:end]],
+                "total": len(ids),
+                "next": "more" if end < len(ids) else None,
             },
+        )
+
+    client, session = async_client(handler)
+    result = await client.get_isrc("https://open.spotify.com/album/box")
+
+    assert [r["isrc"] for r in result] == [f"I-{i}" for i in ids]
+    assert [path for path, _, _ in api_calls(session)].count("tracks") == 3
+
+
+@pytest.mark.asyncio
+async def test_artist_albums_pages_concurrently_dedupes_and_caches():
+    page = discography(120)
+    in_flight = peak = 0
+
+    class Page(FakeResponse):
+        async def json(self):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return self._body
+
+    client, session = async_client(
+        lambda path, params: Page(200, page(params["offset"], params["limit"]))
+    )
+    client.discographies = DiscographyCache(ttl=60)
+
+    albums = await client.artist_albums("https://open.spotify.com/artist/prolific")
+    albums.append("mutated by the caller")
+    again = await client.artist_albums("prolific")
+
+    assert [a["id"] for a in again] == [f"a{n}" for n in range(120)] + ["a0-clean"]
+    assert len(api_calls(session)) == 3
+    assert {path for path, _, _ in api_calls(session)} == {"artists/prolific/albums"}
+    assert peak == 2
+
+
+@pytest.mark.asyncio
+async def test_concurrent_track_lookups_share_a_tracks_call():
+    def handler(path, params):
+        ids = params["ids"].split(",")
+        return FakeResponse(
+            200,
             {
-                "id": "t2",
-                "external_ids": {"isrc": "ISRC2"},
-                "album": {"images": [{}, {"url": "img2"}]},
+                "tracks": [
+                    None if i.startswith("0") else {"id": i, "external_ids": {}}
+                    for i in ids
+                ]
             },
-        ]
-    }
-    mock_spotipy.tracks.return_value = mock_tracks_data
+        )
 
-    link = "https://open.spotify.com/album/album123"
-    result = spotify_client.get_isrc(link)
+    session = spotify_session(handler)
+    client = AsyncSpotify(
+        "id", "secret", requests_session=lambda: session, batch_window=0.01
+    )
+    ids = [f"{n}" * 22 for n in range(1, 6)]
 
-    assert len(result) == 2
-    assert result[0]["isrc"] == "ISRC1"
-    assert result[1]["isrc"] == "ISRC2"
+    tracks = await asyncio.gather(*(client.get_track(track=i) for i in ids))
 
+    assert [t["id"] for t in tracks] == ids
+    assert [path for path, _, _ in api_calls(session)] == ["tracks"]
+    with pytest.raises(SpotifyError):
+        await client.get_track(track="0" * 22)
 
-def test_get_isrc_missing_external_ids(spotify_client, mock_spotipy):
-    mock_track_data = {
-        # No external_ids
-        "album": {"images": [{}, {"url": "img"}]},
-        "name": "No ISRC Track",
-    }
-    mock_spotipy.track.return_value = mock_track_data
 
-    link = "https://open.spotify.com/track/missing"
-    result = spotify_client.get_isrc(link)
+@pytest.mark.asyncio
+async def test_short_links_resolve_once_with_head(tmp_path):
+    track = {"id": "1" * 22, "external_ids": {"isrc": "ISRC1"}}
+    session = spotify_session(lambda path, params: FakeResponse(200, track))
+    client = AsyncSpotify(
+        "id",
+        "secret",
+        graph=IdGraph(str(tmp_path / "ids.sqlite3")),
+        requests_session=lambda: session,
+    )
 
-    # Based on code, it returns "Error in get_isrc" string
-    assert result == "Error in get_isrc"
+    for _ in range(2):
+        result = await client.get_isrc("https://spotify.link/AbC123?utm=share")
+
+    assert result[0]["isrc"] == "ISRC1"
+    assert [url for method, url, _ in session.calls if method == "HEAD"] == [
+        "https://spotify.link/AbC123?utm=share"
+    ]
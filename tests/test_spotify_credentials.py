@@ -0,0 +1,96 @@
+from unittest.mock import patch
+
+import pytest
+from fakes import FakeResponse, FakeSession
+
+from spotify import AsyncSpotify
+from spotify_credentials import CredentialRotation
+
+
+class FakeJSON:
+    def __init__(self, store):
+        self.store = store
+
+    def get(self, key, path):
+        doc = self.store.get(key)
+        return [doc] if doc else []
+
+    def set(self, key, path, value):
+        self.store["writes"] += 1
+        self.store[key]["rr"] = value
+
+
+class FakeRedis:
+    def __init__(self, store):
+        self.store = store
+        store["connections"] += 1
+
+    def json(self):
+        return FakeJSON(self.store)
+
+    def close(self):
+        pass
+
+
+def make_rotation(doc, sync_interval=300):
+    store = {"spotify": doc, "connections": 0, "writes": 0}
+    rotation = CredentialRotation(
+        sync_interval=sync_interval, redis_factory=lambda: FakeRedis(store)
+    )
+    return rotation, store
+
+
+def test_rotation_reads_redis_once():
+    rotation, store = make_rotation({"cred": [["a", "1"], ["b", "2"]], "rr": 1})
+
+    handed_out = [rotation.next() for _ in range(5)]
+
+    assert handed_out == [("b", "2"), ("a", "1"), ("b", "2"), ("a", "1"), ("b", "2")]
+    assert store["connections"] == 1
+    # The next worker starts on the other set
+    assert store["writes"] == 1
+    assert store["spotify"]["rr"] == 0
+
+
+def test_rotation_falls_back_to_env():
+    rotation, _ = make_rotation(None)
+
+    with patch.dict(
+        "os.environ", {"SPOTIPY_CLIENT_ID": "env", "SPOTIPY_CLIENT_SECRET": "s"}
+    ):
+        assert rotation.next() == ("env", "s")
+
+    rotation, _ = make_rotation(None)
+    with patch.dict("os.environ", {}, clear=True), pytest.raises(ValueError):
+        rotation.next()
+
+
+def token_session():
+    """Mints ``token-<client id>`` and answers searches with no tracks."""
+
+    def answer(method, url, auth=None, **kwargs):
+        if method == "POST":
+            return FakeResponse(200, {"access_token": f"token-{auth.login}"})
+        return FakeResponse(200, {"tracks": {"items": []}})
+
+    return FakeSession(answer)
+
+
+@pytest.mark.asyncio
+async def test_async_client_keeps_one_token_per_set():
+    rotation, store = make_rotation({"cred": [["a", "1"], ["b", "2"]], "rr": 0})
+    session = token_session()
+    with patch.dict("os.environ", {}, clear=True):
+        client = AsyncSpotify(requests_session=lambda: session, credentials=rotation)
+
+    for _ in range(4):
+        await client.search_by_isrc("ISRC1")
+
+    assert [kw["auth"].login for m, _, kw in session.calls if m == "POST"] == [
+        "a",
+        "b",
+    ]
+    assert [
+        kw["headers"]["Authorization"] for m, _, kw in session.calls if m == "GET"
+    ] == ["Bearer token-a", "Bearer token-b"] * 2
+    assert store["connections"] == 1